@@ -267,6 +267,12 @@ class ProviderNotFound(NotFound):
                 " not be found.")
 
 
+class ProtectionPluginConflict(KarborException):
+    message = _("Resource type %(resource_type)s is supported by both"
+                " protection plugins %(plugin_name)s and"
+                " %(other_plugin_name)s.")
+
+
 class CheckpointRecordNotFound(NotFound):
     message = _("CheckpointRecord %(id)s could not be found.")
 
@@ -291,6 +297,10 @@ class GetBackupFailed(KarborException):
                 " type=%(resource_type)s")
 
 
+class ImageNotReady(KarborException):
+    message = _("Image %(image_id)s is not ready: %(reason)s")
+
+
 class FlowError(KarborException):
     message = _("Flow: %(flow)s, Error: %(error)s")
 
@@ -316,6 +326,10 @@ class BankGetObjectFailed(KarborException):
     message = _("Get Object %(key)s in Bank Failed: %(reason)s")
 
 
+class BankObjectNotFound(BankGetObjectFailed):
+    message = _("Object %(key)s could not be found in Bank")
+
+
 class BankListObjectsFailed(KarborException):
     message = _("Get Object in Bank Failed: %(reason)s")
 
@@ -324,6 +338,10 @@ class BankReadonlyViolation(KarborException):
     message = _("Bank read-only violation")
 
 
+class BankObjectCorrupted(KarborException):
+    message = _("Object %(key)s in Bank is corrupted: %(reason)s")
+
+
 class AcquireLeaseFailed(KarborException):
     message = _("Acquire Lease in Failed: %(reason)s")
 
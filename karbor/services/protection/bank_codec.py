@@ -0,0 +1,117 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import zlib
+
+from eventlet import tpool
+from oslo_log import log as logging
+
+from karbor import exception
+from karbor.i18n import _, _LE
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+LOG = logging.getLogger(__name__)
+
+CODEC_NONE = "none"
+CODEC_ZLIB = "zlib"
+CODEC_LZMA = "lzma"
+
+
+class _PassThrough(object):
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class Codec(object):
+    """Encode and decode bank object contents.
+
+    Data is processed chunk by chunk, and the (de)compression of every chunk
+    runs in the eventlet thread pool, so several segments can be compressed
+    concurrently without blocking the green threads uploading them.
+    """
+    name = CODEC_NONE
+
+    def _encoder(self):
+        return _PassThrough()
+
+    def _decoder(self):
+        return _PassThrough()
+
+    def _process(self, processor, method, chunks):
+        for chunk in chunks:
+            if self.name == CODEC_NONE:
+                data = chunk
+            else:
+                data = tpool.execute(getattr(processor, method), chunk)
+            if data:
+                yield data
+        data = processor.flush() if hasattr(processor, 'flush') else b''
+        if data:
+            yield data
+
+    def encode_stream(self, chunks):
+        return self._process(self._encoder(), 'compress', chunks)
+
+    def decode_stream(self, chunks):
+        return self._process(self._decoder(), 'decompress', chunks)
+
+    def decode(self, data):
+        return b''.join(self.decode_stream(iter((data, ))))
+
+
+class ZlibCodec(Codec):
+    name = CODEC_ZLIB
+
+    def _encoder(self):
+        return zlib.compressobj()
+
+    def _decoder(self):
+        return zlib.decompressobj()
+
+
+class LzmaCodec(Codec):
+    name = CODEC_LZMA
+
+    def _encoder(self):
+        return lzma.LZMACompressor()
+
+    def _decoder(self):
+        return lzma.LZMADecompressor()
+
+
+_CODECS = {
+    CODEC_NONE: Codec,
+    CODEC_ZLIB: ZlibCodec,
+}
+if lzma is not None:
+    _CODECS[CODEC_LZMA] = LzmaCodec
+
+
+def get_codec(name=None):
+    """Return the codec registered under name, pass-through by default."""
+    name = name or CODEC_NONE
+    try:
+        return _CODECS[name]()
+    except KeyError:
+        LOG.error(_LE("Unsupported bank object codec: %s"), name)
+        raise exception.InvalidInput(
+            reason=_("Unsupported bank object codec: %s") % name)
@@ -11,15 +11,27 @@
 #    under the License.
 
 import abc
+import collections
+import copy
+import eventlet
+from eventlet import queue
+from eventlet import semaphore
+import hashlib
+import itertools
 import os
 import six
 
 from oslo_log import log as logging
 
 from karbor import exception
+from karbor.i18n import _, _LE, _LW
+from karbor.services.protection import bank_codec
 
 LOG = logging.getLogger(__name__)
 
+# the object metadata recording the codec of streamed objects
+_CODEC_METADATA = "codec"
+
 
 @six.add_metaclass(abc.ABCMeta)
 class LeasePlugin(object):
@@ -41,6 +53,11 @@ class LeasePlugin(object):
 
 @six.add_metaclass(abc.ABCMeta)
 class BankPlugin(object):
+    # the number of objects deleted concurrently by delete_objects
+    delete_concurrency = 8
+    # whether create_object_stream stores the metadata given to it
+    object_metadata_supported = False
+
     def __init__(self, config=None):
         self._config = config
 
@@ -58,7 +75,13 @@ class BankPlugin(object):
 
     @abc.abstractmethod
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
+                     sort_dir=None, end_marker=None):
+        """List the keys starting with prefix in lexicographic order.
+
+        Ascending listings return the first limit keys after marker and
+        before end_marker. Descending listings return the last limit keys
+        before marker and after end_marker.
+        """
         return
 
     @abc.abstractmethod
@@ -69,10 +92,362 @@ class BankPlugin(object):
     def get_owner_id(self):
         return
 
+    def delete_objects(self, keys):
+        """Delete several objects.
+
+        Bank plugins which support deleting many objects in a single request
+        should override this. The default implementation deletes the objects
+        concurrently and raises the first error once every deletion was
+        attempted.
+        """
+        errors = []
+
+        def delete_object(key):
+            try:
+                self.delete_object(key)
+            except Exception as err:
+                errors.append(err)
+
+        pool = eventlet.GreenPool(self.delete_concurrency)
+        for key in keys:
+            pool.spawn_n(delete_object, key)
+        pool.waitall()
+        if errors:
+            raise errors[0]
+
+    def create_object_stream(self, key, contents, metadata=None):
+        """Create an object from an iterable or a file-like object.
+
+        Bank plugins which are able to stream data to their backend should
+        override this. The default implementation buffers the whole value.
+        metadata is a dict of strings stored along with the object, it is
+        only given to plugins which set object_metadata_supported.
+        """
+        if hasattr(contents, 'read'):
+            value = contents.read()
+        elif six.PY2:
+            # str.join does not accept memoryview chunks on python 2
+            value = b''.join(chunk.tobytes()
+                             if isinstance(chunk, memoryview) else chunk
+                             for chunk in contents)
+        else:
+            value = b''.join(contents)
+        return self.create_object(key, value)
+
+    def get_object_etag(self, key):
+        """Return an opaque tag which changes whenever the object changes.
+
+        Used to revalidate cached objects without fetching them again. Bank
+        plugins which cannot provide one return None, in which case cached
+        objects are always fetched again once they expire.
+        """
+        return None
+
+    def get_object_info(self, key):
+        """Return the size in bytes and the metadata of an object.
+
+        Used to check objects without fetching them. Bank plugins which
+        cannot tell the size without reading the object return None.
+        """
+        return None, {}
+
+    def get_object_with_metadata(self, key):
+        """Return the value of an object and its metadata."""
+        return self.get_object(key), {}
+
+    def get_object_stream(self, key, chunk_size=None):
+        """Return an iterator over the raw contents of an object."""
+        return self.get_object_stream_with_metadata(
+            key, chunk_size=chunk_size)[0]
+
+    def get_object_stream_with_metadata(self, key, chunk_size=None):
+        """Return an iterator over the raw contents of an object and its
+        metadata.
+
+        Bank plugins which are able to stream data from their backend should
+        override this. The default implementation reads the whole value and
+        slices it into chunk_size sized buffers.
+        """
+        value, metadata = self.get_object_with_metadata(key)
+        if not chunk_size:
+            return iter((value, )), metadata
+        return (value[offset:offset + chunk_size]
+                for offset in range(0, len(value), chunk_size)), metadata
+
+
+class BankStreamReader(object):
+    """File-like reader over an iterator of data chunks.
+
+    Used to hand streamed bank objects to clients which expect a file-like
+    object, without joining the chunks into a single value.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        # chunks read ahead, the first one is consumed up to _offset
+        self._pending = collections.deque()
+        self._offset = 0
+        self._available = 0
+
+    def _drain_pending(self):
+        while self._pending:
+            chunk = self._pending.popleft()
+            yield chunk[self._offset:] if self._offset else chunk
+            self._offset = 0
+        self._available = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(itertools.chain(self._drain_pending(),
+                                            self._chunks))
+
+        while self._available < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            if len(chunk):
+                self._pending.append(chunk)
+                self._available += len(chunk)
+
+        parts = []
+        remaining = min(size, self._available)
+        self._available -= remaining
+        while remaining:
+            chunk = self._pending[0]
+            end = self._offset + remaining
+            if end < len(chunk):
+                parts.append(chunk[self._offset:end])
+                self._offset = end
+                break
+            parts.append(chunk[self._offset:] if self._offset else chunk)
+            remaining = end - len(chunk)
+            self._pending.popleft()
+            self._offset = 0
+        return b''.join(parts)
+
+    def __iter__(self):
+        for chunk in self._drain_pending():
+            yield chunk
+        for chunk in self._chunks:
+            yield chunk
+
+
+class BankSegmentWriter(object):
+    """Split a stream of data chunks into fixed size bank objects.
+
+    Incoming chunks are copied into reusable segment buffers and every full
+    segment is uploaded in a green thread while the next one is being filled,
+    so memory is bounded by segment_size * (max_in_flight + 1) no matter how
+    much data goes through the writer.
+    """
+    def __init__(self, section, prefix, segment_size, max_in_flight=1):
+        self._section = section
+        self._prefix = prefix
+        self._segment_size = segment_size
+        self._max_buffers = max_in_flight + 1
+        self._allocated = 0
+        self._free_buffers = queue.LightQueue()
+        self._pool = eventlet.GreenPool(max_in_flight)
+        self._errors = []
+        self._sizes = []
+        self._checksums = []
+
+    @property
+    def manifest(self):
+        """Describe the segments written so far.
+
+        The manifest is meant to be stored alongside the resource metadata
+        and lets BankSegmentReader fetch and verify segments by index.
+        """
+        return {
+            "prefix": self._prefix,
+            "count": len(self._sizes),
+            "sizes": list(self._sizes),
+            "checksums": list(self._checksums),
+        }
+
+    def _get_buffer(self):
+        if self._free_buffers.empty() and \
+                self._allocated < self._max_buffers:
+            self._allocated += 1
+            return bytearray(self._segment_size)
+        return self._free_buffers.get()
+
+    def _put_segment(self, index, buf, length):
+        try:
+            segment = memoryview(buf)[:length]
+            self._checksums[index] = hashlib.md5(segment).hexdigest()
+            self._section.create_object_stream(
+                "%s%d" % (self._prefix, index),
+                iter((segment, )))
+        except Exception as err:
+            self._errors.append(err)
+        finally:
+            self._free_buffers.put(buf)
+
+    def _flush(self, index, buf, length):
+        if self._errors:
+            raise self._errors[0]
+        self._sizes.append(length)
+        self._checksums.append(None)
+        self._pool.spawn_n(self._put_segment, index, buf, length)
+
+    def write(self, chunks):
+        """Write all chunks and return the number of segments created."""
+        index = 0
+        buf = self._get_buffer()
+        view = memoryview(buf)
+        filled = 0
+        try:
+            for chunk in chunks:
+                chunk = memoryview(chunk)
+                offset = 0
+                while offset < len(chunk):
+                    length = min(len(chunk) - offset,
+                                 self._segment_size - filled)
+                    view[filled:filled + length] = \
+                        chunk[offset:offset + length]
+                    filled += length
+                    offset += length
+                    if filled == self._segment_size:
+                        self._flush(index, buf, filled)
+                        index += 1
+                        buf = self._get_buffer()
+                        view = memoryview(buf)
+                        filled = 0
+            if filled > 0:
+                self._flush(index, buf, filled)
+                index += 1
+        finally:
+            self._pool.waitall()
+
+        if self._errors:
+            raise self._errors[0]
+        return index
+
+
+class BankSegmentReader(object):
+    """Iterate over the contents of bank objects in order.
+
+    Up to max_in_flight objects are fetched concurrently in green threads,
+    and their contents are yielded in the order of the given keys. When a
+    manifest written by BankSegmentWriter is given, every segment is checked
+    against the recorded size and checksum.
+    """
+    def __init__(self, section, keys, max_in_flight=1, manifest=None):
+        self._section = section
+        self._keys = keys
+        self._max_in_flight = max_in_flight
+        self._manifest = manifest
+
+    @classmethod
+    def from_manifest(cls, section, manifest, max_in_flight=1):
+        count = manifest.get("count")
+        if count is None or \
+                len(manifest.get("sizes", ())) != count or \
+                len(manifest.get("checksums", ())) != count:
+            raise exception.BankObjectCorrupted(
+                key=manifest.get("prefix"),
+                reason=_("incomplete segment manifest"))
+        keys = ["%s%d" % (manifest["prefix"], index)
+                for index in range(count)]
+        reader = cls(section, keys, max_in_flight, manifest)
+        reader._verify_segments()
+        return reader
+
+    @classmethod
+    def from_listing(cls, section, prefix, max_in_flight=1):
+        """Build a reader for segments which were stored without a manifest.
+
+        The keys are sorted by their numeric suffix, since the listing order
+        puts 'data_10' before 'data_2'.
+        """
+        keys = []
+        for key in section.list_objects():
+            name = key.split("/")[-1]
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                keys.append(name)
+        keys.sort(key=lambda name: int(name[len(prefix):]))
+        return cls(section, keys, max_in_flight)
+
+    def _verify_segment_size(self, index, key):
+        try:
+            size = self._section.get_object_size(key)
+        except exception.BankObjectNotFound:
+            raise exception.BankObjectCorrupted(
+                key=key, reason=_("missing segment"))
+        if size is not None and size != self._manifest["sizes"][index]:
+            raise exception.BankObjectCorrupted(
+                key=key, reason=_("unexpected segment size"))
+
+    def _verify_segments(self):
+        """Check that the segments of the manifest are stored in the bank.
+
+        Restores consume the segments as they are read, so missing or
+        truncated segments are detected before anything is restored.
+        """
+        pool = eventlet.GreenPool(self._max_in_flight)
+        list(pool.imap(self._verify_segment_size,
+                       range(len(self._keys)), self._keys))
+
+    def _get_segment(self, index, key):
+        data = self._section.get_object(key)
+        if self._manifest is not None:
+            if len(data) != self._manifest["sizes"][index]:
+                raise exception.BankObjectCorrupted(
+                    key=key, reason=_("unexpected segment size"))
+            if hashlib.md5(data).hexdigest() != \
+                    self._manifest["checksums"][index]:
+                raise exception.BankObjectCorrupted(
+                    key=key, reason=_("checksum mismatch"))
+        return data
+
+    def __iter__(self):
+        pool = eventlet.GreenPool(self._max_in_flight)
+        pending = collections.deque()
+        for index, key in enumerate(self._keys):
+            pending.append(pool.spawn(self._get_segment, index, key))
+            if len(pending) >= self._max_in_flight:
+                yield pending.popleft().wait()
+        while pending:
+            yield pending.popleft().wait()
+
 
 class Bank(object):
-    def __init__(self, plugin):
+    """Normalized access to the objects of a bank plugin.
+
+    With a positive write_behind_window, create_object and update_object
+    calls are queued instead of being sent to the plugin. Writes to the same
+    key within the window are coalesced into a single request carrying the
+    last value, and the queue is written back in the background once the
+    window elapses. Reads of a queued key are served from the queue, and
+    other operations on a queued key first write it back, so a key is never
+    observed out of order. flush() is a barrier returning once every queued
+    write is stored, and raising the first background write failure.
+
+    Streamed objects are encoded with the given codec, which is recorded in
+    the object metadata. Reads decode them with the recorded codec, so
+    objects stay readable when the codec is changed, whatever the plugin.
+    """
+    # the number of queued objects written back concurrently
+    write_behind_concurrency = 8
+    # the size of the reads from file-like objects which are encoded
+    encode_chunk_size = 65536
+
+    def __init__(self, plugin, write_behind_window=0, codec=None):
         self._plugin = plugin
+        self._write_behind_window = write_behind_window
+        self._codec = bank_codec.get_codec(codec)
+        if self._codec.name != bank_codec.CODEC_NONE and \
+                not plugin.object_metadata_supported:
+            LOG.warning(_LW("The bank plugin cannot store object metadata, "
+                            "objects are stored without the %s codec."),
+                        self._codec.name)
+            self._codec = bank_codec.get_codec(bank_codec.CODEC_NONE)
+        self._pending = collections.OrderedDict()
+        self._writing = {}
+        self._flusher = None
+        self._write_lock = semaphore.Semaphore()
+        self._write_errors = []
 
     def _normalize_key(self, key):
         """Normalizes the key
@@ -89,29 +464,176 @@ class Bank(object):
 
         return key
 
+    @property
+    def write_behind(self):
+        return self._write_behind_window > 0
+
+    def _queue_write(self, method, key, value):
+        # a later write replaces the queued value but keeps the position of
+        # the key, and a create stays a create
+        queued = self._pending.get(key)
+        if queued is not None and queued[0] == "create_object":
+            method = "create_object"
+        self._pending[key] = (method, value)
+        if self._flusher is None:
+            self._flusher = eventlet.spawn_after(self._write_behind_window,
+                                                 self._background_flush)
+
+    def _background_flush(self):
+        self._flusher = None
+        try:
+            self._write_back()
+        except Exception as err:
+            self._write_errors.append(err)
+
+    def _write_back(self, keys=None):
+        """Write the queued objects back to the plugin.
+
+        Batches are written one at a time, so at most one write per key is
+        ever in flight and the writes of a key are stored in order.
+        """
+        with self._write_lock:
+            if keys is None:
+                batch = self._pending
+                self._pending = collections.OrderedDict()
+            else:
+                batch = collections.OrderedDict(
+                    (key, self._pending.pop(key))
+                    for key in keys if key in self._pending)
+            if not batch:
+                return
+
+            self._writing = batch
+            errors = []
+
+            def write(key, method, value):
+                try:
+                    getattr(self._plugin, method)(key, value)
+                except Exception as err:
+                    LOG.error(_LE("write back of bank object %(key)s "
+                                  "failed, err: %(err)s."),
+                              {"key": key, "err": err})
+                    errors.append(err)
+
+            pool = eventlet.GreenPool(self.write_behind_concurrency)
+            for key, (method, value) in batch.items():
+                pool.spawn_n(write, key, method, value)
+            pool.waitall()
+            self._writing = {}
+            if errors:
+                raise errors[0]
+
+    def flush(self):
+        """Wait until all queued writes are stored in the bank."""
+        if not self.write_behind:
+            return
+        self._write_back()
+        if self._write_errors:
+            err = self._write_errors[0]
+            self._write_errors = []
+            raise err
+
     def create_object(self, key, value):
-        return self._plugin.create_object(self._normalize_key(key), value)
+        key = self._normalize_key(key)
+        if self.write_behind:
+            return self._queue_write("create_object", key, value)
+        return self._plugin.create_object(key, value)
 
     def update_object(self, key, value):
-        return self._plugin.update_object(self._normalize_key(key), value)
+        key = self._normalize_key(key)
+        if self.write_behind:
+            return self._queue_write("update_object", key, value)
+        return self._plugin.update_object(key, value)
 
     def get_object(self, key):
-        return self._plugin.get_object(self._normalize_key(key))
+        key = self._normalize_key(key)
+        queued = self._pending.get(key) or self._writing.get(key)
+        if queued is not None:
+            return copy.deepcopy(queued[1])
+        value, metadata = self._plugin.get_object_with_metadata(key)
+        codec = metadata.get(_CODEC_METADATA)
+        if codec is not None:
+            value = bank_codec.get_codec(codec).decode(value)
+        return value
+
+    def get_object_etag(self, key):
+        key = self._normalize_key(key)
+        self._write_back((key, ))
+        return self._plugin.get_object_etag(key)
+
+    def get_object_size(self, key):
+        """Return the size of an object, None when it cannot be told."""
+        key = self._normalize_key(key)
+        self._write_back((key, ))
+        size, metadata = self._plugin.get_object_info(key)
+        if metadata.get(_CODEC_METADATA) is not None:
+            # only the encoded size is known
+            return None
+        return size
+
+    def create_object_stream(self, key, contents):
+        key = self._normalize_key(key)
+        # drop the queued value after waiting for a write in flight
+        with self._write_lock:
+            self._pending.pop(key, None)
+        if self._codec.name == bank_codec.CODEC_NONE:
+            return self._plugin.create_object_stream(key, contents)
+        if hasattr(contents, 'read'):
+            contents = iter(lambda: contents.read(self.encode_chunk_size),
+                            b'')
+        return self._plugin.create_object_stream(
+            key, self._codec.encode_stream(contents),
+            metadata={_CODEC_METADATA: self._codec.name})
+
+    def get_object_stream(self, key, chunk_size=None):
+        key = self._normalize_key(key)
+        self._write_back((key, ))
+        return self._decode_stream(key, chunk_size)
+
+    def _decode_stream(self, key, chunk_size):
+        # the object is only requested once the stream is iterated
+        chunks, metadata = self._plugin.get_object_stream_with_metadata(
+            key, chunk_size=chunk_size)
+        codec = metadata.get(_CODEC_METADATA)
+        if codec is not None:
+            chunks = bank_codec.get_codec(codec).decode_stream(chunks)
+        for chunk in chunks:
+            yield chunk
 
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
+                     sort_dir=None, end_marker=None):
         if not prefix:
             prefix = "/"
 
+        if self._pending:
+            self._write_back()
         return self._plugin.list_objects(
             prefix=self._normalize_key(prefix) + "/",
             limit=limit,
             marker=marker,
-            sort_dir=sort_dir
+            sort_dir=sort_dir,
+            end_marker=end_marker
         )
 
+    def _write_back_for_delete(self, keys):
+        # a queued object may not have been created yet, store it so that
+        # deleting it behaves as if it was written synchronously
+        if any(key in self._pending for key in keys):
+            self._write_back(keys)
+        else:
+            # wait for the writes in flight
+            with self._write_lock:
+                pass
+
     def delete_object(self, key):
-        return self._plugin.delete_object(self._normalize_key(key))
+        key = self._normalize_key(key)
+        self._write_back_for_delete((key, ))
+        return self._plugin.delete_object(key)
+
+    def delete_objects(self, keys):
+        keys = [self._normalize_key(key) for key in keys]
+        self._write_back_for_delete(keys)
+        return self._plugin.delete_objects(keys)
 
     def get_sub_section(self, prefix, is_writable=True):
         return BankSection(self, prefix, is_writable)
@@ -190,8 +712,31 @@ class BankSection(object):
             self._prepend_prefix(key),
         )
 
+    def get_object_etag(self, key):
+        return self._bank.get_object_etag(
+            self._prepend_prefix(key),
+        )
+
+    def get_object_size(self, key):
+        return self._bank.get_object_size(
+            self._prepend_prefix(key),
+        )
+
+    def create_object_stream(self, key, contents):
+        self._validate_writable()
+        return self._bank.create_object_stream(
+            self._prepend_prefix(key),
+            contents,
+        )
+
+    def get_object_stream(self, key, chunk_size=None):
+        return self._bank.get_object_stream(
+            self._prepend_prefix(key),
+            chunk_size=chunk_size,
+        )
+
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
+                     sort_dir=None, end_marker=None):
         if not prefix:
             prefix = self._prefix
         else:
@@ -200,12 +745,16 @@ class BankSection(object):
         if marker is not None:
             marker = self._prepend_prefix(marker)
 
+        if end_marker is not None:
+            end_marker = self._prepend_prefix(end_marker)
+
         return [key[len(self._prefix) + 1:]
                 for key in self._bank.list_objects(
                     prefix,
                     limit,
                     marker,
-                    sort_dir
+                    sort_dir,
+                    end_marker
                     )
                 ]
 
@@ -215,6 +764,15 @@ class BankSection(object):
             self._prepend_prefix(key),
         )
 
+    def delete_objects(self, keys):
+        self._validate_writable()
+        return self._bank.delete_objects(
+            [self._prepend_prefix(key) for key in keys],
+        )
+
+    def flush(self):
+        return self._bank.flush()
+
     @property
     def bank(self):
         return self._bank
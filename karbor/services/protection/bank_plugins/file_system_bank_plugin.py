@@ -0,0 +1,329 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import errno
+import itertools
+import json
+import mmap
+import os
+import six
+import tempfile
+
+from karbor import exception
+from karbor.i18n import _, _LE
+from karbor.services.protection.bank_plugin import BankPlugin
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import uuidutils
+
+file_system_bank_plugin_opts = [
+    cfg.StrOpt('file_system_bank_path',
+               default='/var/lib/karbor/bank',
+               help='The directory in which the bank objects are stored.'),
+    cfg.IntOpt('file_system_bank_chunk_size',
+               default=65536,
+               help='The size in bytes of the buffers used when streaming '
+                    'objects to and from the file system.'),
+    cfg.IntOpt('file_system_bank_mmap_threshold',
+               default=1048576,
+               min=1,
+               help='Objects of at least this size in bytes are read '
+                    'through a memory map instead of being copied into '
+                    'memory.'),
+    cfg.BoolOpt('file_system_bank_sync_writes',
+                default=True,
+                help='Flush objects to stable storage before they are '
+                     'renamed into place.'),
+]
+
+LOG = logging.getLogger(__name__)
+
+_OBJECTS_DIR = "objects"
+_TMP_DIR = "tmp"
+# the metadata header line of an object file is never larger than this
+_MAX_HEADER_SIZE = 4096
+
+
+def _map_view(mapped, offset, size):
+    """Return a buffer over size bytes of mapped, without copying them."""
+    if six.PY2:
+        # memory maps only provide the old buffer interface on python 2
+        return buffer(mapped, offset, size)  # noqa
+    return memoryview(mapped)[offset:offset + size]
+
+
+class FileSystemBankPlugin(BankPlugin):
+    """Bank plugin storing objects in a local or shared directory tree.
+
+    Every bank key is mapped onto a file below the objects directory. The
+    file starts with a JSON metadata line telling how to decode the
+    contents, the counterpart of the x-object-meta-serialized header used
+    by swift, and the metadata of streamed objects. The contents follow as
+    they are. Keeping both in one file lets a single rename replace them
+    together.
+    """
+    object_metadata_supported = True
+
+    def __init__(self, config, context=None):
+        super(FileSystemBankPlugin, self).__init__(config)
+        self._config.register_opts(file_system_bank_plugin_opts,
+                                   "file_system_bank_plugin")
+        plugin_cfg = self._config.file_system_bank_plugin
+        self.bank_path = os.path.realpath(plugin_cfg.file_system_bank_path)
+        self.object_chunk_size = plugin_cfg.file_system_bank_chunk_size
+        self.mmap_threshold = plugin_cfg.file_system_bank_mmap_threshold
+        self.sync_writes = plugin_cfg.file_system_bank_sync_writes
+        self.context = context
+        self.owner_id = uuidutils.generate_uuid()
+
+        try:
+            for name in (_OBJECTS_DIR, _TMP_DIR):
+                self._makedirs(os.path.join(self.bank_path, name))
+        except OSError as err:
+            LOG.error(_LE("bank plugin create directory failed."))
+            raise exception.CreateContainerFailed(reason=err)
+
+    @staticmethod
+    def _makedirs(path):
+        try:
+            os.makedirs(path)
+        except OSError as err:
+            if err.errno != errno.EEXIST or not os.path.isdir(path):
+                raise
+
+    def _path(self, directory, key):
+        path = os.path.normpath(os.path.join(self.bank_path, directory,
+                                             key.lstrip("/")))
+        root = os.path.join(self.bank_path, directory)
+        if not path.startswith(root + os.sep):
+            raise exception.InvalidInput(
+                reason=_("Invalid bank object key: %s") % key)
+        return path
+
+    def get_owner_id(self):
+        return self.owner_id
+
+    def _write_file(self, path, chunks):
+        """Write chunks to path atomically using a temporary file."""
+        self._makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.bank_path, _TMP_DIR))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                if self.sync_writes:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _put_object(self, key, chunks, header=None):
+        line = json.dumps(header or {}).encode("utf-8") + b"\n"
+        self._write_file(self._path(_OBJECTS_DIR, key),
+                         itertools.chain((line, ), chunks))
+
+    def _put_value(self, key, value):
+        if isinstance(value, six.binary_type):
+            self._put_object(key, (value, ))
+        elif isinstance(value, six.text_type):
+            self._put_object(key, (value.encode("utf-8"), ),
+                             {"serialized": False})
+        else:
+            self._put_object(key, (json.dumps(value).encode("utf-8"), ),
+                             {"serialized": True})
+
+    def create_object(self, key, value):
+        try:
+            self._put_value(key, value)
+        except (OSError, IOError) as err:
+            LOG.error(_LE("create object failed, err: %s."), err)
+            raise exception.BankCreateObjectFailed(reason=err,
+                                                   key=key)
+
+    def update_object(self, key, value):
+        try:
+            self._put_value(key, value)
+        except (OSError, IOError) as err:
+            LOG.error(_LE("update object failed, err: %s."), err)
+            raise exception.BankUpdateObjectFailed(reason=err,
+                                                   key=key)
+
+    def create_object_stream(self, key, contents, metadata=None):
+        if hasattr(contents, 'read'):
+            contents = iter(lambda: contents.read(self.object_chunk_size),
+                            b'')
+        try:
+            self._put_object(key, contents,
+                             {"metadata": metadata} if metadata else None)
+        except (OSError, IOError) as err:
+            LOG.error(_LE("create object failed, err: %s."), err)
+            raise exception.BankCreateObjectFailed(reason=err,
+                                                   key=key)
+
+    @staticmethod
+    def _read_header(f):
+        """Read the metadata header line, leaving f at the contents."""
+        header = f.readline(_MAX_HEADER_SIZE)
+        if not header.endswith(b"\n"):
+            raise IOError(errno.EINVAL,
+                          _("Missing metadata header in %s") % f.name)
+        return json.loads(header.decode("utf-8"))
+
+    def _map_file(self, f):
+        """Return a read only memory map of f, or None for small files."""
+        size = os.fstat(f.fileno()).st_size
+        if size < self.mmap_threshold:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get_object(self, key):
+        return self.get_object_with_metadata(key)[0]
+
+    def get_object_with_metadata(self, key):
+        try:
+            with open(self._path(_OBJECTS_DIR, key), "rb") as f:
+                header = self._read_header(f)
+                mapped = None
+                if "serialized" not in header:
+                    mapped = self._map_file(f)
+                if mapped is None:
+                    body = f.read()
+                else:
+                    # large segments are returned without copying them, the
+                    # map stays valid after the file is closed
+                    body = _map_view(mapped, f.tell(),
+                                     len(mapped) - f.tell())
+        except (OSError, IOError) as err:
+            if err.errno == errno.ENOENT:
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("get object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+        if "serialized" in header:
+            body = body.decode("utf-8")
+            if header["serialized"]:
+                body = json.loads(body)
+        return body, header.get("metadata", {})
+
+    def get_object_etag(self, key):
+        try:
+            stat = os.stat(self._path(_OBJECTS_DIR, key))
+        except (OSError, IOError) as err:
+            if err.errno == errno.ENOENT:
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("get object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+        # objects are replaced by renaming a new file into place, so the
+        # inode changes on every write
+        return "%x-%x-%x" % (stat.st_ino, stat.st_size,
+                             int(stat.st_mtime * 1000000))
+
+    def get_object_info(self, key):
+        try:
+            with open(self._path(_OBJECTS_DIR, key), "rb") as f:
+                header = self._read_header(f)
+                return (os.fstat(f.fileno()).st_size - f.tell(),
+                        header.get("metadata", {}))
+        except (OSError, IOError) as err:
+            if err.errno == errno.ENOENT:
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("get object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+
+    def get_object_stream(self, key, chunk_size=None):
+        return self.get_object_stream_with_metadata(
+            key, chunk_size=chunk_size)[0]
+
+    def get_object_stream_with_metadata(self, key, chunk_size=None):
+        chunk_size = chunk_size or self.object_chunk_size
+        try:
+            f = open(self._path(_OBJECTS_DIR, key), "rb")
+        except (OSError, IOError) as err:
+            if err.errno == errno.ENOENT:
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("get object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+        try:
+            header = self._read_header(f)
+        except (OSError, IOError) as err:
+            f.close()
+            LOG.error(_LE("get object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+        return self._read_chunks(f, chunk_size), header.get("metadata", {})
+
+    def _read_chunks(self, f, chunk_size):
+        """Yield the contents of f from its current position."""
+        with f:
+            mapped = self._map_file(f)
+            if mapped is None:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    yield chunk
+                return
+            # large objects are streamed without copying them
+            for offset in range(f.tell(), len(mapped), chunk_size):
+                yield _map_view(mapped, offset, chunk_size)
+
+    def delete_object(self, key):
+        try:
+            os.remove(self._path(_OBJECTS_DIR, key))
+        except (OSError, IOError) as err:
+            LOG.error(_LE("delete object failed, err: %s."), err)
+            raise exception.BankDeleteObjectFailed(reason=err,
+                                                   key=key)
+
+    def _walk_keys(self, prefix):
+        """Return the sorted keys starting with prefix."""
+        root = os.path.join(self.bank_path, _OBJECTS_DIR)
+        prefix = prefix or ""
+        # only walk the deepest directory which can contain the prefix
+        start = os.path.join(root, os.path.dirname(prefix.lstrip("/")))
+        keys = []
+        for dirpath, _dirnames, filenames in os.walk(start):
+            relpath = os.path.relpath(dirpath, root)
+            for filename in filenames:
+                if relpath == os.curdir:
+                    key = "/" + filename
+                else:
+                    key = "/" + "/".join(relpath.split(os.sep) + [filename])
+                if key.startswith(prefix):
+                    keys.append(key)
+        keys.sort()
+        return keys
+
+    def list_objects(self, prefix=None, limit=None, marker=None,
+                     sort_dir=None, end_marker=None):
+        try:
+            keys = self._walk_keys(prefix)
+        except (OSError, IOError) as err:
+            LOG.error(_LE("list objects failed, err: %s."), err)
+            raise exception.BankListObjectsFailed(reason=err)
+
+        # same semantics as the swift bank plugin: ascending listings start
+        # after the marker, descending ones end before it and keep the last
+        # limit keys
+        if sort_dir == "desc":
+            marker, end_marker = end_marker, marker
+        if marker is not None:
+            keys = keys[bisect.bisect_right(keys, marker):]
+        if end_marker is not None:
+            keys = keys[:bisect.bisect_left(keys, end_marker)]
+        if limit is None:
+            return keys
+        return keys[-limit:] if sort_dir == "desc" else keys[:limit]
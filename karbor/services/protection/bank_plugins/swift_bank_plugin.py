@@ -10,12 +10,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+from eventlet import pools
 import json
 import math
 import time
 
 from karbor import exception
-from karbor.i18n import _, _LE
+from karbor.i18n import _, _LE, _LI, _LW
 from karbor.services.protection.bank_plugin import BankPlugin
 from karbor.services.protection.bank_plugin import LeasePlugin
 from karbor.services.protection import client_factory
@@ -23,16 +25,29 @@ from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_service import loopingcall
 from oslo_utils import uuidutils
+import six
+from six.moves.urllib.parse import quote
 from swiftclient import ClientException
 
 swift_bank_plugin_opts = [
     cfg.StrOpt('bank_swift_object_container',
                default='karbor',
                help='The default swift container to use.'),
+    cfg.IntOpt('bank_swift_object_chunk_size',
+               default=65536,
+               help='The size in bytes of the buffers used when streaming '
+                    'objects to and from swift.'),
+    cfg.IntOpt('bank_swift_connection_pool_size',
+               default=8,
+               help='The maximal number of connections to swift used '
+                    'concurrently by the bank.'),
 ]
 
 LOG = logging.getLogger(__name__)
 
+_METADATA_HEADER_PREFIX = "x-object-meta-"
+_SERIALIZED_HEADER = "x-object-meta-serialized"
+
 lease_opt = [cfg.IntOpt('lease_expire_window',
                         default=600,
                         help='expired_window for bank lease, in seconds'),
@@ -49,7 +64,58 @@ class SwiftConnectionFailed(exception.KarborException):
     message = _("Connection to swift failed: %(reason)s")
 
 
+class SwiftConnectionPool(pools.Pool):
+    """Bounded pool of swift connections.
+
+    Every connection keeps its HTTP session alive between requests. New
+    connections reuse the storage url and token of the connections created
+    before them instead of authenticating again, and connections which
+    failed at the transport level are closed and replaced on next use.
+    """
+    def __init__(self, create_connection, max_size):
+        self._create_connection = create_connection
+        self._auth = None
+        super(SwiftConnectionPool, self).__init__(max_size=max_size)
+
+    def create(self):
+        connection = self._create_connection()
+        if self._auth is not None and not getattr(connection, 'token', True):
+            connection.url, connection.token = self._auth
+        return connection
+
+    def get(self):
+        connection = super(SwiftConnectionPool, self).get()
+        if connection is None:
+            # the slot of an evicted connection
+            try:
+                connection = self.create()
+            except Exception:
+                self.put(None)
+                raise
+        return connection
+
+    @staticmethod
+    def is_usable_after(err):
+        """Whether a connection can be reused after it raised err."""
+        # swift answered the request, the connection itself is fine
+        return err.http_status is not None and err.http_status < 500
+
+    def release(self, connection, healthy=True):
+        if not healthy:
+            LOG.warning(_LW("Evicting broken swift connection."))
+            try:
+                connection.close()
+            except Exception:
+                pass
+            connection = None
+        elif getattr(connection, 'token', None):
+            self._auth = (connection.url, connection.token)
+        self.put(connection)
+
+
 class SwiftBankPlugin(BankPlugin, LeasePlugin):
+    object_metadata_supported = True
+
     def __init__(self, config, context=None):
         super(SwiftBankPlugin, self).__init__(config)
         self._config.register_opts(swift_bank_plugin_opts,
@@ -58,6 +124,8 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
                                    "swift_bank_plugin")
         self.bank_object_container = \
             self._config.swift_bank_plugin.bank_swift_object_container
+        self.object_chunk_size = \
+            self._config.swift_bank_plugin.bank_swift_object_chunk_size
         self.lease_expire_window = \
             self._config.swift_bank_plugin.lease_expire_window
         self.lease_renew_window = \
@@ -73,7 +141,10 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
         self.owner_id = uuidutils.generate_uuid()
         self.lease_expire_time = 0
         self.bank_leases_container = "leases"
-        self.connection = self._setup_connection()
+        self._bulk_delete_limit = None
+        self._connection_pool = SwiftConnectionPool(
+            self._setup_connection,
+            self._config.swift_bank_plugin.bank_swift_connection_pool_size)
 
         # create container
         try:
@@ -138,6 +209,45 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
             raise exception.BankUpdateObjectFailed(reason=err,
                                                    key=key)
 
+    def create_object_stream(self, key, contents, metadata=None):
+        headers = {'x-object-meta-serialized': str(False)}
+        for name, value in (metadata or {}).items():
+            headers[_METADATA_HEADER_PREFIX + name] = value
+        try:
+            self._put_object(container=self.bank_object_container,
+                             obj=key,
+                             contents=contents,
+                             headers=headers,
+                             chunk_size=self.object_chunk_size)
+        except SwiftConnectionFailed as err:
+            LOG.error(_LE("create object failed, err: %s."), err)
+            raise exception.BankCreateObjectFailed(reason=err,
+                                                   key=key)
+
+    def get_object_stream(self, key, chunk_size=None):
+        # nothing is requested until the stream is iterated
+        chunks, _metadata = self.get_object_stream_with_metadata(
+            key, chunk_size=chunk_size)
+        for chunk in chunks:
+            yield chunk
+
+    def get_object_stream_with_metadata(self, key, chunk_size=None):
+        try:
+            (resp, body) = self._get_object_stream(
+                container=self.bank_object_container,
+                obj=key,
+                chunk_size=chunk_size or self.object_chunk_size)
+        except SwiftConnectionFailed as err:
+            raise self._get_object_failed(key, err)
+        return self._read_body(key, body), self._get_metadata(resp)
+
+    def _read_body(self, key, body):
+        try:
+            for chunk in body:
+                yield chunk
+        except SwiftConnectionFailed as err:
+            raise self._get_object_failed(key, err)
+
     def delete_object(self, key):
         try:
             self._delete_object(container=self.bank_object_container,
@@ -147,28 +257,115 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
             raise exception.BankDeleteObjectFailed(reason=err,
                                                    key=key)
 
+    def delete_objects(self, keys):
+        keys = list(keys)
+        max_deletes = self._get_bulk_delete_limit()
+        if not max_deletes:
+            return super(SwiftBankPlugin, self).delete_objects(keys)
+        for offset in range(0, len(keys), max_deletes):
+            chunk = keys[offset:offset + max_deletes]
+            try:
+                errors = self._bulk_delete(self.bank_object_container, chunk)
+            except SwiftConnectionFailed as err:
+                LOG.error(_LE("bulk delete objects failed, err: %s."), err)
+                raise exception.BankDeleteObjectFailed(reason=err,
+                                                       key=chunk[0])
+            if errors:
+                name, status = errors[0]
+                LOG.error(_LE("bulk delete objects failed, %(name)s: "
+                              "%(status)s."), {"name": name,
+                                               "status": status})
+                raise exception.BankDeleteObjectFailed(reason=status,
+                                                       key=name)
+
+    def _get_bulk_delete_limit(self):
+        """Return how many objects swift deletes in a bulk request.
+
+        0 means that the bulk delete middleware is not available.
+        """
+        if self._bulk_delete_limit is None:
+            try:
+                with self._connection() as connection:
+                    capabilities = connection.get_capabilities()
+                bulk_delete = capabilities.get("bulk_delete") or {}
+                self._bulk_delete_limit = int(
+                    bulk_delete.get("max_deletes_per_request", 0))
+            except Exception as err:
+                LOG.info(_LI("swift bulk delete is not available: %s."),
+                         err)
+                self._bulk_delete_limit = 0
+        return self._bulk_delete_limit
+
     def get_object(self, key):
+        return self.get_object_with_metadata(key)[0]
+
+    def get_object_with_metadata(self, key):
+        try:
+            (resp, body) = self._get_object(
+                container=self.bank_object_container,
+                obj=key)
+        except SwiftConnectionFailed as err:
+            raise self._get_object_failed(key, err)
+        return body, self._get_metadata(resp)
+
+    def get_object_etag(self, key):
+        try:
+            headers = self._head_object(container=self.bank_object_container,
+                                        obj=key)
+            return headers.get("etag")
+        except SwiftConnectionFailed as err:
+            if self._is_not_found(err):
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("head object failed, err: %s."), err)
+            raise exception.BankGetObjectFailed(reason=err,
+                                                key=key)
+
+    def get_object_info(self, key):
         try:
-            return self._get_object(container=self.bank_object_container,
-                                    obj=key)
+            headers = self._head_object(container=self.bank_object_container,
+                                        obj=key)
         except SwiftConnectionFailed as err:
-            LOG.error(_LE("get object failed, err: %s."), err)
+            if self._is_not_found(err):
+                raise exception.BankObjectNotFound(key=key)
+            LOG.error(_LE("head object failed, err: %s."), err)
             raise exception.BankGetObjectFailed(reason=err,
                                                 key=key)
+        size = headers.get("content-length")
+        return (int(size) if size is not None else None,
+                self._get_metadata(headers))
+
+    @staticmethod
+    def _get_metadata(headers):
+        """Return the object metadata stored by create_object_stream."""
+        return dict((name[len(_METADATA_HEADER_PREFIX):], value)
+                    for name, value in headers.items()
+                    if name.startswith(_METADATA_HEADER_PREFIX) and
+                    name != _SERIALIZED_HEADER)
+
+    def _get_object_failed(self, key, err):
+        if self._is_not_found(err):
+            return exception.BankObjectNotFound(key=key)
+        LOG.error(_LE("get object failed, err: %s."), err)
+        return exception.BankGetObjectFailed(reason=err, key=key)
+
+    @staticmethod
+    def _is_not_found(err):
+        return getattr(err.kwargs.get("reason"), "http_status", None) == 404
 
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
+                     sort_dir=None, end_marker=None):
         try:
             if sort_dir == "desc":
                 body = self._get_container(
                     container=self.bank_object_container,
-                    prefix=prefix, end_marker=marker)
+                    prefix=prefix, marker=end_marker, end_marker=marker)
                 limit_objects = body[-limit:] if limit is not None else body
                 return [obj.get("name") for obj in limit_objects]
             else:
                 body = self._get_container(
                     container=self.bank_object_container,
-                    prefix=prefix, limit=limit, marker=marker)
+                    prefix=prefix, limit=limit, marker=marker,
+                    end_marker=end_marker)
                 return [obj.get("name") for obj in body]
         except SwiftConnectionFailed as err:
             LOG.error(_LE("list objects failed, err: %s."), err)
@@ -210,55 +407,138 @@ class SwiftBankPlugin(BankPlugin, LeasePlugin):
         else:
             return False
 
-    def _put_object(self, container, obj, contents, headers=None):
+    @contextlib.contextmanager
+    def _connection(self):
+        connection = self._connection_pool.get()
+        healthy = False
         try:
-            self.connection.put_object(container=container,
-                                       obj=obj,
-                                       contents=contents,
-                                       headers=headers)
+            yield connection
+            healthy = True
+        except ClientException as err:
+            healthy = self._connection_pool.is_usable_after(err)
+            raise
+        finally:
+            self._connection_pool.release(connection, healthy)
+
+    def _put_object(self, container, obj, contents, headers=None,
+                    chunk_size=None):
+        try:
+            with self._connection() as connection:
+                connection.put_object(container=container,
+                                      obj=obj,
+                                      contents=contents,
+                                      headers=headers,
+                                      chunk_size=chunk_size)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
     def _get_object(self, container, obj):
         try:
-            (_resp, body) = self.connection.get_object(container=container,
-                                                       obj=obj)
-            if _resp.get("x-object-meta-serialized").lower() == "true":
+            with self._connection() as connection:
+                (resp, body) = connection.get_object(container=container,
+                                                     obj=obj)
+            if resp.get(_SERIALIZED_HEADER).lower() == "true":
                 body = json.loads(body)
-            return body
+            return resp, body
+        except ClientException as err:
+            raise SwiftConnectionFailed(reason=err)
+
+    def _get_object_stream(self, container, obj, chunk_size):
+        # the connection stays checked out until the body is read
+        connection = self._connection_pool.get()
+        try:
+            (resp, body) = connection.get_object(
+                container=container,
+                obj=obj,
+                resp_chunk_size=chunk_size)
+        except ClientException as err:
+            self._connection_pool.release(
+                connection, self._connection_pool.is_usable_after(err))
+            raise SwiftConnectionFailed(reason=err)
+        except Exception:
+            self._connection_pool.release(connection, False)
+            raise
+        return resp, self._read_stream(connection, body)
+
+    def _read_stream(self, connection, body):
+        healthy = False
+        try:
+            for chunk in body:
+                yield chunk
+            healthy = True
+        except ClientException as err:
+            raise SwiftConnectionFailed(reason=err)
+        finally:
+            # a partially read response leaves the connection unusable
+            self._connection_pool.release(connection, healthy)
+
+    def _head_object(self, container, obj):
+        try:
+            with self._connection() as connection:
+                return connection.head_object(container=container,
+                                              obj=obj)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
     def _post_object(self, container, obj, headers):
         try:
-            self.connection.post_object(container=container,
-                                        obj=obj,
-                                        headers=headers)
+            with self._connection() as connection:
+                connection.post_object(container=container,
+                                       obj=obj,
+                                       headers=headers)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
     def _delete_object(self, container, obj):
         try:
-            self.connection.delete_object(container=container,
-                                          obj=obj)
+            with self._connection() as connection:
+                connection.delete_object(container=container,
+                                         obj=obj)
+        except ClientException as err:
+            raise SwiftConnectionFailed(reason=err)
+
+    def _bulk_delete(self, container, objs):
+        """Delete objs with one request, return the failed deletions."""
+        body = "\n".join(
+            quote(("/%s/%s" % (container, obj)).encode("utf-8"))
+            for obj in objs)
+        try:
+            with self._connection() as connection:
+                (_resp, result) = connection.post_account(
+                    headers={"Content-Type": "text/plain",
+                             "Accept": "application/json"},
+                    query_string="bulk-delete",
+                    data=body)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
+        if isinstance(result, six.binary_type):
+            result = result.decode("utf-8")
+        result = json.loads(result)
+        # objects which are already gone were deleted as far as we care
+        errors = [(name, status) for name, status in result.get("Errors", [])
+                  if not status.startswith("404")]
+        status = result.get("Response Status", "200 OK")
+        if not errors and not status.startswith("200"):
+            errors = [(objs[0], status)]
+        return errors
 
     def _put_container(self, container):
         try:
-            self.connection.put_container(container=container)
+            with self._connection() as connection:
+                connection.put_container(container=container)
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
 
     def _get_container(self, container, prefix=None, limit=None, marker=None,
                        end_marker=None):
         try:
-            (_resp, body) = self.connection.get_container(
-                container=container,
-                prefix=prefix,
-                limit=limit,
-                marker=marker,
-                end_marker=end_marker)
+            with self._connection() as connection:
+                (_resp, body) = connection.get_container(
+                    container=container,
+                    prefix=prefix,
+                    limit=limit,
+                    marker=marker,
+                    end_marker=end_marker)
             return body
         except ClientException as err:
             raise SwiftConnectionFailed(reason=err)
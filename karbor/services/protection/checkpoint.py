@@ -10,7 +10,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from datetime import datetime
+import calendar
+import collections
+import copy
+from datetime import timedelta
+import time
+
 from karbor.common import constants
 from karbor import exception
 from karbor.i18n import _, _LE
@@ -20,33 +25,112 @@ from oslo_log import log as logging
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
+checkpoint_opts = [
+    cfg.IntOpt('checkpoint_index_cache_size',
+               default=1024,
+               help='The number of checkpoint index documents cached by '
+                    'every provider, 0 disables the cache'),
+    cfg.IntOpt('checkpoint_index_cache_ttl',
+               default=30,
+               help='The number of seconds a cached checkpoint index '
+                    'document is used before it is revalidated against '
+                    'the bank'),
+    cfg.IntOpt('checkpoint_list_page_size',
+               default=1000,
+               help='The maximal number of index keys listed from the bank '
+                    'in a single request when listing checkpoints'),
+]
+
 CONF = cfg.CONF
+CONF.register_opts(checkpoint_opts)
 
 LOG = logging.getLogger(__name__)
 
 _INDEX_FILE_NAME = "index.json"
+_RESOURCE_GRAPH_FILE_NAME = "resource_graph"
 _UUID_STR_LEN = 36
 
+_CacheEntry = collections.namedtuple(
+    "_CacheEntry", ["metadata", "etag", "fetched_at"])
+
+
+class CheckpointIndexCache(object):
+    """LRU cache of checkpoint index documents.
+
+    Cached documents are served without touching the bank for ttl seconds.
+    Afterwards they are revalidated by comparing the etag of the index
+    object in the bank, and fetched again only if it changed. Checkpoints
+    write through the cache when they commit or purge their index.
+    """
+    def __init__(self, size=None, ttl=None):
+        self._size = CONF.checkpoint_index_cache_size if size is None \
+            else size
+        self._ttl = CONF.checkpoint_index_cache_ttl if ttl is None else ttl
+        self._entries = collections.OrderedDict()
+
+    def _store(self, checkpoint_id, metadata, etag):
+        self._entries.pop(checkpoint_id, None)
+        self._entries[checkpoint_id] = _CacheEntry(
+            copy.deepcopy(metadata), etag, time.time())
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def get(self, checkpoint_section, checkpoint_id, revalidate=False):
+        entry = self._entries.pop(checkpoint_id, None)
+        if entry is not None:
+            # keep the entry at the most recently used end
+            self._entries[checkpoint_id] = entry
+            if not revalidate and time.time() - entry.fetched_at < self._ttl:
+                return copy.deepcopy(entry.metadata)
+
+        # read the etag before the object, a concurrent update then only
+        # causes an extra fetch on the next revalidation
+        etag = checkpoint_section.get_object_etag(_INDEX_FILE_NAME)
+        if entry is not None and etag is not None and etag == entry.etag:
+            self._store(checkpoint_id, entry.metadata, etag)
+            return copy.deepcopy(entry.metadata)
+
+        metadata = checkpoint_section.get_object(_INDEX_FILE_NAME)
+        self._store(checkpoint_id, metadata, etag)
+        return metadata
+
+    def put(self, checkpoint_id, metadata):
+        self._store(checkpoint_id, metadata, None)
+
+    def invalidate(self, checkpoint_id):
+        self._entries.pop(checkpoint_id, None)
+
 
 class Checkpoint(object):
     VERSION = "0.9"
     SUPPORTED_VERSIONS = ["0.9"]
 
     def __init__(self, checkpoint_section, indices_section,
-                 bank_lease, checkpoint_id):
+                 bank_lease, checkpoint_id, index_cache=None):
         self._id = checkpoint_id
         self._checkpoint_section = checkpoint_section
         self._indices_section = indices_section
         self._bank_lease = bank_lease
-        self.reload_meta_data()
-
-    def to_dict(self):
+        self._index_cache = index_cache
+        self._resource_graph = None
+        self._resource_graph_loaded = False
+        self._resource_graph_dirty = False
+        self._load_meta_data(revalidate=False)
+
+    def to_dict(self, include_resource_graph=True):
+        """Return the checkpoint as a dictionary.
+
+        The resource graph is kept out of the index document and is only
+        read from the bank when include_resource_graph is set, so listing
+        checkpoints needs a single small read per checkpoint.
+        """
         return {
             "id": self.id,
             "status": self.status,
             "protection_plan": self.protection_plan,
             "project_id": self.project_id,
-            "resource_graph": self._md_cache.get("resource_graph", None),
+            "resource_graph": self._get_serialized_resource_graph()
+            if include_resource_graph else None,
             "created_at": self._md_cache.get("created_at", None)
         }
 
@@ -80,13 +164,37 @@ class Checkpoint(object):
         # TODO(yinwei): check for valid values and transitions
         return self._md_cache["owner_id"]
 
+    def _load_resource_graph(self):
+        """Deserialize the resource graph once and keep it."""
+        if not self._resource_graph_loaded:
+            # checkpoints created by older versions keep the graph in the
+            # index document
+            serialized_resource_graph = self._md_cache.get("resource_graph")
+            if serialized_resource_graph is not None:
+                resource_graph = graph.deserialize_resource_graph(
+                    serialized_resource_graph)
+            else:
+                try:
+                    resource_graph = graph.decode_resource_graph(
+                        self._checkpoint_section.get_object_stream(
+                            _RESOURCE_GRAPH_FILE_NAME))
+                except exception.BankObjectNotFound:
+                    resource_graph = None
+            self._resource_graph = resource_graph
+            self._resource_graph_loaded = True
+        return self._resource_graph
+
+    def _get_serialized_resource_graph(self):
+        resource_graph = self._load_resource_graph()
+        if resource_graph is None:
+            return None
+        return graph.serialize_resource_graph(resource_graph)
+
     @property
     def resource_graph(self):
-        serialized_resource_graph = self._md_cache.get("resource_graph", None)
-        if serialized_resource_graph is not None:
-            resource_graph = graph.deserialize_resource_graph(
-                serialized_resource_graph)
-            return resource_graph
+        resource_graph = self._load_resource_graph()
+        if resource_graph is not None:
+            return list(resource_graph)
         else:
             return None
 
@@ -100,9 +208,10 @@ class Checkpoint(object):
 
     @resource_graph.setter
     def resource_graph(self, resource_graph):
-        serialized_resource_graph = graph.serialize_resource_graph(
-            resource_graph)
-        self._md_cache["resource_graph"] = serialized_resource_graph
+        self._md_cache.pop("resource_graph", None)
+        self._resource_graph = list(resource_graph)
+        self._resource_graph_loaded = True
+        self._resource_graph_dirty = True
 
     def _is_supported_version(self, version):
         return version in self.SUPPORTED_VERSIONS
@@ -116,9 +225,19 @@ class Checkpoint(object):
                 _("Checkpoint was created in an unsupported version"))
 
     def reload_meta_data(self):
+        self._load_meta_data(revalidate=True)
+
+    def _load_meta_data(self, revalidate):
         try:
-            new_md = self._checkpoint_section.get_object(_INDEX_FILE_NAME)
+            if self._index_cache is None:
+                new_md = self._checkpoint_section.get_object(_INDEX_FILE_NAME)
+            else:
+                new_md = self._index_cache.get(self._checkpoint_section,
+                                               self.id,
+                                               revalidate=revalidate)
         except exception.BankGetObjectFailed:
+            if self._index_cache is not None:
+                self._index_cache.invalidate(self.id)
             LOG.error(_LE("unable to reload metadata for checkpoint id: %s"),
                       self.id)
             raise exception.CheckpointNotFound(checkpoint_id=self.id)
@@ -131,40 +250,44 @@ class Checkpoint(object):
 
     @classmethod
     def get_by_section(cls, checkpoints_section, indices_section,
-                       bank_lease, checkpoint_id):
+                       bank_lease, checkpoint_id, index_cache=None):
         # TODO(yuvalbr) add validation that the checkpoint exists
         checkpoint_section = checkpoints_section.get_sub_section(checkpoint_id)
         return Checkpoint(checkpoint_section, indices_section,
-                          bank_lease, checkpoint_id)
+                          bank_lease, checkpoint_id, index_cache)
 
     @classmethod
     def create_in_section(cls, checkpoints_section, indices_section,
-                          bank_lease, owner_id, plan, checkpoint_id=None):
+                          bank_lease, owner_id, plan, checkpoint_id=None,
+                          index_cache=None):
         checkpoint_id = checkpoint_id or cls._generate_id()
         checkpoint_section = checkpoints_section.get_sub_section(checkpoint_id)
 
         timestamp = timeutils.utcnow_ts()
         created_at = timeutils.utcnow().strftime('%Y-%m-%d')
 
+        md = {
+            "version": cls.VERSION,
+            "id": checkpoint_id,
+            "status": "protecting",
+            "owner_id": owner_id,
+            "provider_id": plan.get("provider_id"),
+            "project_id": plan.get("project_id"),
+            "protection_plan": {
+                "id": plan.get("id"),
+                "name": plan.get("name"),
+                "provider_id": plan.get("provider_id"),
+                "resources": plan.get("resources")
+            },
+            "created_at": created_at,
+            "timestamp": timestamp
+        }
         checkpoint_section.create_object(
             key=_INDEX_FILE_NAME,
-            value={
-                "version": cls.VERSION,
-                "id": checkpoint_id,
-                "status": "protecting",
-                "owner_id": owner_id,
-                "provider_id": plan.get("provider_id"),
-                "project_id": plan.get("project_id"),
-                "protection_plan": {
-                    "id": plan.get("id"),
-                    "name": plan.get("name"),
-                    "provider_id": plan.get("provider_id"),
-                    "resources": plan.get("resources")
-                },
-                "created_at": created_at,
-                "timestamp": timestamp
-            }
+            value=md
         )
+        if index_cache is not None:
+            index_cache.put(checkpoint_id, md)
 
         indices_section.create_object(
             key="/by-provider/%s@%s" % (timestamp, checkpoint_id),
@@ -184,34 +307,40 @@ class Checkpoint(object):
         return Checkpoint(checkpoint_section,
                           indices_section,
                           bank_lease,
-                          checkpoint_id)
+                          checkpoint_id,
+                          index_cache)
 
     def commit(self):
+        if self._resource_graph_dirty:
+            self._checkpoint_section.create_object_stream(
+                _RESOURCE_GRAPH_FILE_NAME,
+                iter((graph.encode_resource_graph(self._resource_graph), )),
+            )
+            self._resource_graph_dirty = False
         self._checkpoint_section.create_object(
             key=_INDEX_FILE_NAME,
             value=self._md_cache,
         )
+        if self._index_cache is not None:
+            self._index_cache.put(self.id, self._md_cache)
 
     def purge(self):
         """Purge the index file of the checkpoint.
 
         Can only be done if the checkpoint has no other files apart from the
-        index.
+        index and the resource graph.
         """
-        all_objects = self._checkpoint_section.list_objects()
-        if len(all_objects) == 1 and all_objects[0] == _INDEX_FILE_NAME:
-            created_at = self._md_cache["created_at"]
-            timestamp = self._md_cache["timestamp"]
-            plan_id = self._md_cache["protection_plan"]["id"]
-            self._indices_section.delete_object(
-                "/by-provider/%s@%s" % (timestamp, self.id))
-            self._indices_section.delete_object(
-                "/by-date/%s/%s@%s" % (created_at, timestamp, self.id))
-            self._indices_section.delete_object(
-                "/by-plan/%s/%s/%s@%s" % (
-                    plan_id, created_at, timestamp, self.id))
-
-            self._checkpoint_section.delete_object(_INDEX_FILE_NAME)
+        all_objects = set(self._checkpoint_section.list_objects())
+        has_resource_graph = _RESOURCE_GRAPH_FILE_NAME in all_objects
+        all_objects.discard(_RESOURCE_GRAPH_FILE_NAME)
+        if all_objects == {_INDEX_FILE_NAME}:
+            self._indices_section.delete_objects(self._index_keys())
+            keys = [_INDEX_FILE_NAME]
+            if has_resource_graph:
+                keys.insert(0, _RESOURCE_GRAPH_FILE_NAME)
+            self._checkpoint_section.delete_objects(keys)
+            if self._index_cache is not None:
+                self._index_cache.invalidate(self.id)
         else:
             raise RuntimeError(_("Could not delete: Checkpoint is not empty"))
 
@@ -219,16 +348,20 @@ class Checkpoint(object):
         self.status = constants.CHECKPOINT_STATUS_DELETED
         self.commit()
         # delete indices
+        self._indices_section.delete_objects(self._index_keys())
+
+    def _index_keys(self):
         created_at = self._md_cache["created_at"]
         timestamp = self._md_cache["timestamp"]
         plan_id = self._md_cache["protection_plan"]["id"]
-        self._indices_section.delete_object(
-            "/by-provider/%s@%s" % (timestamp, self.id))
-        self._indices_section.delete_object(
-            "/by-date/%s/%s@%s" % (created_at, timestamp, self.id))
-        self._indices_section.delete_object(
-            "/by-plan/%s/%s/%s@%s" % (
-                plan_id, created_at, timestamp, self.id))
+        return ["/by-provider/%s@%s" % (timestamp, self.id),
+                "/by-date/%s/%s@%s" % (created_at, timestamp, self.id),
+                "/by-plan/%s/%s/%s@%s" % (
+                    plan_id, created_at, timestamp, self.id)]
+
+    def flush(self):
+        """Wait until the queued bank writes are stored."""
+        self._checkpoint_section.flush()
 
     def get_resource_bank_section(self, resource_id):
         prefix = "/resource-data/%s/" % resource_id
@@ -243,6 +376,9 @@ class CheckpointCollection(object):
         self._bank_lease = bank_lease
         self._checkpoints_section = bank.get_sub_section("/checkpoints")
         self._indices_section = bank.get_sub_section("/indices")
+        self._index_cache = None
+        if CONF.checkpoint_index_cache_size > 0:
+            self._index_cache = CheckpointIndexCache()
 
     def list_ids(self, limit=None, marker=None, plan_id=None, start_date=None,
                  end_date=None, sort_dir=None):
@@ -250,7 +386,12 @@ class CheckpointCollection(object):
         if marker is not None:
             checkpoint_section = self._checkpoints_section.get_sub_section(
                 marker)
-            marker_checkpoint = checkpoint_section.get_object(_INDEX_FILE_NAME)
+            if self._index_cache is not None:
+                marker_checkpoint = self._index_cache.get(checkpoint_section,
+                                                          marker)
+            else:
+                marker_checkpoint = checkpoint_section.get_object(
+                    _INDEX_FILE_NAME)
             timestamp = marker_checkpoint["timestamp"]
             marker = "%s@%s" % (timestamp, marker)
 
@@ -261,7 +402,7 @@ class CheckpointCollection(object):
         if plan_id is None and start_date is None:
             prefix = "/by-provider/"
             if marker is not None:
-                marker = "/%s" % marker
+                marker = "/by-provider/%s" % marker
         elif plan_id is not None:
             prefix = "/by-plan/%s/" % plan_id
             if marker is not None:
@@ -273,36 +414,91 @@ class CheckpointCollection(object):
                 date = marker_checkpoint["created_at"]
                 marker = "/by-date/%s/%s" % (date, marker)
 
-        return self._list_ids(prefix, limit, marker, start_date, end_date,
-                              sort_dir)
-
-    def _list_ids(self, prefix, limit, marker, start_date, end_date, sort_dir):
-        if start_date is None:
-            return [key[key.find("@") + 1:]
-                    for key in self._indices_section.list_objects(
-                    prefix=prefix,
-                    limit=limit,
-                    marker=marker,
-                    sort_dir=sort_dir
-                    )]
-        else:
-            ids = []
-            for key in self._indices_section.list_objects(prefix=prefix,
-                                                          marker=marker,
-                                                          sort_dir=sort_dir):
-                date = datetime.strptime(key.split("/")[-2], "%Y-%m-%d")
-                if start_date <= date <= end_date:
-                    ids.append(key[key.find("@") + 1:])
-                if limit is not None and len(ids) == limit:
-                    return ids
-            return ids
+        # the date indices are sorted by date, so a date range is a key range
+        # bounded by the first day and the day after the last one
+        lower = upper = key_filter = None
+        if start_date is not None and prefix != "/by-provider/":
+            lower = prefix + start_date.strftime("%Y-%m-%d")
+            upper = prefix + (end_date + timedelta(days=1)).strftime(
+                "%Y-%m-%d")
+            key_filter = self._start_date_filter(start_date)
+
+        if marker is not None:
+            if sort_dir == "desc":
+                upper = marker if upper is None else min(upper, marker)
+            else:
+                lower = marker if lower is None else max(lower, marker)
+
+        keys = self._iter_keys(prefix, limit, lower, upper, sort_dir,
+                               key_filter)
+        return [key[key.find("@") + 1:] for key in keys]
+
+    @staticmethod
+    def _start_date_filter(start_date):
+        """Return a filter dropping keys created before start_date.
+
+        The key range begins with the whole day of start_date, so when it
+        has a time part the keys of that day are checked by their timestamp.
+        """
+        start_ts = calendar.timegm(start_date.timetuple())
+        if start_ts == calendar.timegm(start_date.date().timetuple()):
+            return None
+        first_day = start_date.strftime("%Y-%m-%d")
+
+        def key_filter(key):
+            date, name = key.split("/")[-2:]
+            if date != first_day:
+                return True
+            return int(name[:name.find("@")]) >= start_ts
+        return key_filter
+
+    def _list_page(self, prefix, limit, lower, upper, sort_dir):
+        if sort_dir == "desc":
+            return self._indices_section.list_objects(
+                prefix=prefix, limit=limit, marker=upper, end_marker=lower,
+                sort_dir=sort_dir)
+        return self._indices_section.list_objects(
+            prefix=prefix, limit=limit, marker=lower, end_marker=upper,
+            sort_dir=sort_dir)
+
+    def _iter_keys(self, prefix, limit, lower, upper, sort_dir,
+                   key_filter=None):
+        """Return the index keys within bounds, one bank page at a time.
+
+        Listing stops as soon as limit keys were found. Descending listings
+        keep the order of a single descending bank listing, ascending keys
+        ending right before the upper bound. Keys rejected by key_filter
+        are skipped without counting towards the limit.
+        """
+        page_size = CONF.checkpoint_list_page_size
+        keys = []
+        while limit is None or len(keys) < limit:
+            size = page_size if limit is None else min(page_size,
+                                                       limit - len(keys))
+            page = list(self._list_page(prefix, size, lower, upper, sort_dir))
+            exhausted = len(page) < size
+            if page:
+                if sort_dir == "desc":
+                    upper = page[0]
+                else:
+                    lower = page[-1]
+            if key_filter is not None:
+                page = [key for key in page if key_filter(key)]
+            if sort_dir == "desc":
+                keys = page + keys
+            else:
+                keys.extend(page)
+            if exhausted:
+                break
+        return keys
 
     def get(self, checkpoint_id):
         # TODO(saggi): handle multiple instances of the same checkpoint
         return Checkpoint.get_by_section(self._checkpoints_section,
                                          self._indices_section,
                                          self._bank_lease,
-                                         checkpoint_id)
+                                         checkpoint_id,
+                                         self._index_cache)
 
     def create(self, plan):
         # TODO(saggi): Serialize plan to checkpoint. Will be done in
@@ -311,4 +507,5 @@ class CheckpointCollection(object):
                                             self._indices_section,
                                             self._bank_lease,
                                             self._bank.get_owner_id(),
-                                            plan)
+                                            plan,
+                                            index_cache=self._index_cache)
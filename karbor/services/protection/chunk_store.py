@@ -0,0 +1,365 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import binascii
+import collections
+import eventlet
+import hashlib
+import six
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from karbor import exception
+from karbor.i18n import _, _LE, _LW
+from karbor.services.protection.bank_plugin import BankSegmentReader
+
+chunk_store_opts = [
+    cfg.BoolOpt('backup_deduplication',
+                default=False,
+                help='Store protected image data in the content-addressed '
+                     'chunk store of the bank, so data shared by several '
+                     'checkpoints is uploaded and stored only once. '
+                     'Finding the chunk boundaries costs CPU time, about '
+                     '70 MB/s per core, see tools/chunker_benchmark.py'),
+    cfg.IntOpt('dedup_chunk_min_size',
+               default=262144,
+               help='The minimal size in bytes of deduplicated chunks'),
+    cfg.IntOpt('dedup_chunk_avg_size',
+               default=1048576,
+               help='The average size in bytes of deduplicated chunks, '
+                    'must be a power of two'),
+    cfg.IntOpt('dedup_chunk_max_size',
+               default=4194304,
+               help='The maximal size in bytes of deduplicated chunks'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(chunk_store_opts)
+LOG = logging.getLogger(__name__)
+
+_CHUNKS_SECTION = "/chunks"
+
+# A fixed table of 64 bit values for the gear rolling hash. It is derived
+# from md5 so that chunk boundaries are stable across processes and releases.
+_GEAR = [int(hashlib.md5(six.int2byte(i)).hexdigest()[:16], 16)
+         for i in range(256)]
+
+# the number of low hash bits computed for every byte at once
+_FILTER_BITS = 12
+
+if hasattr(int, "from_bytes"):
+    def _int_from_bytes(data):
+        return int.from_bytes(data, "little")
+
+    def _int_to_bytes(value, length):
+        return value.to_bytes(length, "little")
+else:
+    def _int_from_bytes(data):
+        return int(binascii.hexlify(bytes(data[::-1])) or b"0", 16)
+
+    def _int_to_bytes(value, length):
+        if not length:
+            return b""
+        return binascii.unhexlify("%0*x" % (2 * length, value))[::-1]
+
+
+class ContentDefinedChunker(object):
+    """Split a stream of data at content defined boundaries.
+
+    A boundary is placed after a byte when the gear hash of the bytes up to
+    it matches a mask, so an insertion or deletion in the data only changes
+    the chunks around it instead of shifting every following fixed size
+    segment. Only the last log2(avg_size) bytes contribute to the masked
+    bits of the hash, which makes it a hash of a sliding window.
+
+    Hashing byte by byte in Python would limit backups to a few MB/s, so the
+    low bits of the hash of every position of a block are computed at once
+    with big integer arithmetic, one 16 bit slot per byte, by summing
+    windows of doubling length. Only the rare positions passing this filter
+    are hashed in full. See tools/chunker_benchmark.py.
+    """
+    def __init__(self, min_size, avg_size, max_size):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise exception.InvalidInput(
+                reason=_("chunk sizes must satisfy "
+                         "0 < min_size <= avg_size <= max_size"))
+        self._min_size = min_size
+        self._max_size = max_size
+        self._mask = avg_size - 1
+        self._window = self._mask.bit_length()
+        if self._window > min_size:
+            raise exception.InvalidInput(
+                reason=_("min_size must be at least log2(avg_size)"))
+        filter_bits = min(self._window, _FILTER_BITS)
+        self._filter_mask = (1 << filter_bits) - 1
+        self._tables = [
+            bytes(bytearray((gear & self._filter_mask) >> shift & 0xFF
+                            for gear in _GEAR))
+            for shift in (0, 8)]
+        self._slot_masks = {}
+
+    def _get_slot_masks(self, count):
+        """Return big integers repeating the masks used on count slots."""
+        masks = self._slot_masks.get(count)
+        if masks is None:
+            def repeat(value):
+                return _int_from_bytes(_int_to_bytes(value, 2) * count)
+            widths = []
+            width = 1
+            while width <= self._filter_mask.bit_length():
+                widths.append((width, repeat(self._filter_mask >> width)))
+                width *= 2
+            masks = (repeat(self._filter_mask), repeat(0xFF), widths)
+            # the stream usually comes in blocks of a single size
+            self._slot_masks = {count: masks}
+        return masks
+
+    def _candidates(self, data, start):
+        """Return the positions after which the filtered hash matches.
+
+        The positions are relative to data, only positions from start are
+        returned and data[:start] is the context of the first windows.
+        """
+        count = len(data)
+        packed = bytearray(2 * count)
+        packed[0::2] = data.translate(self._tables[0])
+        packed[1::2] = data.translate(self._tables[1])
+        sums = _int_from_bytes(bytes(packed))
+        slot_mask, low_byte_mask, widths = self._get_slot_masks(count)
+        for width, width_mask in widths:
+            # add the window of the previous width bytes, shifted by width
+            sums = (sums + ((sums & width_mask) << (17 * width))) & slot_mask
+        # fold every slot into its low byte, which is zero iff the slot is
+        zeros = _int_to_bytes((sums | (sums >> 8)) & low_byte_mask,
+                              2 * count)[0::2]
+        candidates = []
+        index = zeros.find(b"\x00", start)
+        while index != -1:
+            candidates.append(index + 1)
+            index = zeros.find(b"\x00", index + 1)
+        return candidates
+
+    def _matches(self, buf, end):
+        gear = _GEAR
+        h = 0
+        for k in range(self._window):
+            h += gear[buf[end - 1 - k]] << k
+        return not h & self._mask
+
+    def _next_boundary(self, buf, candidates):
+        while candidates:
+            end = candidates[0]
+            if end > self._max_size:
+                break
+            candidates.popleft()
+            if end > self._min_size and self._matches(buf, end):
+                return end
+        if len(buf) >= self._max_size:
+            return self._max_size
+        return None
+
+    def split(self, stream):
+        buf = bytearray()
+        candidates = collections.deque()
+        for data in stream:
+            if not data:
+                continue
+            start = len(buf)
+            buf.extend(data)
+            context = max(0, start - self._window)
+            candidates.extend(
+                context + end for end in self._candidates(
+                    bytes(buf[context:]), start - context))
+            while True:
+                end = self._next_boundary(buf, candidates)
+                if end is None:
+                    break
+                yield bytes(buf[:end])
+                del buf[:end]
+                candidates = collections.deque(
+                    position - end for position in candidates
+                    if position > end)
+        if buf:
+            yield bytes(buf)
+
+
+class ChunkStore(object):
+    """Content-addressed, reference counted chunk store in a bank.
+
+    Chunks are stored once under /chunks/<sha256>. Every holder of a chunk,
+    typically the image of a checkpoint, owns a reference marker object
+    next to it, so protection services sharing a bank never update a common
+    counter. Writing a stream returns a chunk list which the caller records
+    in its checkpoint, and releasing that chunk list drops the markers of
+    its holder and deletes the chunks which are no longer referenced.
+
+    A release announces itself with a deleting marker before it looks for
+    the remaining references, and writers wait for such markers to go away
+    before they rely on an existing chunk. Either the release sees the
+    reference of the writer and keeps the chunk, or the writer sees that
+    the chunk was deleted and uploads it again.
+    """
+    # deleting markers older than this are left by a crashed release
+    deleting_timeout = 300
+    deleting_poll_interval = 0.5
+
+    def __init__(self, bank, min_size=None, avg_size=None, max_size=None):
+        self._section = bank.get_sub_section(_CHUNKS_SECTION)
+        self._chunker = ContentDefinedChunker(
+            min_size or CONF.dedup_chunk_min_size,
+            avg_size or CONF.dedup_chunk_avg_size,
+            max_size or CONF.dedup_chunk_max_size)
+
+    @staticmethod
+    def _chunk_key(digest):
+        return "%s/%s" % (digest[:2], digest)
+
+    @staticmethod
+    def _refs_prefix(digest):
+        return "%s/%s.refs" % (digest[:2], digest)
+
+    @staticmethod
+    def _deleting_prefix(digest):
+        return "%s/%s.deleting" % (digest[:2], digest)
+
+    def _exists(self, chunk_key):
+        """Whether the chunk is stored.
+
+        Bank plugins which provide no etags are asked for the first key of
+        the chunk directory following a marker right before the chunk key.
+        Keys are hex digests, so no other key sorts in between.
+        """
+        try:
+            if self._section.get_object_etag(chunk_key) is not None:
+                return True
+        except exception.BankObjectNotFound:
+            return False
+        directory, digest = chunk_key.split("/")
+        marker = "%s/%s%s~" % (directory, digest[:-1],
+                               chr(ord(digest[-1]) - 1))
+        return self._section.list_objects(
+            prefix=directory, marker=marker, limit=1) == [chunk_key]
+
+    def _has_markers(self, prefix, exclude=None):
+        markers = self._section.list_objects(prefix=prefix)
+        return any(marker != exclude for marker in markers)
+
+    def _wait_for_releases(self, digest):
+        deadline = time.time() + self.deleting_timeout
+        while self._has_markers(self._deleting_prefix(digest)):
+            if time.time() >= deadline:
+                LOG.warning(_LW("Ignoring stale deleting markers of chunk "
+                                "%s"), digest)
+                return
+            eventlet.sleep(self.deleting_poll_interval)
+
+    def _add_reference(self, digest, data, holder):
+        self._section.create_object(
+            "%s/%s" % (self._refs_prefix(digest), holder), holder)
+        # a release which has not seen the marker may be deleting the chunk
+        self._wait_for_releases(digest)
+        chunk_key = self._chunk_key(digest)
+        if not self._exists(chunk_key):
+            self._section.create_object_stream(chunk_key, iter((data, )))
+
+    def _remove_reference(self, digest, holder):
+        refs_prefix = self._refs_prefix(digest)
+        ref_key = "%s/%s" % (refs_prefix, holder)
+        if ref_key in self._section.list_objects(prefix=refs_prefix):
+            self._section.delete_object(ref_key)
+
+        deleting_key = "%s/%s" % (self._deleting_prefix(digest), holder)
+        self._section.create_object(deleting_key, holder)
+        try:
+            if self._has_markers(refs_prefix):
+                return
+            LOG.debug("Deleting unreferenced chunk %s", digest)
+            chunk_key = self._chunk_key(digest)
+            try:
+                self._section.delete_object(chunk_key)
+            except exception.BankDeleteObjectFailed:
+                # deleted by a concurrent release
+                if self._exists(chunk_key):
+                    raise
+        finally:
+            self._section.delete_object(deleting_key)
+
+    def write(self, stream, holder, max_in_flight=1):
+        """Store a stream of data and return its chunk list.
+
+        :param holder: a name identifying the owner of the references in
+                       the bank, unique per stream of every checkpoint
+        """
+        if not holder or "/" in holder:
+            raise exception.InvalidInput(
+                reason=_("Invalid chunk holder: %s") % holder)
+        pool = eventlet.GreenPool(max_in_flight)
+        errors = []
+        added = set()
+        chunks = []
+        sizes = []
+
+        def add_reference(digest, data):
+            try:
+                self._add_reference(digest, data, holder)
+            except Exception as err:
+                errors.append(err)
+
+        for data in self._chunker.split(stream):
+            if errors:
+                break
+            digest = hashlib.sha256(data).hexdigest()
+            chunks.append(digest)
+            sizes.append(len(data))
+            # a holder references a repeated chunk once
+            if digest not in added:
+                added.add(digest)
+                pool.spawn_n(add_reference, digest, data)
+        pool.waitall()
+
+        if errors:
+            # do not leak the references taken before the failure
+            try:
+                self.release({"chunks": list(added), "holder": holder},
+                             max_in_flight)
+            except Exception:
+                LOG.exception(_LE("Releasing the chunks of %s failed"),
+                              holder)
+            raise errors[0]
+        return {"chunks": chunks, "sizes": sizes, "holder": holder}
+
+    def read(self, chunk_list, max_in_flight=1):
+        """Iterate over the contents of a chunk list in order."""
+        digests = chunk_list["chunks"]
+        keys = [self._chunk_key(digest) for digest in digests]
+        reader = BankSegmentReader(self._section, keys, max_in_flight)
+        for digest, data in six.moves.zip(digests, reader):
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise exception.BankObjectCorrupted(
+                    key=self._chunk_key(digest),
+                    reason=_("checksum mismatch"))
+            yield data
+
+    def release(self, chunk_list, max_in_flight=1):
+        """Drop the references held by a chunk list.
+
+        Releasing a chunk list again, e.g. when a deletion is retried, only
+        deletes the chunks a previous attempt left unreferenced.
+        """
+        holder = chunk_list["holder"]
+        pool = eventlet.GreenPool(max_in_flight)
+        threads = [pool.spawn(self._remove_reference, digest, holder)
+                   for digest in set(chunk_list["chunks"])]
+        for thread in threads:
+            thread.wait()
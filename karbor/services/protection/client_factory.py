@@ -10,18 +10,57 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import datetime
+
 from karbor.i18n import _LE
+from keystoneauth1 import access
 import os
 
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import importutils
+from oslo_utils import timeutils
+
+client_factory_opts = [
+    cfg.IntOpt('client_cache_size',
+               default=256,
+               help='The maximal number of service clients kept for reuse '
+                    'across requests of the same token. 0 disables the '
+                    'cache.'),
+    cfg.IntOpt('client_cache_ttl',
+               default=600,
+               help='The number of seconds a cached service client is '
+                    'reused for. Clients are never reused past the '
+                    'expiration of their token.'),
+]
 
+CONF = cfg.CONF
+CONF.register_opts(client_factory_opts)
 LOG = logging.getLogger(__name__)
 
+# cached clients are dropped this long before their token expires
+TOKEN_EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+
+
+def _token_expires_at(context):
+    token_info = getattr(context, 'auth_token_info', None)
+    if not token_info:
+        return None
+    try:
+        expires = access.create(body=token_info).expires
+    except Exception:
+        return None
+    return timeutils.normalize_time(expires) if expires else None
+
 
 class ClientFactory(object):
     _factory = None
+    # (service, project, token, trust, client options) -> (client, expiry)
+    _clients = collections.OrderedDict()
+    # swift connections are pooled by the swift bank plugin, which needs a
+    # distinct connection per pool slot
+    _uncached_services = ('swift', )
 
     @staticmethod
     def _list_clients():
@@ -44,4 +83,55 @@ class ClientFactory(object):
                 module = importutils.import_module(module)
                 cls._factory[module.SERVICE] = module
 
-        return cls._factory[service].create(context, conf, **kwargs)
+        # clients authenticated by explicit credentials are not shared
+        if (kwargs or service in cls._uncached_services or
+                CONF.client_cache_size <= 0):
+            return cls._factory[service].create(context, conf, **kwargs)
+
+        key = cls._cache_key(service, context, conf)
+        now = timeutils.utcnow()
+        cached = cls._clients.pop(key, None) if key is not None else None
+        if cached is not None and cached[1] > now:
+            cls._clients[key] = cached
+            return cached[0]
+
+        client = cls._factory[service].create(context, conf)
+        if key is None:
+            # the client module registers its options when creating a client
+            key = cls._cache_key(service, context, conf)
+            if key is None:
+                return client
+        expiry = now + datetime.timedelta(seconds=CONF.client_cache_ttl)
+        token_expiry = _token_expires_at(context)
+        if token_expiry is not None:
+            expiry = min(expiry, token_expiry - TOKEN_EXPIRY_MARGIN)
+        if expiry > now:
+            cls._clients[key] = (client, expiry)
+            while len(cls._clients) > CONF.client_cache_size:
+                cls._clients.popitem(last=False)
+        return client
+
+    @staticmethod
+    def _cache_key(service, context, conf):
+        """Return the cache key of a client, None if it can't be resolved.
+
+        The key holds the option values of the client in conf rather than
+        the conf object itself, so changed options or another conf reusing
+        the address of a released one never get a client built before.
+        The endpoint follows from these options and the service catalog of
+        the token.
+        """
+        try:
+            client_conf = getattr(conf, service + '_client')
+        except cfg.NoSuchOptError:
+            return None
+        options = tuple(sorted((name, client_conf[name])
+                               for name in client_conf))
+        return (service, getattr(context, 'project_id', None),
+                getattr(context, 'auth_token', None),
+                getattr(context, 'trust_id', None), options)
+
+    @classmethod
+    def clear_cache(cls):
+        """Drop the cached clients."""
+        cls._clients.clear()
@@ -10,22 +10,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import eventlet
+import functools
+
 from karbor.common import constants
-from karbor.i18n import _LI
-from oslo_config import cfg
+from karbor.i18n import _LE, _LI
+from karbor.services.protection import status_aggregator
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from taskflow import task
 
-sync_status_opts = [
-    cfg.IntOpt('sync_status_interval',
-               default=60,
-               help='update protection status interval')
-]
-
-CONF = cfg.CONF
-CONF.register_opts(sync_status_opts)
-
 LOG = logging.getLogger(__name__)
 
 
@@ -45,6 +38,16 @@ class CreateCheckpointTask(task.Task):
         return checkpoint
 
 
+def _aggregate_protection_status(statuses):
+    if constants.RESOURCE_STATUS_ERROR in statuses:
+        return constants.CHECKPOINT_STATUS_ERROR
+    elif (constants.RESOURCE_STATUS_PROTECTING in statuses or
+          constants.RESOURCE_STATUS_UNDEFINED in statuses):
+        return constants.CHECKPOINT_STATUS_PROTECTING
+    else:
+        return constants.CHECKPOINT_STATUS_AVAILABLE
+
+
 class SyncCheckpointStatusTask(task.Task):
     def __init__(self, status_getters):
         requires = ['checkpoint']
@@ -54,34 +57,30 @@ class SyncCheckpointStatusTask(task.Task):
     def execute(self, checkpoint):
         LOG.info(_LI("Start sync checkpoint status,checkpoint_id: %s"),
                  checkpoint.id)
-        sync_status = loopingcall.FixedIntervalLoopingCall(
-            self._sync_status, checkpoint, self._status_getters)
-        sync_status.start(interval=CONF.sync_status_interval)
+        eventlet.spawn_n(self._sync_status, checkpoint, self._status_getters)
 
     def _sync_status(self, checkpoint, status_getters):
-        statuses = set()
-        for s in status_getters:
-            resource_id = s.get('resource_id')
-            get_resource_stats = s.get('get_resource_stats')
-            statuses.add(get_resource_stats(checkpoint, resource_id))
-        if constants.RESOURCE_STATUS_ERROR in statuses:
-            checkpoint.status = constants.CHECKPOINT_STATUS_ERROR
-            checkpoint.commit()
-        elif constants.RESOURCE_STATUS_PROTECTING in statuses:
-            checkpoint.status = constants.CHECKPOINT_STATUS_PROTECTING
-            checkpoint.commit()
-        elif constants.RESOURCE_STATUS_UNDEFINED in statuses:
-            checkpoint.status = constants.CHECKPOINT_STATUS_PROTECTING
-            checkpoint.commit()
-        else:
-            checkpoint.status = constants.CHECKPOINT_STATUS_AVAILABLE
+        try:
+            status_aggregator.sync_checkpoint_status(
+                checkpoint, status_getters, _aggregate_protection_status,
+                functools.partial(self._update_status, checkpoint))
+        except Exception:
+            LOG.exception(_LE("Sync checkpoint status failed, "
+                              "checkpoint_id: %s"), checkpoint.id)
+
+    def _update_status(self, checkpoint, status):
+        if status != checkpoint.status:
+            checkpoint.status = status
             checkpoint.commit()
-            LOG.info(_LI("Stop sync checkpoint status,checkpoint_id: "
-                         "%(checkpoint_id)s,checkpoint status: "
-                         "%(checkpoint_status)s"),
-                     {"checkpoint_id": checkpoint.id,
-                      "checkpoint_status": checkpoint.status})
-            raise loopingcall.LoopingCallDone()
+        if status == constants.CHECKPOINT_STATUS_PROTECTING:
+            return False
+        checkpoint.flush()
+        LOG.info(_LI("Stop sync checkpoint status,checkpoint_id: "
+                     "%(checkpoint_id)s,checkpoint status: "
+                     "%(checkpoint_status)s"),
+                 {"checkpoint_id": checkpoint.id,
+                  "checkpoint_status": checkpoint.status})
+        return True
 
 
 def get_flow(context, workflow_engine, operation_type, plan, provider):
@@ -10,23 +10,25 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import eventlet
+import functools
+
 from karbor.common import constants
-from karbor.i18n import _LI
-from oslo_config import cfg
+from karbor.i18n import _LE, _LI
+from karbor.services.protection import status_aggregator
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from taskflow import task
 
-sync_status_opts = [
-    cfg.IntOpt('sync_status_interval',
-               default=60,
-               help='update protection status interval')
-]
+LOG = logging.getLogger(__name__)
 
-CONF = cfg.CONF
-CONF.register_opts(sync_status_opts)
 
-LOG = logging.getLogger(__name__)
+def _aggregate_deletion_status(statuses):
+    if constants.RESOURCE_STATUS_ERROR in statuses:
+        return constants.CHECKPOINT_STATUS_ERROR_DELETING
+    elif statuses == {constants.RESOURCE_STATUS_DELETED, }:
+        return constants.CHECKPOINT_STATUS_DELETED
+    else:
+        return constants.CHECKPOINT_STATUS_DELETING
 
 
 class SyncCheckpointStatusTask(task.Task):
@@ -38,33 +40,36 @@ class SyncCheckpointStatusTask(task.Task):
     def execute(self):
         LOG.info(_LI("Start sync checkpoint status,checkpoint_id:%s"),
                  self._checkpoint.id)
-        sync_status = loopingcall.FixedIntervalLoopingCall(
-            self._sync_status, self._checkpoint, self._status_getters)
-        sync_status.start(interval=CONF.sync_status_interval)
+        eventlet.spawn_n(self._sync_status, self._checkpoint,
+                         self._status_getters)
 
     def _sync_status(self, checkpoint, status_getters):
-        statuses = set()
-        for s in status_getters:
-            resource_id = s.get('resource_id')
-            get_resource_stats = s.get('get_resource_stats')
-            statuses.add(get_resource_stats(checkpoint, resource_id))
-        LOG.info(_LI("Start sync checkpoint status,checkpoint_id:"
-                     "%(checkpoint_id)s, resource_status:"
-                     "%(resource_status)s") %
-                 {"checkpoint_id": checkpoint.id,
-                  "resource_status": statuses})
-        if constants.RESOURCE_STATUS_ERROR in statuses:
-            checkpoint.status = constants.CHECKPOINT_STATUS_ERROR_DELETING
+        try:
+            status_aggregator.sync_checkpoint_status(
+                checkpoint, status_getters, _aggregate_deletion_status,
+                functools.partial(self._update_status, checkpoint))
+        except Exception:
+            LOG.exception(_LE("Sync checkpoint status failed, "
+                              "checkpoint_id: %s"), checkpoint.id)
+
+    def _update_status(self, checkpoint, status):
+        LOG.info(_LI("Sync checkpoint status,checkpoint_id:"
+                     "%(checkpoint_id)s, status: %(status)s"),
+                 {"checkpoint_id": checkpoint.id, "status": status})
+        if status == constants.CHECKPOINT_STATUS_ERROR_DELETING:
+            checkpoint.status = status
             checkpoint.commit()
-            raise loopingcall.LoopingCallDone()
-        elif statuses == {constants.RESOURCE_STATUS_DELETED, }:
+        elif status == constants.CHECKPOINT_STATUS_DELETED:
             checkpoint.delete()
-            LOG.info(_LI("Stop sync checkpoint status,checkpoint_id: "
-                         "%(checkpoint_id)s,checkpoint status: "
-                         "%(checkpoint_status)s"),
-                     {"checkpoint_id": checkpoint.id,
-                      "checkpoint_status": checkpoint.status})
-            raise loopingcall.LoopingCallDone()
+        else:
+            return False
+        checkpoint.flush()
+        LOG.info(_LI("Stop sync checkpoint status,checkpoint_id: "
+                     "%(checkpoint_id)s,checkpoint status: "
+                     "%(checkpoint_status)s"),
+                 {"checkpoint_id": checkpoint.id,
+                  "checkpoint_status": checkpoint.status})
+        return True
 
 
 def get_flow(context, workflow_engine, operation_type, checkpoint, provider):
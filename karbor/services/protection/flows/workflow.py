@@ -13,6 +13,7 @@
 import abc
 import futurist
 import six
+import weakref
 
 from karbor import exception
 from karbor.i18n import _, _LE
@@ -83,12 +84,43 @@ class WorkFlowEngine(object):
 
     @abc.abstractmethod
     def search_task(self, flow, task_id):
+        """Return the task named task_id in flow, or None
+
+        Plugins look up the task of a shared resource every time the resource
+        graph reaches it again, so engines should answer from an index kept
+        up to date by add_tasks instead of scanning the flow.
+
+        :param flow: graph flow
+        :param task_id: the name of the task
+        """
         return
 
 
+class _FlowIndex(object):
+    __slots__ = ('nodes', 'tasks')
+
+    def __init__(self):
+        self.nodes = set()
+        self.tasks = {}
+
+
 class TaskFlowEngine(WorkFlowEngine):
     def __init__(self):
         super(TaskFlowEngine, self).__init__()
+        # flow -> index of the nodes added through add_tasks
+        self._flow_indexes = weakref.WeakKeyDictionary()
+
+    def _get_flow_index(self, flow):
+        index = self._flow_indexes.get(flow)
+        if index is None:
+            index = self._flow_indexes[flow] = _FlowIndex()
+        return index
+
+    @staticmethod
+    def _index_node(index, node):
+        index.nodes.add(node)
+        if isinstance(node, task.FunctorTask):
+            index.tasks.setdefault(node.name, node)
 
     def build_flow(self, flow_name, flow_type='graph'):
         if flow_type == 'linear':
@@ -164,13 +196,21 @@ class TaskFlowEngine(WorkFlowEngine):
             raise exception.InvalidTaskFlowObject(
                 reason=_("The flow is None"))
         flow.add(*nodes, **kwargs)
+        if isinstance(flow, graph_flow.Flow):
+            index = self._get_flow_index(flow)
+            for node in nodes:
+                self._index_node(index, node)
 
     def search_task(self, flow, task_id):
         if not isinstance(flow, graph_flow.Flow):
             LOG.error(_LE("this is not a graph flow,flow name:%s"), flow.name)
             return
+        index = self._get_flow_index(flow)
+        node = index.tasks.get(task_id)
+        if node is not None or len(index.nodes) == len(flow):
+            return node
+        # some nodes were added to the flow directly, index them first
         for node, meta in flow.iter_nodes():
-            if not isinstance(node, task.FunctorTask):
-                continue
-            if task_id == getattr(node, 'name'):
-                return node
+            if node not in index.nodes:
+                self._index_node(index, node)
+        return index.tasks.get(task_id)
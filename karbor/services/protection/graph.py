@@ -11,6 +11,7 @@
 #    under the License.
 import abc
 from collections import namedtuple
+import itertools
 import json
 
 from oslo_log import log as logging
@@ -45,35 +46,49 @@ class FoundLoopError(RuntimeError):
             _("A loop was found in the graph"))
 
 
-def _build_graph_rec(context, node):
-    LOG.trace("Entered node: %s", node)
-    source_set = context.source_set
-    encountered_set = context.encountered_set
-    finished_nodes = context.finished_nodes
-    LOG.trace("Gray set is %s", encountered_set)
-    if node in encountered_set:
-        raise FoundLoopError()
-
-    LOG.trace("Black set is %s", finished_nodes.keys())
-    if node in finished_nodes:
-        return finished_nodes[node]
-
+def _enter_node(context, node):
     LOG.trace("Change to gray: %s", node)
-    encountered_set.add(node)
-    child_nodes = context.get_child_nodes(node)
-    LOG.trace("Child nodes are ", child_nodes)
+    context.encountered_set.add(node)
+    child_nodes = tuple(context.get_child_nodes(node))
+    LOG.trace("Child nodes are %s", child_nodes)
     # If we found a parent than this is not a source
-    source_set.difference_update(child_nodes)
-    child_list = []
-    for child_node in child_nodes:
-        child_list.append(_build_graph_rec(context, child_node))
+    context.source_set.difference_update(child_nodes)
+    return node, child_nodes, []
 
-    LOG.trace("Change to black: ", node)
-    encountered_set.discard(node)
-    graph_node = GraphNode(value=node, child_nodes=tuple(child_list))
-    finished_nodes[node] = graph_node
 
-    return graph_node
+def _build_graph_from(context, start_node):
+    """Build the graph reachable from start_node depth first.
+
+    The nodes being built are kept on an explicit stack of
+    (node, child nodes, built child nodes) frames instead of the call
+    stack, so the depth of the graph is not bound by the recursion limit.
+    """
+    encountered_set = context.encountered_set
+    finished_nodes = context.finished_nodes
+    if start_node in finished_nodes:
+        return finished_nodes[start_node]
+
+    stack = [_enter_node(context, start_node)]
+    while True:
+        node, child_nodes, child_list = stack[-1]
+        if len(child_list) < len(child_nodes):
+            child_node = child_nodes[len(child_list)]
+            if child_node in encountered_set:
+                raise FoundLoopError()
+            if child_node in finished_nodes:
+                child_list.append(finished_nodes[child_node])
+            else:
+                stack.append(_enter_node(context, child_node))
+            continue
+
+        LOG.trace("Change to black: %s", node)
+        stack.pop()
+        encountered_set.discard(node)
+        graph_node = GraphNode(value=node, child_nodes=tuple(child_list))
+        finished_nodes[node] = graph_node
+        if not stack:
+            return graph_node
+        stack[-1][2].append(graph_node)
 
 
 def build_graph(start_nodes, get_child_nodes_func):
@@ -86,7 +101,7 @@ def build_graph(start_nodes, get_child_nodes_func):
 
     result = []
     for node in start_nodes:
-        result.append(_build_graph_rec(context, node))
+        result.append(_build_graph_from(context, node))
 
     assert(len(context.encountered_set) == 0)
 
@@ -119,19 +134,43 @@ class GraphWalker(object):
     def unregister_listener(self, graph_walker_listener):
         self._listeners.remove(graph_walker_listener)
 
-    def walk_graph(self, source_nodes):
-        self._walk_graph(source_nodes, set())
-
-    def _walk_graph(self, source_nodes, visited_nodes):
-        for node in source_nodes:
+    def walk_graph(self, source_nodes, visit_once=False):
+        """Walk the graph depth first and notify the listeners.
+
+        Nodes reachable from several parents are entered once per parent,
+        with already_visited set after the first time. By default the
+        children of such nodes are walked again every time; with
+        visit_once, a node already visited is entered and exited without
+        descending into its children, so each shared subtree is walked once.
+        """
+        # nodes are tracked by value: the graph holds a single node per
+        # value, and hashing a value does not hash the whole subtree
+        visited_values = set()
+        # the children left to walk of every node on the current path
+        stack = [iter(source_nodes)]
+        path = []
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if path:
+                    self._exit_node(path.pop())
+                continue
+
+            already_visited = node.value in visited_values
+            visited_values.add(node.value)
             for listener in self._listeners:
-                listener.on_node_enter(node, node in visited_nodes)
-                visited_nodes.add(node)
+                listener.on_node_enter(node, already_visited)
 
-            self._walk_graph(node.child_nodes, visited_nodes)
+            if already_visited and visit_once:
+                self._exit_node(node)
+                continue
+            path.append(node)
+            stack.append(iter(node.child_nodes))
 
-            for listener in self._listeners:
-                listener.on_node_exit(node)
+    def _exit_node(self, node):
+        for listener in self._listeners:
+            listener.on_node_exit(node)
 
 
 class PackGraphWalker(GraphWalkerListener):
@@ -156,12 +195,13 @@ class PackGraphWalker(GraphWalkerListener):
 
         node_sid = self._sid_counter
         self._sid_counter += 1
-        self._node_to_sid[node] = node_sid
+        # keyed by value, hashing a node would hash its whole subtree
+        self._node_to_sid[node.value] = node_sid
         self._sid_to_node[key_serialize(node_sid)] = node.value
 
         if len(node.child_nodes) > 0:
             children_sids = map(lambda node:
-                                key_serialize(self._node_to_sid[node]),
+                                key_serialize(self._node_to_sid[node.value]),
                                 node.child_nodes)
             self._adjacency_list.append(
                 (key_serialize(node_sid), tuple(children_sids))
@@ -220,7 +260,7 @@ def serialize_resource_graph(resource_graph):
     return json.dumps(packed_resource_graph)
 
 
-def deserialize_resource_graph(serialized_resource_graph):
+def _deserialize_json_resource_graph(serialized_resource_graph):
     deserialized_graph = json.loads(serialized_resource_graph)
     packed_resource_graph = PackedGraph(nodes=deserialized_graph[0],
                                         adjacency=deserialized_graph[1])
@@ -230,3 +270,215 @@ def deserialize_resource_graph(serialized_resource_graph):
                                                     name=node[2])
     resource_graph = unpack_graph(packed_resource_graph)
     return resource_graph
+
+
+def deserialize_resource_graph(serialized_resource_graph):
+    """Deserialize a resource graph in the JSON or in the compact format."""
+    return decode_resource_graph(iter((serialized_resource_graph, )))
+
+
+# Compact resource graph format, all integers are unsigned LEB128 varints
+# and strings are a varint of their utf-8 length plus one (0 is None)
+# followed by their utf-8 encoding:
+#
+#   magic, version byte
+#   type table:  count, types
+#   nodes:       count, (type index, id, name) for every node
+#   roots:       count, sids
+#   adjacency:   child count of every node, child sids of every node
+#
+# Nodes are numbered in post order, so the children of a node always have
+# a smaller sid and a node is written once however many parents it has.
+COMPACT_GRAPH_MAGIC = b"KRBG"
+COMPACT_GRAPH_VERSION = 1
+
+
+def _encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _encode_string(value, out):
+    if value is None:
+        _encode_varint(0, out)
+        return
+    data = six.text_type(value).encode("utf-8")
+    _encode_varint(len(data) + 1, out)
+    out.extend(data)
+
+
+class _CompactPackGraphWalker(GraphWalkerListener):
+    """Number the nodes of a graph in post order, once per node."""
+    def __init__(self):
+        super(_CompactPackGraphWalker, self).__init__()
+        self.nodes = []
+        self.node_to_sid = {}
+
+    def on_node_enter(self, node, already_visited):
+        pass
+
+    def on_node_exit(self, node):
+        if node.value not in self.node_to_sid:
+            self.node_to_sid[node.value] = len(self.nodes)
+            self.nodes.append(node)
+
+
+def encode_resource_graph(resource_graph):
+    """Return a resource graph encoded in the compact binary format."""
+    walker = GraphWalker()
+    packer = _CompactPackGraphWalker()
+    walker.register_listener(packer)
+    walker.walk_graph(resource_graph, visit_once=True)
+    nodes = packer.nodes
+    node_to_sid = packer.node_to_sid
+
+    type_to_index = {}
+    for node in nodes:
+        type_to_index.setdefault(node.value.type, len(type_to_index))
+
+    out = bytearray(COMPACT_GRAPH_MAGIC)
+    out.append(COMPACT_GRAPH_VERSION)
+    _encode_varint(len(type_to_index), out)
+    for resource_type in sorted(type_to_index, key=type_to_index.get):
+        _encode_string(resource_type, out)
+    _encode_varint(len(nodes), out)
+    for node in nodes:
+        _encode_varint(type_to_index[node.value.type], out)
+        _encode_string(node.value.id, out)
+        _encode_string(node.value.name, out)
+    _encode_varint(len(resource_graph), out)
+    for node in resource_graph:
+        _encode_varint(node_to_sid[node.value], out)
+    for node in nodes:
+        _encode_varint(len(node.child_nodes), out)
+    for node in nodes:
+        for child_node in node.child_nodes:
+            _encode_varint(node_to_sid[child_node.value], out)
+    return bytes(out)
+
+
+class _ChunkReader(object):
+    """Read bytes and varints from an iterator of chunks."""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = bytearray()
+        self._pos = 0
+
+    def _fill(self, size):
+        while len(self._buf) - self._pos < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            if self._pos:
+                del self._buf[:self._pos]
+                self._pos = 0
+            self._buf.extend(chunk)
+        return True
+
+    def peek(self, size):
+        self._fill(size)
+        return bytes(self._buf[self._pos:self._pos + size])
+
+    def read(self, size):
+        if not self._fill(size):
+            raise exception.InvalidInput(
+                reason=_("Truncated resource graph"))
+        data = bytes(self._buf[self._pos:self._pos + size])
+        self._pos += size
+        return data
+
+    def read_remaining(self):
+        for chunk in self._chunks:
+            self._buf.extend(chunk)
+        data = bytes(self._buf[self._pos:])
+        self._pos = len(self._buf)
+        return data
+
+    def read_varint(self):
+        pos = self._pos
+        if pos < len(self._buf) and self._buf[pos] < 0x80:
+            # most values fit in a single byte
+            self._pos = pos + 1
+            return self._buf[pos]
+        value = 0
+        shift = 0
+        while True:
+            if self._pos >= len(self._buf) and not self._fill(1):
+                raise exception.InvalidInput(
+                    reason=_("Truncated resource graph"))
+            byte = self._buf[self._pos]
+            self._pos += 1
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def read_string(self):
+        length = self.read_varint()
+        if length == 0:
+            return None
+        end = self._pos + length - 1
+        if end <= len(self._buf):
+            data = self._buf[self._pos:end]
+            self._pos = end
+            return data.decode("utf-8")
+        return self.read(length - 1).decode("utf-8")
+
+
+def _read_index(reader, limit):
+    index = reader.read_varint()
+    if index >= limit:
+        raise exception.InvalidInput(
+            reason=_("Invalid index in resource graph"))
+    return index
+
+
+def decode_resource_graph(chunks):
+    """Decode a resource graph from an iterator of chunks.
+
+    The chunks are decoded as they are read and the iterator is always
+    exhausted. Graphs serialized in the legacy JSON format are read as well.
+    """
+    chunks = iter(chunks)
+    first_chunk = next(chunks, b"")
+    if isinstance(first_chunk, six.text_type):
+        return _deserialize_json_resource_graph(
+            first_chunk + "".join(chunks))
+
+    reader = _ChunkReader(itertools.chain((first_chunk, ), chunks))
+    if reader.peek(len(COMPACT_GRAPH_MAGIC)) != COMPACT_GRAPH_MAGIC:
+        return _deserialize_json_resource_graph(
+            reader.read_remaining().decode("utf-8"))
+
+    reader.read(len(COMPACT_GRAPH_MAGIC))
+    version = six.indexbytes(reader.read(1), 0)
+    if version != COMPACT_GRAPH_VERSION:
+        raise exception.InvalidInput(
+            reason=_("Unsupported resource graph version: %s") % version)
+
+    types = [reader.read_string() for _i in range(reader.read_varint())]
+    resources = []
+    for _i in range(reader.read_varint()):
+        resource_type = types[_read_index(reader, len(types))]
+        resources.append(Resource(type=resource_type,
+                                  id=reader.read_string(),
+                                  name=reader.read_string()))
+    node_count = len(resources)
+    root_sids = [_read_index(reader, node_count)
+                 for _i in range(reader.read_varint())]
+    child_counts = [reader.read_varint() for _i in range(node_count)]
+
+    graph_nodes = []
+    for sid, resource in enumerate(resources):
+        # children are numbered before their parents
+        child_nodes = tuple(graph_nodes[_read_index(reader, sid)]
+                            for _i in range(child_counts[sid]))
+        graph_nodes.append(GraphNode(value=resource,
+                                     child_nodes=child_nodes))
+    # exhaust the chunks, streams release their connection once fully read
+    if reader.read_remaining():
+        raise exception.InvalidInput(
+            reason=_("Unexpected data after the resource graph"))
+    return [graph_nodes[sid] for sid in root_sids]
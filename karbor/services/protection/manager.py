@@ -15,6 +15,7 @@ Protection Service
 """
 
 from datetime import datetime
+import eventlet
 import six
 
 from oslo_config import cfg
@@ -35,7 +36,11 @@ LOG = logging.getLogger(__name__)
 protection_manager_opts = [
     cfg.StrOpt('provider_registry',
                default='karbor.services.protection.provider.ProviderRegistry',
-               help='the provider registry')
+               help='the provider registry'),
+    cfg.IntOpt('checkpoint_list_concurrency',
+               default=8,
+               help='The number of checkpoints read concurrently from the '
+                    'bank when listing checkpoints'),
 ]
 
 CONF = cfg.CONF
@@ -54,11 +59,12 @@ class ProtectionManager(manager.Manager):
     def __init__(self, service_name=None,
                  *args, **kwargs):
         super(ProtectionManager, self).__init__(*args, **kwargs)
-        provider_reg = CONF.provider_registry
-        self.provider_registry = utils.load_plugin(PROVIDER_NAMESPACE,
-                                                   provider_reg)
         self.protectable_registry = ProtectableRegistry()
         self.protectable_registry.load_plugins()
+        provider_reg = CONF.provider_registry
+        self.provider_registry = utils.load_plugin(
+            PROVIDER_NAMESPACE, provider_reg,
+            protectable_registry=self.protectable_registry)
         self.worker = flow_manager.Worker()
 
     def init_host(self, **kwargs):
@@ -226,11 +232,13 @@ class ProtectionManager(manager.Manager):
         checkpoint_ids = provider.list_checkpoints(
             limit=limit, marker=marker, plan_id=plan_id,
             start_date=start_date, end_date=end_date, sort_dir=sort_dir)
-        checkpoints = []
-        for checkpoint_id in checkpoint_ids:
+
+        def get_checkpoint_summary(checkpoint_id):
             checkpoint = provider.get_checkpoint(checkpoint_id)
-            checkpoints.append(checkpoint.to_dict())
-        return checkpoints
+            return checkpoint.to_dict(include_resource_graph=False)
+
+        pool = eventlet.GreenPool(CONF.checkpoint_list_concurrency)
+        return list(pool.imap(get_checkpoint_summary, checkpoint_ids))
 
     @messaging.expected_exceptions(exception.ProviderNotFound,
                                    exception.CheckpointNotFound)
@@ -11,9 +11,33 @@
 #    under the License.
 
 import abc
+import collections
+from eventlet import semaphore
 import six
 
 
+class InventoryCache(object):
+    """Snapshot of resource inventories shared during a graph build.
+
+    Dependent resources are resolved for every node of a graph, so plugins
+    listing a whole inventory to find the dependents of a single parent
+    store the listing, and the indexes they derive from it, in this cache.
+    Entries are keyed by name and by the project of the context, and are
+    fetched only once even when several nodes are expanded concurrently.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._locks = collections.defaultdict(semaphore.Semaphore)
+
+    def get(self, context, name, fetch_func):
+        key = (getattr(context, 'project_id', None), name)
+        if key not in self._entries:
+            with self._locks[key]:
+                if key not in self._entries:
+                    self._entries[key] = fetch_func()
+        return self._entries[key]
+
+
 @six.add_metaclass(abc.ABCMeta)
 class ProtectablePlugin(object):
     """Base abstract class for protectable plugin.
@@ -22,10 +46,21 @@ class ProtectablePlugin(object):
 
     def __init__(self, context=None):
         self._context = context
+        self._inventory_cache = None
 
     def instance(self, context):
         return self.__class__(context)
 
+    def set_inventory_cache(self, inventory_cache):
+        """Use an inventory cache in get_dependent_resources."""
+        self._inventory_cache = inventory_cache
+
+    def _get_inventory(self, context, name, fetch_func):
+        """Return the result of fetch_func, cached during graph builds."""
+        if self._inventory_cache is None:
+            return fetch_func()
+        return self._inventory_cache.get(context, name, fetch_func)
+
     @abc.abstractmethod
     def get_resource_type(self):
         """Return the resource type that this plugin supports.
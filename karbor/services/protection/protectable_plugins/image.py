@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
 import six
 
 from karbor.common import constants
@@ -56,21 +58,58 @@ class ImageProtectablePlugin(protectable_plugin.ProtectablePlugin):
                                       id=image.id, name=image.name)
                     for image in images]
 
+    def _list_images(self, context):
+        """Index the image listing by id and by owner."""
+        images_by_id = {}
+        images_by_owner = collections.defaultdict(list)
+        for image in self._glance_client(context).images.list():
+            images_by_id[image.id] = image
+            images_by_owner[image.owner].append(image)
+        return images_by_id, images_by_owner
+
+    def _get_images(self, context):
+        return self._get_inventory(
+            context, 'images',
+            functools.partial(self._list_images, context))
+
+    def _list_server_images(self, context):
+        """Map the id of every server to the image it was booted from."""
+        return {server.id: server.image
+                for server in self._nova_client(context).servers.list(
+                    detailed=True)}
+
+    def _get_server_image(self, context, server_id):
+        # listings only pay off when they are shared by a graph build
+        if self._inventory_cache is not None:
+            server_images = self._get_inventory(
+                context, 'server_images',
+                functools.partial(self._list_server_images, context))
+            if server_id in server_images:
+                return server_images[server_id]
+        return self._nova_client(context).servers.get(server_id).image
+
+    def _get_image(self, context, image_id):
+        if self._inventory_cache is not None:
+            image = self._get_images(context)[0].get(image_id)
+            if image is not None:
+                return image
+        return self._glance_client(context).images.get(image_id)
+
     def _get_dependent_resources_by_server(self,
                                            context,
                                            parent_resource):
         try:
-            server = self._nova_client(context).servers.get(parent_resource.id)
+            server_image = self._get_server_image(context, parent_resource.id)
         except Exception as e:
             LOG.exception(_LE("List all server from nova failed."))
             raise exception.ListProtectableResourceFailed(
                 type=self._SUPPORT_RESOURCE_TYPE,
                 reason=six.text_type(e))
 
-        if not server.image:
+        if not server_image:
             return []
         try:
-            image = self._glance_client(context).images.get(server.image['id'])
+            image = self._get_image(context, server_image['id'])
         except Exception as e:
             LOG.exception(_LE("Getting image from glance failed."))
             raise exception.ListProtectableResourceFailed(
@@ -78,14 +117,14 @@ class ImageProtectablePlugin(protectable_plugin.ProtectablePlugin):
                 reason=six.text_type(e))
 
         return [resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
-                                  id=server.image['id'],
+                                  id=server_image['id'],
                                   name=image.name)]
 
     def _get_dependent_resources_by_project(self,
                                             context,
                                             parent_resource):
         try:
-            images = self._glance_client(context).images.list()
+            images_by_owner = self._get_images(context)[1]
         except Exception as e:
             LOG.exception(_LE("List all images from glance failed."))
             raise exception.ListProtectableResourceFailed(
@@ -95,8 +134,7 @@ class ImageProtectablePlugin(protectable_plugin.ProtectablePlugin):
             return [resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
                                       id=image.id,
                                       name=image.name)
-                    for image in images
-                    if image.owner == parent_resource.id]
+                    for image in images_by_owner.get(parent_resource.id, ())]
 
     def show_resource(self, context, resource_id, parameters=None):
         try:
@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import six
 
 from karbor.common import constants
@@ -73,4 +74,6 @@ class ServerProtectablePlugin(protectable_plugin.ProtectablePlugin):
     def get_dependent_resources(self, context, parent_resource):
         # Utilize list_resource here, cause its function is
         # listing resources of given project
-        return self.list_resources(context)
+        return list(self._get_inventory(
+            context, 'servers',
+            functools.partial(self.list_resources, context)))
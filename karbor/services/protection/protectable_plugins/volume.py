@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
 import six
 
 from karbor.common import constants
@@ -71,17 +73,35 @@ class VolumeProtectablePlugin(protectable_plugin.ProtectablePlugin):
             return resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
                                      id=volume.id, name=volume.name)
 
-    def get_dependent_resources(self, context, parent_resource):
-        def _is_attached_to(vol):
-            if parent_resource.type == constants.SERVER_RESOURCE_TYPE:
-                return any([s.get('server_id') == parent_resource.id
-                            for s in vol.attachments])
-            if parent_resource.type == constants.PROJECT_RESOURCE_TYPE:
-                return getattr(vol, 'os-vol-tenant-attr:tenant_id') == \
-                    parent_resource.id
+    def _list_volumes(self, context):
+        return self._client(context).volumes.list(detailed=True)
+
+    def _list_volumes_by_parent(self, context, parent_type):
+        """Index the detailed volume listing by parents of parent_type."""
+        volumes = self._get_inventory(
+            context, 'volumes', functools.partial(self._list_volumes, context))
+        volumes_by_parent = collections.defaultdict(list)
+        for vol in volumes:
+            if parent_type == constants.SERVER_RESOURCE_TYPE:
+                parent_ids = set(s.get('server_id')
+                                 for s in getattr(vol, 'attachments', []))
+            elif parent_type == constants.PROJECT_RESOURCE_TYPE:
+                parent_ids = (getattr(vol, 'os-vol-tenant-attr:tenant_id',
+                                      None), )
+            else:
+                parent_ids = ()
+            volume = resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
+                                       id=vol.id, name=vol.name)
+            for parent_id in parent_ids:
+                volumes_by_parent[parent_id].append(volume)
+        return volumes_by_parent
 
+    def get_dependent_resources(self, context, parent_resource):
         try:
-            volumes = self._client(context).volumes.list(detailed=True)
+            volumes_by_parent = self._get_inventory(
+                context, 'volumes_by_%s' % parent_resource.type,
+                functools.partial(self._list_volumes_by_parent, context,
+                                  parent_resource.type))
         except Exception as e:
             LOG.exception(_LE("List all detailed volumes "
                               "from cinder failed."))
@@ -89,6 +109,4 @@ class VolumeProtectablePlugin(protectable_plugin.ProtectablePlugin):
                 type=self._SUPPORT_RESOURCE_TYPE,
                 reason=six.text_type(e))
         else:
-            return [resource.Resource(type=self._SUPPORT_RESOURCE_TYPE,
-                                      id=vol.id, name=vol.name)
-                    for vol in volumes if _is_attached_to(vol)]
+            return list(volumes_by_parent.get(parent_resource.id, ()))
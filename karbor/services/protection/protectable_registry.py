@@ -10,14 +10,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import eventlet
+
 from karbor import exception
 from karbor.i18n import _
 from karbor.services.protection.graph import build_graph
+from karbor.services.protection.protectable_plugin import InventoryCache
 import six
 
+from oslo_config import cfg
 from oslo_log import log as logging
 from stevedore import extension
 
+protectable_registry_opts = [
+    cfg.IntOpt('protectable_graph_build_concurrency',
+               default=8,
+               min=1,
+               help='The number of resources whose dependent resources '
+                    'are fetched concurrently when building a resource '
+                    'graph'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(protectable_registry_opts)
 LOG = logging.getLogger(__name__)
 
 
@@ -91,28 +107,68 @@ class ProtectableRegistry(object):
         return protectable.show_resource(context, resource_id,
                                          parameters=parameters)
 
-    def fetch_dependent_resources(self, context, resource):
+    def fetch_dependent_resources(self, context, resource,
+                                  protectables=None):
         """List dependent resources under given parent resource.
 
         :param resource: The parent resource to list dependent resources.
+        :param protectables: Optional map of resource types to the
+                             protectables to use instead of the shared ones.
         :return: The list of dependent resources.
         """
         result = []
         for plugin in six.itervalues(self._plugin_map):
             if resource.type in plugin.get_parent_resource_types():
-                protectable = self._get_protectable(
-                    context,
-                    plugin.get_resource_type())
+                resource_type = plugin.get_resource_type()
+                if protectables is not None:
+                    protectable = protectables[resource_type]
+                else:
+                    protectable = self._get_protectable(context,
+                                                        resource_type)
                 result.extend(protectable.get_dependent_resources(context,
                                                                   resource))
 
         return result
 
+    def _build_protectables(self, context):
+        """Return protectables sharing a new inventory cache."""
+        inventory_cache = InventoryCache()
+        protectables = {}
+        for resource_type, plugin in six.iteritems(self._plugin_map):
+            protectable = plugin.instance(context)
+            protectable.set_inventory_cache(inventory_cache)
+            protectables[resource_type] = protectable
+        return protectables
+
     def build_graph(self, context, resources):
-        def fetch_dependent_resources_context(resource):
-            return self.fetch_dependent_resources(context, resource)
+        """Build the graph of resources and their dependent resources.
+
+        The dependents of the nodes of each level of the graph are fetched
+        concurrently, and the protectables of a build share an inventory
+        cache, so every inventory is listed once per build instead of once
+        per node.
+        """
+        protectables = self._build_protectables(context)
+        dependents = {}
+
+        def fetch_dependent_resources(resource):
+            return resource, self.fetch_dependent_resources(context,
+                                                            resource,
+                                                            protectables)
+
+        pool = eventlet.GreenPool(CONF.protectable_graph_build_concurrency)
+        level = list(collections.OrderedDict.fromkeys(resources))
+        while level:
+            next_level = []
+            for resource, child_nodes in pool.imap(
+                    fetch_dependent_resources, level):
+                dependents[resource] = child_nodes
+                next_level.extend(child_nodes)
+            level = [child for child
+                     in collections.OrderedDict.fromkeys(next_level)
+                     if child not in dependents]
 
         return build_graph(
             start_nodes=resources,
-            get_child_nodes_func=fetch_dependent_resources_context,
+            get_child_nodes_func=dependents.__getitem__,
         )
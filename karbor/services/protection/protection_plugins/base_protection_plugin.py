@@ -15,6 +15,8 @@ import six
 
 from karbor.common import constants
 from karbor.services.protection.protection_plugin import ProtectionPlugin
+from karbor.services.protection import status_aggregator
+from karbor.services.protection import work_scheduler
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -27,6 +29,28 @@ class BaseProtectionPlugin(ProtectionPlugin):
             constants.OPERATION_RESTORE: self.restore_backup,
             constants.OPERATION_DELETE: self.delete_backup
         }
+        self._work_scheduler = None
+        self._work_owner = self.__class__.__name__
+
+    def set_work_scheduler(self, scheduler, owner=None):
+        """Run the background work of the plugin in a shared scheduler."""
+        self._work_scheduler = scheduler
+        if owner is not None:
+            self._work_owner = owner
+
+    def _submit_work(self, func, *args, **kwargs):
+        """Queue background work of the plugin.
+
+        The priority and size keyword arguments are passed to the scheduler,
+        the other arguments to func.
+        """
+        if self._work_scheduler is None:
+            self._work_scheduler = work_scheduler.WorkScheduler()
+        priority = kwargs.pop("priority", work_scheduler.PRIORITY_NORMAL)
+        size = kwargs.pop("size", 0)
+        return self._work_scheduler.submit(self._work_owner, func, args,
+                                           kwargs, priority=priority,
+                                           size=size)
 
     @abc.abstractmethod
     def create_backup(self, cntxt, checkpoint, **kwargs):
@@ -99,6 +123,16 @@ class BaseProtectionPlugin(ProtectionPlugin):
             else:
                 task_stack.pop()
 
+    @staticmethod
+    def _set_resource_status(bank_section, checkpoint_id, resource_id,
+                             status, create=False):
+        """Store the status of a resource and publish the transition."""
+        if create:
+            bank_section.create_object("status", status)
+        else:
+            bank_section.update_object("status", status)
+        status_aggregator.publish(checkpoint_id, resource_id, status)
+
     def get_resource_stats(self, checkpoint, resource_id):
         # Get the status of this resource
         bank_section = checkpoint.get_resource_bank_section(resource_id)
@@ -10,28 +10,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import eventlet
-import os
-
-from io import BytesIO
 from karbor.common import constants
 from karbor import exception
 from karbor.i18n import _LE, _LI
+from karbor.services.protection.bank_plugin import BankSegmentReader
+from karbor.services.protection.bank_plugin import BankSegmentWriter
+from karbor.services.protection.bank_plugin import BankStreamReader
+from karbor.services.protection.chunk_store import ChunkStore
 from karbor.services.protection.client_factory import ClientFactory
 from karbor.services.protection.protection_plugins.base_protection_plugin \
     import BaseProtectionPlugin
 from karbor.services.protection.protection_plugins.image \
     import image_plugin_schemas as image_schemas
+from karbor.services.protection.protection_plugins import image_waiter
 from oslo_config import cfg
 from oslo_log import log as logging
-from time import sleep
 
 protection_opts = [
     cfg.IntOpt('backup_image_object_size',
                default=52428800,
                help='The size in bytes of instance image objects'),
-    cfg.IntOpt('retry_attempts',
-               default=10)
+    cfg.IntOpt('backup_image_object_concurrency',
+               default=4,
+               help='The number of image objects which are uploaded to or '
+                    'downloaded from the bank concurrently')
 ]
 
 CONF = cfg.CONF
@@ -44,11 +46,10 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
 
     def __init__(self, config=None):
         super(GlanceProtectionPlugin, self).__init__(config)
-        self._tp = eventlet.GreenPool()
         self.data_block_size_bytes = CONF.backup_image_object_size
-
-    def _add_to_threadpool(self, func, *args, **kwargs):
-        self._tp.spawn_n(func, *args, **kwargs)
+        self.data_block_concurrency = CONF.backup_image_object_concurrency
+        self.deduplication = CONF.backup_deduplication
+        self._image_waiter = image_waiter.get_waiter()
 
     def get_resource_stats(self, checkpoint, resource_id):
         # Get the status of this resource
@@ -84,8 +85,9 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
 
         LOG.info(_LI("creating image backup, image_id: %s."), image_id)
         try:
-            bank_section.create_object("status",
-                                       constants.RESOURCE_STATUS_PROTECTING)
+            self._set_resource_status(bank_section, checkpoint.id, image_id,
+                                      constants.RESOURCE_STATUS_PROTECTING,
+                                      create=True)
             image_info = glance_client.images.get(image_id)
             image_metadata = {
                 "disk_format": image_info.disk_format,
@@ -98,53 +100,49 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
         except Exception as err:
             LOG.error(_LE("create image backup failed, image_id: %s."),
                       image_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id, image_id,
+                                      constants.RESOURCE_STATUS_ERROR)
             raise exception.CreateBackupFailed(
                 reason=err,
                 resource_id=image_id,
                 resource_type=constants.IMAGE_RESOURCE_TYPE)
 
-        self._add_to_threadpool(self._create_backup, glance_client,
-                                bank_section, image_id)
+        self._submit_work(self._create_backup, glance_client, bank_section,
+                          checkpoint.id, image_id, resource_definition,
+                          size=getattr(image_info, "size", None) or 0)
 
-    def _create_backup(self, glance_client, bank_section, image_id):
+    def _create_backup(self, glance_client, bank_section, checkpoint_id,
+                       image_id, resource_definition):
         try:
-            image_info = glance_client.images.get(image_id)
-
-            retry_attempts = CONF.retry_attempts
-            while image_info.status != "active" and retry_attempts != 0:
-                sleep(60)
-                image_info = glance_client.images.get(image_id)
-                retry_attempts -= 1
-
-            if retry_attempts == 0:
-                raise Exception
+            self._image_waiter.wait(glance_client, image_id)
 
             image_response = glance_client.images.data(image_id)
-            image_response_data = BytesIO()
-            for chunk in image_response:
-                image_response_data.write(chunk)
-            image_response_data.seek(0, os.SEEK_SET)
-
-            chunks = 0
-            while True:
-                data = image_response_data.read(self.data_block_size_bytes)
-                if data == '':
-                    break
-                bank_section.create_object("data_" + str(chunks), data)
-                chunks += 1
+            if self.deduplication:
+                chunk_store = ChunkStore(bank_section.bank)
+                resource_definition["data_chunks"] = chunk_store.write(
+                    image_response, "image_%s@%s" % (checkpoint_id, image_id),
+                    self.data_block_concurrency)
+            else:
+                # upload every data_N segment as soon as it is filled
+                writer = BankSegmentWriter(bank_section, "data_",
+                                           self.data_block_size_bytes,
+                                           self.data_block_concurrency)
+                writer.write(image_response)
+                resource_definition["data_manifest"] = writer.manifest
+
+            # record the segments so restore does not need to list them
+            bank_section.update_object("metadata", resource_definition)
 
             # update resource_definition backup_status
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_AVAILABLE)
+            self._set_resource_status(bank_section, checkpoint_id, image_id,
+                                      constants.RESOURCE_STATUS_AVAILABLE)
             LOG.info(_LI("finish backup image, image_id: %s."), image_id)
         except Exception as err:
             # update resource_definition backup_status
             LOG.error(_LE("create image backup failed, image_id: %s."),
                       image_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint_id, image_id,
+                                      constants.RESOURCE_STATUS_ERROR)
             raise exception.CreateBackupFailed(
                 reason=err,
                 resource_id=image_id,
@@ -164,16 +162,20 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
         try:
             resource_definition = bank_section.get_object('metadata')
             image_metadata = resource_definition['image_metadata']
-            objects = [key.split("/")[-1] for key in
-                       bank_section.list_objects()]
-
-            # get image_data
-            image_data = BytesIO()
-            for obj in objects:
-                if obj.find("data_") == 0:
-                    data = bank_section.get_object(obj)
-                    image_data.write(data)
-            image_data.seek(0, os.SEEK_SET)
+
+            # stream image_data from the bank
+            manifest = resource_definition.get("data_manifest")
+            chunk_list = resource_definition.get("data_chunks")
+            if chunk_list is not None:
+                segments = ChunkStore(bank_section.bank).read(
+                    chunk_list, self.data_block_concurrency)
+            elif manifest is not None:
+                segments = BankSegmentReader.from_manifest(
+                    bank_section, manifest, self.data_block_concurrency)
+            else:
+                segments = BankSegmentReader.from_listing(
+                    bank_section, "data_", self.data_block_concurrency)
+            image_data = BankStreamReader(segments)
             disk_format = image_metadata["disk_format"]
             container_format = image_metadata["container_format"]
             image = glance_client.images.create(
@@ -182,14 +184,7 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
                 name=name)
             glance_client.images.upload(image.id, image_data)
 
-            image_info = glance_client.images.get(image.id)
-            retry_attempts = CONF.retry_attempts
-            while image_info.status != "active" and retry_attempts != 0:
-                sleep(60)
-                image_info = glance_client.images.get(image.id)
-                retry_attempts -= 1
-            if retry_attempts == 0:
-                raise Exception
+            self._image_waiter.wait(glance_client, image.id)
 
             heat_template.put_parameter(original_image_id, image.id)
         except Exception as e:
@@ -201,6 +196,13 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
                 resource_type=constants.IMAGE_RESOURCE_TYPE
             )
 
+    def _get_chunk_list(self, bank_section):
+        try:
+            resource_definition = bank_section.get_object("metadata")
+            return resource_definition.get("data_chunks")
+        except Exception:
+            return None
+
     def delete_backup(self, cntxt, checkpoint, **kwargs):
         resource_node = kwargs.get("node")
         image_id = resource_node.value.id
@@ -209,20 +211,22 @@ class GlanceProtectionPlugin(BaseProtectionPlugin):
         LOG.info(_LI("deleting image backup failed, image_id: %s."),
                  image_id)
         try:
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_DELETING)
+            self._set_resource_status(bank_section, checkpoint.id, image_id,
+                                      constants.RESOURCE_STATUS_DELETING)
+            chunk_list = self._get_chunk_list(bank_section)
+            if chunk_list is not None:
+                ChunkStore(bank_section.bank).release(
+                    chunk_list, self.data_block_concurrency)
             objects = bank_section.list_objects()
-            for obj in objects:
-                if obj == "status":
-                    continue
-                bank_section.delete_object(obj)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_DELETED)
+            bank_section.delete_objects(
+                [obj for obj in objects if obj != "status"])
+            self._set_resource_status(bank_section, checkpoint.id, image_id,
+                                      constants.RESOURCE_STATUS_DELETED)
         except Exception as err:
             LOG.error(_LE("delete image backup failed, image_id: %s."),
                       image_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id, image_id,
+                                      constants.RESOURCE_STATUS_ERROR)
             raise exception.DeleteBackupFailed(
                 reason=err,
                 resource_id=image_id,
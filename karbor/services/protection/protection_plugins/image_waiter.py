@@ -0,0 +1,167 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from eventlet import event
+import six
+
+from karbor import exception
+from karbor.i18n import _, _LW
+from oslo_config import cfg
+from oslo_log import log as logging
+
+image_waiter_opts = [
+    cfg.FloatOpt('image_ready_poll_min_interval',
+                 default=0.5,
+                 help='The interval in seconds after which the status of an '
+                      'image is polled first while waiting for it to be '
+                      'ready. It doubles on every poll.'),
+    cfg.FloatOpt('image_ready_poll_max_interval',
+                 default=30,
+                 help='The maximal interval in seconds between two polls of '
+                      'the status of an image.'),
+    cfg.IntOpt('image_ready_timeout',
+               default=600,
+               help='The number of seconds after which waiting for an image '
+                    'to be ready fails.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_waiter_opts)
+LOG = logging.getLogger(__name__)
+
+IMAGE_FAILED_STATUSES = ("killed", "deleted", "pending_delete",
+                         "deactivated")
+
+
+def image_active(image):
+    return image.status == "active"
+
+
+class _PendingImage(object):
+    __slots__ = ("client", "image_id", "is_ready", "event", "interval",
+                 "next_poll", "deadline")
+
+    def __init__(self, client, image_id, is_ready, interval, now, timeout):
+        self.client = client
+        self.image_id = image_id
+        self.is_ready = is_ready
+        self.event = event.Event()
+        self.interval = interval
+        self.next_poll = now + interval
+        self.deadline = now + timeout
+
+
+class ImageReadinessWaiter(object):
+    """Wait for glance images to be ready.
+
+    The images waited for by every green thread are polled by a single
+    loop. An image is polled min_interval seconds after the wait starts,
+    then the interval doubles up to max_interval, so small images are
+    noticed within a second and long running ones cost few requests.
+    """
+    poll_concurrency = 8
+
+    def __init__(self, min_interval, max_interval):
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        self._pending = set()
+        self._wakeup = event.Event()
+        self._running = False
+
+    def wait(self, client, image_id, is_ready=image_active, timeout=None):
+        """Block the calling green thread until the image is ready.
+
+        :param is_ready: a callable telling if the image got ready
+        :param timeout: the deadline of the wait in seconds
+        :return: the image once it is ready
+        :raise ImageNotReady: if the image failed or the deadline expired
+        """
+        if timeout is None:
+            timeout = CONF.image_ready_timeout
+        pending = _PendingImage(client, image_id, is_ready,
+                                self._min_interval, time.time(), timeout)
+        self._pending.add(pending)
+        if not self._running:
+            self._running = True
+            eventlet.spawn_n(self._run)
+        elif not self._wakeup.ready():
+            self._wakeup.send()
+        return pending.event.wait()
+
+    def _run(self):
+        try:
+            while self._pending:
+                timeout = min(min(pending.next_poll, pending.deadline)
+                              for pending in self._pending) - time.time()
+                if timeout > 0:
+                    with eventlet.Timeout(timeout, False):
+                        self._wakeup.wait()
+                    if self._wakeup.ready():
+                        self._wakeup = event.Event()
+                    continue
+                self.poll()
+        finally:
+            self._running = False
+
+    def _poll_image(self, pending):
+        try:
+            return pending, pending.client.images.get(pending.image_id), None
+        except Exception as exc:
+            return pending, None, exc
+
+    def poll(self, now=None):
+        """Poll the images which are due and resume their waiters."""
+        now = now or time.time()
+        due = [pending for pending in self._pending
+               if pending.next_poll <= now or pending.deadline <= now]
+        pool = eventlet.GreenPool(self.poll_concurrency)
+        for pending, image, exc in pool.imap(self._poll_image, due):
+            if image is not None and pending.is_ready(image):
+                self._pending.discard(pending)
+                pending.event.send(image)
+                continue
+
+            if image is None:
+                LOG.warning(_LW("Getting image %(image_id)s failed: "
+                                "%(exc)s"),
+                            {"image_id": pending.image_id,
+                             "exc": six.text_type(exc)})
+                reason = None
+            elif image.status in IMAGE_FAILED_STATUSES:
+                reason = _("image status is %s") % image.status
+            else:
+                reason = None
+            if reason is None and pending.deadline <= now:
+                reason = _("timed out")
+            if reason is not None:
+                self._pending.discard(pending)
+                pending.event.send_exception(exception.ImageNotReady(
+                    image_id=pending.image_id, reason=reason))
+                continue
+
+            pending.interval = min(pending.interval * 2, self._max_interval)
+            pending.next_poll = min(now + pending.interval, pending.deadline)
+
+
+_waiter = None
+
+
+def get_waiter():
+    """Return the image readiness waiter shared by the plugins."""
+    global _waiter
+    if _waiter is None:
+        _waiter = ImageReadinessWaiter(CONF.image_ready_poll_min_interval,
+                                       CONF.image_ready_poll_max_interval)
+    return _waiter
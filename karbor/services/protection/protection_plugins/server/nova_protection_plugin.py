@@ -10,17 +10,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import eventlet
-from io import BytesIO
-import os
-from time import sleep
-
 from karbor.common import constants
 from karbor import exception
 from karbor.i18n import _LE, _LI
+from karbor.services.protection.bank_plugin import BankSegmentReader
+from karbor.services.protection.bank_plugin import BankSegmentWriter
+from karbor.services.protection.bank_plugin import BankStreamReader
+from karbor.services.protection.chunk_store import ChunkStore
 from karbor.services.protection.client_factory import ClientFactory
 from karbor.services.protection.protection_plugins.base_protection_plugin \
     import BaseProtectionPlugin
+from karbor.services.protection.protection_plugins import image_waiter
 from karbor.services.protection.protection_plugins.server \
     import server_plugin_schemas
 from karbor.services.protection.restore_heat import HeatResource
@@ -31,7 +31,11 @@ from oslo_utils import uuidutils
 protection_opts = [
     cfg.IntOpt('backup_image_object_size',
                default=52428800,
-               help='The size in bytes of instance image objects')
+               help='The size in bytes of instance image objects'),
+    cfg.IntOpt('backup_image_object_concurrency',
+               default=4,
+               help='The number of image objects which are uploaded to or '
+                    'downloaded from the bank concurrently')
 ]
 
 CONF = cfg.CONF
@@ -47,11 +51,10 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
 
     def __init__(self, config=None):
         super(NovaProtectionPlugin, self).__init__(config)
-        self._tp = eventlet.GreenPool()
         self.image_object_size = CONF.backup_image_object_size
-
-    def _add_to_threadpool(self, func, *args, **kwargs):
-        self._tp.spawn_n(func, *args, **kwargs)
+        self.image_object_concurrency = CONF.backup_image_object_concurrency
+        self.deduplication = CONF.backup_deduplication
+        self._image_waiter = image_waiter.get_waiter()
 
     def get_options_schema(self, resource_type):
         return server_plugin_schemas.OPTIONS_SCHEMA
@@ -72,12 +75,56 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
     def _nova_client(self, cntxt):
         return ClientFactory.create_client("nova", cntxt)
 
-    def _cinder_client(self, cntxt):
-        return ClientFactory.create_client("cinder", cntxt)
-
     def _neutron_client(self, cntxt):
         return ClientFactory.create_client("neutron", cntxt)
 
+    def _get_attach_metadata(self, nova_client, server_id, child_nodes):
+        """Return the devices of the volumes of child_nodes, by volume id.
+
+        The attachments of every volume of the server are listed by a
+        single request, whatever the number of volumes.
+        """
+        volume_ids = set(child_node.value.id for child_node in child_nodes
+                         if child_node.value.type ==
+                         constants.VOLUME_RESOURCE_TYPE)
+        if not volume_ids:
+            return {}
+        return {attachment.volumeId: attachment.device
+                for attachment in nova_client.volumes.get_server_volumes(
+                    server_id)
+                if attachment.volumeId in volume_ids}
+
+    def _get_server_networks(self, neutron_client, server_id, addresses):
+        """Return the networks and the floating ips of a server.
+
+        The networks of the fixed ips are resolved from the ports of the
+        server, listed by a single request. Only a fixed ip whose port is
+        not bound to the server is looked up by its mac address.
+        """
+        networks = []
+        floating_ips = []
+        ports_by_mac = None
+        for network_infos in addresses.values():
+            for network_info in network_infos:
+                addr = network_info.get("addr")
+                mac = network_info.get("OS-EXT-IPS-MAC:mac_addr")
+                network_type = network_info.get("OS-EXT-IPS:type")
+                if network_type == 'fixed':
+                    if ports_by_mac is None:
+                        ports_by_mac = {
+                            port["mac_address"]: port
+                            for port in neutron_client.list_ports(
+                                device_id=server_id)["ports"]}
+                    port = ports_by_mac.get(mac)
+                    if port is None:
+                        port = neutron_client.list_ports(
+                            mac_address=mac)["ports"][0]
+                    if port["network_id"] not in networks:
+                        networks.append(port["network_id"])
+                elif network_type == "floating":
+                    floating_ips.append(addr)
+        return networks, floating_ips
+
     def create_backup(self, cntxt, checkpoint, **kwargs):
         resource_node = kwargs.get("node")
         server_id = resource_node.value.id
@@ -86,48 +133,25 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
 
         nova_client = self._nova_client(cntxt)
         glance_client = self._glance_client(cntxt)
-        cinder_client = self._cinder_client(cntxt)
         neutron_client = self._neutron_client(cntxt)
 
         resource_definition = {"resource_id": server_id}
         child_nodes = resource_node.child_nodes
-        attach_metadata = {}
 
         LOG.info(_LI("creating server backup, server_id: %s."), server_id)
 
         try:
-            bank_section.create_object("status",
-                                       constants.RESOURCE_STATUS_PROTECTING)
-
-            for child_node in child_nodes:
-                child_resource = child_node.value
-                if child_resource.type == constants.VOLUME_RESOURCE_TYPE:
-                    volume = cinder_client.volumes.get(child_resource.id)
-                    attachments = getattr(volume, "attachments")
-                    for attachment in attachments:
-                        if attachment["server_id"] == server_id:
-                            attach_metadata[child_resource.id] = attachment[
-                                "device"]
-            resource_definition["attach_metadata"] = attach_metadata
+            self._set_resource_status(bank_section, checkpoint.id, server_id,
+                                      constants.RESOURCE_STATUS_PROTECTING,
+                                      create=True)
 
             server = nova_client.servers.get(server_id)
             availability_zone = getattr(server, "OS-EXT-AZ:availability_zone")
 
-            addresses = getattr(server, "addresses")
-            networks = []
-            floating_ips = []
-            for network_infos in addresses.values():
-                for network_info in network_infos:
-                    addr = network_info.get("addr")
-                    mac = network_info.get("OS-EXT-IPS-MAC:mac_addr")
-                    network_type = network_info.get("OS-EXT-IPS:type")
-                    if network_type == 'fixed':
-                        port = neutron_client.list_ports(
-                            mac_address=mac)["ports"][0]
-                        if port["network_id"] not in networks:
-                            networks.append(port["network_id"])
-                    elif network_type == "floating":
-                        floating_ips.append(addr)
+            resource_definition["attach_metadata"] = \
+                self._get_attach_metadata(nova_client, server_id, child_nodes)
+            networks, floating_ips = self._get_server_networks(
+                neutron_client, server_id, getattr(server, "addresses"))
 
             flavor = getattr(server, "flavor")["id"]
             key_name = getattr(server, "key_name", None)
@@ -149,29 +173,24 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
         except Exception as err:
             # update resource_definition backup_status
             LOG.error(_LE("create backup failed, server_id: %s."), server_id)
-            bank_section.create_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id, server_id,
+                                      constants.RESOURCE_STATUS_ERROR,
+                                      create=True)
             raise exception.CreateBackupFailed(
                 reason=err,
                 resource_id=server_id,
                 resource_type=constants.SERVER_RESOURCE_TYPE)
 
-        self._add_to_threadpool(self._create_backup, glance_client,
-                                bank_section, server_id, snapshot_id,
-                                resource_definition, checkpoint)
+        self._submit_work(self._create_backup, glance_client, bank_section,
+                          server_id, snapshot_id, resource_definition,
+                          checkpoint)
 
     def _create_backup(self, glance_client, bank_section, server_id,
                        snapshot_id, resource_definition, checkpoint):
         try:
-            image = glance_client.images.get(snapshot_id)
-            # TODO(luobin): config retry_attempts
-            retry_attempts = 10
-            while image.status == "queued" and retry_attempts != 0:
-                sleep(60)
-                image = glance_client.images.get(snapshot_id)
-                retry_attempts -= 1
-            if retry_attempts == 0:
-                raise Exception
+            image = self._image_waiter.wait(
+                glance_client, snapshot_id,
+                is_ready=lambda image: image.status != "queued")
 
             resource_definition["snapshot_id"] = snapshot_id
             snapshot_metadata = {
@@ -202,81 +221,62 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
             # write resource_definition in bank
             bank_section.create_object("metadata", resource_definition)
 
-            image = glance_client.images.get(snapshot_id)
-            # TODO(luobin): config retry_attempts
-            retry_attempts = 10
-            while image.status != "active" and retry_attempts != 0:
-                sleep(60)
-                image = glance_client.images.get(snapshot_id)
-                retry_attempts -= 1
-            if retry_attempts == 0:
-                raise Exception
+            image = self._image_waiter.wait(glance_client, snapshot_id)
 
             # store kernel_data if need
             if getattr(image, "kernel_id", None) is not None:
                 kernel_id = image.kernel_id
                 kernel_response = glance_client.images.data(kernel_id)
-                kernel_response_data = BytesIO()
-                for chunk in kernel_response:
-                    kernel_response_data.write(chunk)
-                kernel_response_data.seek(0, os.SEEK_SET)
-
-                chunks = 0
-                while True:
-                    data = kernel_response_data.read(self.image_object_size)
-                    if data == '':
-                        break
-                    bank_section.create_object("kernel_" + str(chunks), data)
-                    chunks += 1
+                self._backup_image_data(bank_section, "kernel_",
+                                        snapshot_metadata["kernel_metadata"],
+                                        kernel_response)
 
             # store ramdisk_data if need
             if getattr(image, "ramdisk_id", None) is not None:
                 ramdisk_id = image.ramdisk_id
                 ramdisk_response = glance_client.images.data(ramdisk_id)
-                ramdisk_response_data = BytesIO()
-                for chunk in ramdisk_response:
-                    ramdisk_response_data.write(chunk)
-                ramdisk_response_data.seek(0, os.SEEK_SET)
-
-                chunks = 0
-                while True:
-                    data = ramdisk_response_data.read(self.image_object_size)
-                    if data == '':
-                        break
-                    bank_section.create_object("ramdisk_" + str(chunks), data)
-                    chunks += 1
+                self._backup_image_data(bank_section, "ramdisk_",
+                                        snapshot_metadata["ramdisk_metadata"],
+                                        ramdisk_response)
 
             # store snapshot_data
             image_response = glance_client.images.data(snapshot_id)
-            image_response_data = BytesIO()
-            for chunk in image_response:
-                image_response_data.write(chunk)
-            image_response_data.seek(0, os.SEEK_SET)
-
-            chunks = 0
-            while True:
-                data = image_response_data.read(self.image_object_size)
-                if data == '':
-                    break
-                bank_section.create_object("snapshot_" + str(chunks), data)
-                chunks += 1
+            self._backup_image_data(bank_section, "snapshot_",
+                                    snapshot_metadata, image_response)
+
+            # record the segments so restore does not need to list them
+            bank_section.update_object("metadata", resource_definition)
 
             glance_client.images.delete(snapshot_id)
 
             # update resource_definition backup_status
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_AVAILABLE)
+            self._set_resource_status(bank_section, checkpoint.id, server_id,
+                                      constants.RESOURCE_STATUS_AVAILABLE)
             LOG.info(_LI("finish backup server, server_id: %s."), server_id)
         except Exception as err:
             LOG.error(_LE("create backup failed, server_id: %s."), server_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id, server_id,
+                                      constants.RESOURCE_STATUS_ERROR)
 
             raise exception.CreateBackupFailed(
                 reason=err,
                 resource_id=server_id,
                 resource_type=constants.SERVER_RESOURCE_TYPE)
 
+    def _backup_image_data(self, bank_section, prefix, image_metadata,
+                           image_response):
+        if self.deduplication:
+            chunk_store = ChunkStore(bank_section.bank)
+            image_metadata["chunks"] = chunk_store.write(
+                image_response, image_metadata["name"],
+                self.image_object_concurrency)
+        else:
+            writer = BankSegmentWriter(bank_section, prefix,
+                                       self.image_object_size,
+                                       self.image_object_concurrency)
+            writer.write(image_response)
+            image_metadata["manifest"] = writer.manifest
+
     def restore_backup(self, cntxt, checkpoint, **kwargs):
         resource_node = kwargs.get("node")
         original_server_id = resource_node.value.id
@@ -323,44 +323,32 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
         snapshot_metadata = resource_definition["snapshot_metadata"]
 
         glance_client = self._glance_client(cntxt)
-        objects = [key.split("/")[-1] for key in
-                   bank_section.list_objects()]
 
         # restore kernel if needed
         kernel_id = None
         if snapshot_metadata.get("kernel_metadata") is not None:
             kernel_id = self._restore_image(
                 bank_section, checkpoint, glance_client, "kernel",
-                snapshot_metadata["kernel_metadata"], objects,
-                original_id)
+                snapshot_metadata["kernel_metadata"], original_id)
 
         # restore ramdisk if needed
         ramdisk_id = None
         if snapshot_metadata.get("ramdisk_metadata") is not None:
             ramdisk_id = self._restore_image(
                 bank_section, checkpoint, glance_client, "ramdisk",
-                snapshot_metadata["ramdisk_metadata"], objects,
-                original_id)
+                snapshot_metadata["ramdisk_metadata"], original_id)
 
         # restore image
         image_id = self._restore_image(
             bank_section, checkpoint, glance_client, "snapshot",
-            snapshot_metadata, objects, original_id,
+            snapshot_metadata, original_id,
             kernel_id=kernel_id, ramdisk_id=ramdisk_id)
 
-        image_info = glance_client.images.get(image_id)
-        retry_attempts = 10
-        while image_info.status != "active" and retry_attempts != 0:
-            sleep(60)
-            image_info = glance_client.images.get(image_id)
-            retry_attempts -= 1
-        if retry_attempts == 0:
-            raise Exception
+        self._image_waiter.wait(glance_client, image_id)
         return image_id
 
     def _restore_image(self, bank_section, checkpoint, glance_client,
-                       image_format, image_metadata, objects, original_id,
-                       **kwargs):
+                       image_format, image_metadata, original_id, **kwargs):
         if image_metadata.get("name") is None:
             name = "%s_%s@%s" % (image_format, checkpoint.id,
                                  original_id)
@@ -368,12 +356,18 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
             name = image_metadata["name"]
         disk_format = image_metadata["disk_format"]
         container_format = image_metadata["container_format"]
-        image_data = BytesIO()
-        for obj in objects:
-            if obj.find("%s_" % image_format) == 0:
-                data = bank_section.get_object(obj)
-                image_data.write(data)
-        image_data.seek(0, os.SEEK_SET)
+        manifest = image_metadata.get("manifest")
+        if image_metadata.get("chunks") is not None:
+            segments = ChunkStore(bank_section.bank).read(
+                image_metadata["chunks"], self.image_object_concurrency)
+        elif manifest is not None:
+            segments = BankSegmentReader.from_manifest(
+                bank_section, manifest, self.image_object_concurrency)
+        else:
+            segments = BankSegmentReader.from_listing(
+                bank_section, "%s_" % image_format,
+                self.image_object_concurrency)
+        image_data = BankStreamReader(segments)
         image = glance_client.images.create(
             disk_format=disk_format,
             container_format=container_format,
@@ -460,6 +454,18 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
                 "%s_%s" % (original_server_id, floating_ip),
                 heat_floating_resource)
 
+    def _get_chunk_lists(self, bank_section):
+        try:
+            resource_definition = bank_section.get_object("metadata")
+            snapshot_metadata = resource_definition["snapshot_metadata"]
+        except Exception:
+            return []
+        image_metadatas = [snapshot_metadata,
+                           snapshot_metadata.get("kernel_metadata") or {},
+                           snapshot_metadata.get("ramdisk_metadata") or {}]
+        return [image_metadata["chunks"] for image_metadata in image_metadatas
+                if image_metadata.get("chunks") is not None]
+
     def delete_backup(self, cntxt, checkpoint, **kwargs):
         resource_node = kwargs.get("node")
         resource_id = resource_node.value.id
@@ -468,20 +474,22 @@ class NovaProtectionPlugin(BaseProtectionPlugin):
         LOG.info(_LI("deleting server backup, server_id: %s."), resource_id)
 
         try:
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_DELETING)
+            self._set_resource_status(bank_section, checkpoint.id, resource_id,
+                                      constants.RESOURCE_STATUS_DELETING)
+            chunk_store = ChunkStore(bank_section.bank)
+            for chunk_list in self._get_chunk_lists(bank_section):
+                chunk_store.release(chunk_list,
+                                    self.image_object_concurrency)
             objects = bank_section.list_objects()
-            for obj in objects:
-                if obj == "status":
-                    continue
-                bank_section.delete_object(obj)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_DELETED)
+            bank_section.delete_objects(
+                [obj for obj in objects if obj != "status"])
+            self._set_resource_status(bank_section, checkpoint.id, resource_id,
+                                      constants.RESOURCE_STATUS_DELETED)
         except Exception as err:
             # update resource_definition backup_status
             LOG.error(_LE("delete backup failed, server_id: %s."), resource_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id, resource_id,
+                                      constants.RESOURCE_STATUS_ERROR)
             raise exception.DeleteBackupFailed(
                 reason=err,
                 resource_id=resource_id,
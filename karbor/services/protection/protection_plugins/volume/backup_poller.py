@@ -0,0 +1,167 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import eventlet
+from eventlet import event
+import six
+
+from cinderclient.exceptions import NotFound
+from karbor.i18n import _LE
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+BACKUP_FINAL_STATUSES = ("available", "error", "error-deleting",
+                         "error_deleting")
+
+
+class _WatchedBackup(object):
+    __slots__ = ("backup_id", "callback", "event", "interval", "next_poll")
+
+    def __init__(self, backup_id, callback, interval, now):
+        self.backup_id = backup_id
+        self.callback = callback
+        self.event = event.Event()
+        self.interval = interval
+        self.next_poll = now + interval
+
+
+class BackupStatusPoller(object):
+    """Poll the status of in-flight cinder backups in batches.
+
+    Backups are grouped by project, and every due group costs a single
+    backups.list call, whatever the number of backups in it. Cinder has no
+    filter for a list of backup ids, so listings are matched locally, and
+    only backups missing from a listing are fetched one by one. A backup is
+    polled every min_interval seconds at first, the interval doubling up to
+    max_interval while it is in progress.
+    """
+    def __init__(self, min_interval, max_interval):
+        self._min_interval = min_interval
+        self._max_interval = max(min_interval, max_interval)
+        # project -> {backup_id: _WatchedBackup}
+        self._groups = {}
+        # project -> the most recent client of the project
+        self._clients = {}
+        self._wakeup = event.Event()
+        self._running = False
+
+    def watch(self, project_id, client, backup_id, callback=None):
+        """Poll backup_id until it reaches a final status.
+
+        callback is called with the backup in its final status, or None if
+        the backup does not exist anymore.
+
+        :return: an event sent the same value as callback
+        """
+        watched = _WatchedBackup(backup_id, callback, self._min_interval,
+                                 time.time())
+        self._groups.setdefault(project_id, {})[backup_id] = watched
+        self._clients[project_id] = client
+        if not self._running:
+            self._running = True
+            eventlet.spawn_n(self._run)
+        elif not self._wakeup.ready():
+            self._wakeup.send()
+        return watched.event
+
+    def _run(self):
+        try:
+            while self._groups:
+                timeout = min(watched.next_poll
+                              for group in self._groups.values()
+                              for watched in group.values()) - time.time()
+                if timeout > 0:
+                    with eventlet.Timeout(timeout, False):
+                        self._wakeup.wait()
+                    if self._wakeup.ready():
+                        self._wakeup = event.Event()
+                    continue
+                self.poll()
+        finally:
+            self._running = False
+
+    def _backoff(self, watched, now):
+        watched.interval = min(watched.interval * 2, self._max_interval)
+        watched.next_poll = now + watched.interval
+
+    def _finish(self, group, watched, backup):
+        group.pop(watched.backup_id, None)
+        if watched.callback is not None:
+            try:
+                watched.callback(backup)
+            except Exception:
+                LOG.exception(_LE("Handling the status of backup %s "
+                                  "failed"), watched.backup_id)
+        watched.event.send(backup)
+
+    def _get_backup(self, client, backup_id):
+        try:
+            return client.backups.get(backup_id)
+        except NotFound:
+            return None
+
+    def poll(self, now=None):
+        """Poll the backups which are due, a list call per project."""
+        now = now or time.time()
+        for project_id, group in list(self._groups.items()):
+            due = [watched for watched in group.values()
+                   if watched.next_poll <= now]
+            if not due:
+                continue
+            client = self._clients[project_id]
+            try:
+                backups = {backup.id: backup
+                           for backup in client.backups.list()}
+            except Exception as exc:
+                LOG.error(_LE("listing volume backups failed, project: "
+                              "%(project_id)s, exc: %(exc)s"),
+                          {"project_id": project_id,
+                           "exc": six.text_type(exc)})
+                for watched in due:
+                    self._backoff(watched, now)
+                continue
+
+            for watched in due:
+                backup = backups.get(watched.backup_id)
+                if backup is None:
+                    try:
+                        backup = self._get_backup(client, watched.backup_id)
+                    except Exception as exc:
+                        LOG.error(_LE("getting volume backup failed, "
+                                      "backup id: %(backup_id)s, exc: "
+                                      "%(exc)s"),
+                                  {"backup_id": watched.backup_id,
+                                   "exc": six.text_type(exc)})
+                        self._backoff(watched, now)
+                        continue
+                if backup is None or backup.status in BACKUP_FINAL_STATUSES:
+                    self._finish(group, watched, backup)
+                else:
+                    self._backoff(watched, now)
+
+            if not group:
+                self._groups.pop(project_id, None)
+                self._clients.pop(project_id, None)
+
+
+_poller = None
+
+
+def get_poller(min_interval, max_interval):
+    """Return the poller shared by the cinder protection plugins."""
+    global _poller
+    if _poller is None:
+        _poller = BackupStatusPoller(min_interval, max_interval)
+    return _poller
@@ -10,28 +10,35 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import functools
 import six
 
-from cinderclient.exceptions import NotFound
 from karbor.common import constants
 from karbor import exception
 from karbor.i18n import _LE, _LI
 from karbor.services.protection.client_factory import ClientFactory
 from karbor.services.protection.protection_plugins.base_protection_plugin \
     import BaseProtectionPlugin
+from karbor.services.protection.protection_plugins.volume \
+    import backup_poller
 from karbor.services.protection.protection_plugins.volume \
     import volume_plugin_cinder_schemas as cinder_schemas
 from karbor.services.protection.restore_heat import HeatResource
 from oslo_config import cfg
 from oslo_log import log as logging
-from oslo_service import loopingcall
 from oslo_utils import uuidutils
 
 
 protection_opts = [
     cfg.IntOpt('protection_sync_interval',
                default=60,
-               help='update protection status interval')
+               help='update protection status interval'),
+    cfg.IntOpt('protection_sync_min_interval',
+               default=5,
+               help='The interval in seconds at which the status of a new '
+                    'volume backup is polled first. It doubles up to '
+                    'protection_sync_interval while the backup is in '
+                    'progress.'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(protection_opts)
@@ -44,13 +51,10 @@ class CinderProtectionPlugin(BaseProtectionPlugin):
 
     def __init__(self, config=None):
         super(CinderProtectionPlugin, self).__init__(config)
-        self.protection_resource_map = {}
         self.protection_sync_interval = CONF.protection_sync_interval
-
-        sync_status_loop = loopingcall.FixedIntervalLoopingCall(
-            self.sync_status)
-        sync_status_loop.start(interval=self.protection_sync_interval,
-                               initial_delay=self.protection_sync_interval)
+        self._backup_poller = backup_poller.get_poller(
+            CONF.protection_sync_min_interval,
+            self.protection_sync_interval)
 
     def get_supported_resources_types(self):
         return self._SUPPORT_RESOURCE_TYPES
@@ -84,25 +88,25 @@ class CinderProtectionPlugin(BaseProtectionPlugin):
 
         LOG.info(_LI("creating volume backup, volume_id: %s."), volume_id)
         try:
-            bank_section.create_object("status",
-                                       constants.RESOURCE_STATUS_PROTECTING)
+            self._set_resource_status(bank_section, checkpoint.id,
+                                      volume_id,
+                                      constants.RESOURCE_STATUS_PROTECTING,
+                                      create=True)
 
             backup = cinder_client.backups.create(volume_id=volume_id,
                                                   name=backup_name,
                                                   force=True)
             resource_definition["backup_id"] = backup.id
             bank_section.create_object("metadata", resource_definition)
-            self.protection_resource_map[volume_id] = {
-                "bank_section": bank_section,
-                "backup_id": backup.id,
-                "cinder_client": cinder_client,
-                "operation": "create"
-            }
+            self._watch_backup(cntxt, cinder_client, backup.id,
+                               checkpoint.id, volume_id, bank_section,
+                               "create")
         except Exception as e:
             LOG.error(_LE("create volume backup failed, volume_id: %s."),
                       volume_id)
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id,
+                                      volume_id,
+                                      constants.RESOURCE_STATUS_ERROR)
             raise exception.CreateBackupFailed(
                 reason=six.text_type(e),
                 resource_id=volume_id,
@@ -117,23 +121,22 @@ class CinderProtectionPlugin(BaseProtectionPlugin):
         cinder_client = self._cinder_client(cntxt)
         LOG.info(_LI("deleting volume backup, volume_id: %s."), resource_id)
         try:
-            bank_section.update_object("status",
-                                       constants.RESOURCE_STATUS_DELETING)
+            self._set_resource_status(bank_section, checkpoint.id,
+                                      resource_id,
+                                      constants.RESOURCE_STATUS_DELETING)
             resource_definition = bank_section.get_object("metadata")
             backup_id = resource_definition["backup_id"]
             cinder_client.backups.delete(backup_id)
             bank_section.delete_object("metadata")
-            self.protection_resource_map[resource_id] = {
-                "bank_section": bank_section,
-                "backup_id": backup_id,
-                "cinder_client": cinder_client,
-                "operation": "delete"
-            }
+            self._watch_backup(cntxt, cinder_client, backup_id,
+                               checkpoint.id, resource_id, bank_section,
+                               "delete")
         except Exception as e:
             LOG.error(_LE("delete volume backup failed, volume_id: %s."),
                       resource_id)
-            bank_section.update_object("status",
-                                       constants.CHECKPOINT_STATUS_ERROR)
+            self._set_resource_status(bank_section, checkpoint.id,
+                                      resource_id,
+                                      constants.CHECKPOINT_STATUS_ERROR)
 
             raise exception.DeleteBackupFailed(
                 reason=six.text_type(e),
@@ -141,35 +144,36 @@ class CinderProtectionPlugin(BaseProtectionPlugin):
                 resource_type=constants.VOLUME_RESOURCE_TYPE
             )
 
-    def sync_status(self):
-        for resource_id, resource_info in self.protection_resource_map.items():
-            backup_id = resource_info["backup_id"]
-            bank_section = resource_info["bank_section"]
-            cinder_client = resource_info["cinder_client"]
-            operation = resource_info["operation"]
-            try:
-                backup = cinder_client.backups.get(backup_id)
-                if backup.status == "available":
-                    bank_section.update_object(
-                        "status", constants.RESOURCE_STATUS_AVAILABLE)
-                    self.protection_resource_map.pop(resource_id)
-                elif backup.status in ["error", "error-deleting"]:
-                    bank_section.update_object(
-                        "status", constants.RESOURCE_STATUS_ERROR)
-                    self.protection_resource_map.pop(resource_id)
-                else:
-                    continue
-            except Exception as exc:
-                if operation == "delete" and type(exc) == NotFound:
-                    bank_section.update_object(
-                        "status",
-                        constants.RESOURCE_STATUS_DELETED)
-                    LOG.info(_LI("deleting volume backup finished, "
-                                 "backup id: %s"), backup_id)
-                else:
-                    LOG.error(_LE("deleting volume backup error.exc: %s"),
-                              six.text_type(exc))
-                self.protection_resource_map.pop(resource_id)
+    def _watch_backup(self, cntxt, cinder_client, backup_id, checkpoint_id,
+                      resource_id, bank_section, operation):
+        callback = functools.partial(self._on_backup_status, checkpoint_id,
+                                     resource_id, bank_section, operation)
+        return self._backup_poller.watch(cntxt.project_id, cinder_client,
+                                         backup_id, callback)
+
+    def _on_backup_status(self, checkpoint_id, resource_id, bank_section,
+                          operation, backup):
+        if backup is None:
+            if operation == "delete":
+                self._set_resource_status(
+                    bank_section, checkpoint_id, resource_id,
+                    constants.RESOURCE_STATUS_DELETED)
+                LOG.info(_LI("deleting volume backup finished, "
+                             "volume_id: %s"), resource_id)
+            else:
+                LOG.error(_LE("volume backup not found, volume_id: %s"),
+                          resource_id)
+                self._set_resource_status(
+                    bank_section, checkpoint_id, resource_id,
+                    constants.RESOURCE_STATUS_ERROR)
+        elif backup.status == "available":
+            self._set_resource_status(
+                bank_section, checkpoint_id, resource_id,
+                constants.RESOURCE_STATUS_AVAILABLE)
+        else:
+            self._set_resource_status(
+                bank_section, checkpoint_id, resource_id,
+                constants.RESOURCE_STATUS_ERROR)
 
     def restore_backup(self, cntxt, checkpoint, **kwargs):
         resource_node = kwargs.get("node")
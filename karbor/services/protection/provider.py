@@ -16,6 +16,7 @@ from karbor.common import constants
 from karbor import exception
 from karbor.i18n import _, _LE
 from karbor.resource import Resource
+from karbor.services.protection import bank_codec
 from karbor.services.protection import bank_plugin
 from karbor.services.protection.checkpoint import CheckpointCollection
 from karbor.services.protection.graph import GraphWalker
@@ -23,6 +24,7 @@ from karbor.services.protection.protectable_registry import ProtectableRegistry
 from karbor.services.protection.resource_graph import ResourceGraphContext
 from karbor.services.protection.resource_graph \
     import ResourceGraphWalkerListener
+from karbor.services.protection import work_scheduler
 from karbor import utils
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -42,7 +44,33 @@ provider_opts = [
                help='the name of provider'),
     cfg.StrOpt('id',
                default='',
-               help='the provider id')
+               help='the provider id'),
+    cfg.FloatOpt('bank_write_behind_window',
+                 default=0,
+                 min=0,
+                 help='Queue bank object writes for this many seconds and '
+                      'coalesce repeated writes to the same object before '
+                      'storing them in the background. 0 writes objects '
+                      'synchronously.'),
+    cfg.StrOpt('bank_object_codec',
+               default=bank_codec.CODEC_NONE,
+               choices=[bank_codec.CODEC_NONE, bank_codec.CODEC_ZLIB,
+                        bank_codec.CODEC_LZMA],
+               help='The codec used to compress streamed bank objects, '
+                    'such as image segments, before they are stored. '
+                    'Objects are read back with the codec recorded in '
+                    'their metadata.'),
+    cfg.IntOpt('work_concurrency',
+               default=work_scheduler.DEFAULT_CONCURRENCY,
+               min=1,
+               help='The maximal number of background protection tasks, '
+                    'such as image data transfers, run concurrently by the '
+                    'plugins of the provider'),
+    cfg.IntOpt('plugin_work_concurrency',
+               default=work_scheduler.DEFAULT_OWNER_CONCURRENCY,
+               min=1,
+               help='The maximal number of background protection tasks run '
+                    'concurrently by a single plugin of the provider'),
 ]
 CONF = cfg.CONF
 
@@ -58,9 +86,10 @@ CONF.register_opt(cfg.StrOpt('provider_config_dir',
 
 
 class PluggableProtectionProvider(object):
-    def __init__(self, provider_config):
+    def __init__(self, provider_config, protectable_registry=None):
         super(PluggableProtectionProvider, self).__init__()
         self._config = provider_config
+        self._protectable_registry = protectable_registry
         self._id = self._config.provider.id
         self._name = self._config.provider.name
         self._description = self._config.provider.description
@@ -70,15 +99,23 @@ class PluggableProtectionProvider(object):
         self.checkpoint_collection = None
         self._bank_plugin = None
         self._plugin_map = {}
+        # resource type -> protection plugin, shared by all flows
+        self._plugin_type_map = {}
 
         if hasattr(self._config.provider, 'bank') \
                 and not self._config.provider.bank:
             raise ImportError(_("Empty bank"))
 
         self._load_bank(self._config.provider.bank)
-        self._bank = bank_plugin.Bank(self._bank_plugin)
+        self._bank = bank_plugin.Bank(
+            self._bank_plugin,
+            write_behind_window=self._config.provider.bank_write_behind_window,
+            codec=self._config.provider.bank_object_codec)
         self.checkpoint_collection = CheckpointCollection(
             self._bank)
+        self._work_scheduler = work_scheduler.WorkScheduler(
+            self._config.provider.work_concurrency,
+            self._config.provider.plugin_work_concurrency)
 
         if hasattr(self._config.provider, 'plugin'):
             for plugin_name in self._config.provider.plugin:
@@ -110,6 +147,27 @@ class PluggableProtectionProvider(object):
     def plugins(self):
         return self._plugin_map
 
+    @property
+    def work_scheduler(self):
+        return self._work_scheduler
+
+    @property
+    def protectable_registry(self):
+        """The registry used to build resource graphs.
+
+        Providers share the registry they are given. Without one, a registry
+        is loaded on first use and kept for all the following flows.
+        """
+        if self._protectable_registry is None:
+            registry = ProtectableRegistry()
+            registry.load_plugins()
+            self._protectable_registry = registry
+        return self._protectable_registry
+
+    @protectable_registry.setter
+    def protectable_registry(self, protectable_registry):
+        self._protectable_registry = protectable_registry
+
     def _load_bank(self, bank_name):
         try:
             plugin = utils.load_plugin(PROTECTION_NAMESPACE, bank_name,
@@ -128,17 +186,41 @@ class PluggableProtectionProvider(object):
             LOG.error(_LE("Load protection plugin: '%s' failed."), plugin_name)
             raise
         else:
-            self._plugin_map[plugin_name] = plugin
-            for resource in plugin.get_supported_resources_types():
-                if hasattr(plugin, 'get_options_schema'):
-                    self._extended_info_schema['options_schema'][resource] \
-                        = plugin.get_options_schema(resource)
-                if hasattr(plugin, 'get_restore_schema'):
-                    self._extended_info_schema['restore_schema'][resource] \
-                        = plugin.get_restore_schema(resource)
-                if hasattr(plugin, 'get_saved_info_schema'):
-                    self._extended_info_schema['saved_info_schema'][resource] \
-                        = plugin.get_saved_info_schema(resource)
+            self._register_plugin(plugin_name, plugin)
+
+    def _register_plugin(self, plugin_name, plugin):
+        resource_types = plugin.get_supported_resources_types()
+        for resource_type in resource_types:
+            other_plugin = self._plugin_type_map.get(resource_type)
+            if other_plugin is not None and other_plugin is not plugin:
+                other_plugin_name = next(
+                    name for name, loaded in self._plugin_map.items()
+                    if loaded is other_plugin)
+                LOG.error(_LE("Resource type %(resource_type)s is supported "
+                              "by protection plugins %(plugin)s and "
+                              "%(other_plugin)s."),
+                          {"resource_type": resource_type,
+                           "plugin": plugin_name,
+                           "other_plugin": other_plugin_name})
+                raise exception.ProtectionPluginConflict(
+                    resource_type=resource_type,
+                    plugin_name=plugin_name,
+                    other_plugin_name=other_plugin_name)
+
+        self._plugin_map[plugin_name] = plugin
+        if hasattr(plugin, 'set_work_scheduler'):
+            plugin.set_work_scheduler(self._work_scheduler, plugin_name)
+        for resource in resource_types:
+            self._plugin_type_map[resource] = plugin
+            if hasattr(plugin, 'get_options_schema'):
+                self._extended_info_schema['options_schema'][resource] \
+                    = plugin.get_options_schema(resource)
+            if hasattr(plugin, 'get_restore_schema'):
+                self._extended_info_schema['restore_schema'][resource] \
+                    = plugin.get_restore_schema(resource)
+            if hasattr(plugin, 'get_saved_info_schema'):
+                self._extended_info_schema['saved_info_schema'][resource] \
+                    = plugin.get_saved_info_schema(resource)
 
     def get_checkpoint_collection(self):
         return self.checkpoint_collection
@@ -171,16 +253,15 @@ class PluggableProtectionProvider(object):
                 graph_resources.append(Resource(type=resource['type'],
                                                 id=resource['id'],
                                                 name=resource['name']))
-            # TODO(luobin): pass registry in ctx
-            registry = ProtectableRegistry()
-            registry.load_plugins()
-            resource_graph = registry.build_graph(cntxt, graph_resources)
+            resource_graph = self.protectable_registry.build_graph(
+                cntxt, graph_resources)
             resource_context = ResourceGraphContext(
                 cntxt=cntxt,
                 operation=operation,
                 workflow_engine=workflow_engine,
                 task_flow=task_flow,
                 plugin_map=self._plugin_map,
+                plugin_type_map=self._plugin_type_map,
                 parameters=parameters
             )
         if operation == constants.OPERATION_RESTORE:
@@ -198,6 +279,7 @@ class PluggableProtectionProvider(object):
                 workflow_engine=workflow_engine,
                 task_flow=task_flow,
                 plugin_map=self._plugin_map,
+                plugin_type_map=self._plugin_type_map,
                 parameters=parameters,
                 heat_template=heat_template
             )
@@ -220,7 +302,9 @@ class PluggableProtectionProvider(object):
         walker_listener = ResourceGraphWalkerListener(resource_context)
         graph_walker = GraphWalker()
         graph_walker.register_listener(walker_listener)
-        graph_walker.walk_graph(resource_graph)
+        # the tasks of a shared subtree are created and linked on its first
+        # visit, later visits only need to link the subtree to its parent
+        graph_walker.walk_graph(resource_graph, visit_once=True)
 
         if operation == constants.OPERATION_PROTECT:
             return {"task_flow": walker_listener.context.task_flow,
@@ -237,9 +321,10 @@ class PluggableProtectionProvider(object):
 
 
 class ProviderRegistry(object):
-    def __init__(self):
+    def __init__(self, protectable_registry=None):
         super(ProviderRegistry, self).__init__()
         self.providers = {}
+        self._protectable_registry = protectable_registry
         self._load_providers()
 
     def _load_providers(self):
@@ -255,7 +340,9 @@ class ProviderRegistry(object):
             provider_config(args=['--config-file=' + config_path])
             provider_config.register_opts(provider_opts, 'provider')
             try:
-                provider = PluggableProtectionProvider(provider_config)
+                provider = PluggableProtectionProvider(
+                    provider_config,
+                    protectable_registry=self._protectable_registry)
             except Exception as e:
                 LOG.error(_LE("Load provider: %(provider)s failed. "
                               "Reason: %(reason)s"),
@@ -18,16 +18,27 @@ from oslo_log import log as logging
 LOG = logging.getLogger(__name__)
 
 
+def build_plugin_type_map(plugin_map):
+    """Index protection plugins by the resource types they support."""
+    plugin_type_map = {}
+    for plugin in plugin_map.values():
+        if hasattr(plugin, "get_supported_resources_types"):
+            for resource_type in plugin.get_supported_resources_types():
+                plugin_type_map.setdefault(resource_type, plugin)
+    return plugin_type_map
+
+
 class ResourceGraphContext(object):
     def __init__(self, cntxt, is_first_visited=False, operation="protect",
                  parameters=None, plugin_map=None, node=None,
                  workflow_engine=None, task_flow=None, checkpoint=None,
-                 heat_template=None):
+                 heat_template=None, plugin_type_map=None):
         self.cntxt = cntxt
         self.is_first_visited = is_first_visited
         self.operation = operation
         self.parameters = parameters
         self.plugin_map = plugin_map
+        self.plugin_type_map = plugin_type_map
         self.node = node
         self.workflow_engine = workflow_engine
         self.task_flow = task_flow
@@ -41,27 +52,40 @@ class ResourceGraphContext(object):
         self.heat_template = heat_template
 
     def get_node_context(self, node, is_first_visited=None):
-        node_context = ResourceGraphContext(
-            self.cntxt,
-            is_first_visited=is_first_visited,
-            operation=self.operation,
-            parameters=self.parameters,
-            plugin_map=self.plugin_map,
-            node=node,
-            workflow_engine=self.workflow_engine,
-            task_flow=self.task_flow,
-            checkpoint=self.checkpoint,
-            heat_template=self.heat_template
-        )
-        node_context.task_stack = self.task_stack
-        node_context.status_getters = self.status_getters
-        return node_context
+        return ResourceNodeContext(self, node, is_first_visited)
+
+
+class ResourceNodeContext(object):
+    """The context of a single node of a resource graph walk.
+
+    Only the node and whether it is visited for the first time are kept
+    per node; every other attribute is read from the ResourceGraphContext
+    shared by the whole walk.
+    """
+    __slots__ = ("_graph_context", "node", "is_first_visited")
+
+    def __init__(self, graph_context, node, is_first_visited=None):
+        self._graph_context = graph_context
+        self.node = node
+        self.is_first_visited = is_first_visited
+
+    def __getattr__(self, name):
+        if name == "_graph_context":
+            raise AttributeError(name)
+        return getattr(self._graph_context, name)
+
+    def get_node_context(self, node, is_first_visited=None):
+        return ResourceNodeContext(self._graph_context, node,
+                                   is_first_visited)
 
 
 class ResourceGraphWalkerListener(GraphWalkerListener):
     def __init__(self, context):
         self.context = context
         self.plugin_map = self.context.plugin_map
+        self.plugin_type_map = self.context.plugin_type_map
+        if self.plugin_type_map is None:
+            self.plugin_type_map = build_plugin_type_map(self.plugin_map)
 
     def on_node_enter(self, node, already_visited):
         resource = node.value
@@ -96,10 +120,9 @@ class ResourceGraphWalkerListener(GraphWalkerListener):
         protection_plugin.on_resource_end(context)
 
     def _get_protection_plugin(self, resource_type):
-        for plugin in self.plugin_map.values():
-            if hasattr(plugin, "get_supported_resources_types"):
-                if resource_type in plugin.get_supported_resources_types():
-                    return plugin
+        plugin = self.plugin_type_map.get(resource_type)
+        if plugin is not None:
+            return plugin
         LOG.error(_LE("no plugin support this resource_type:%s"),
                   resource_type)
         raise Exception(_("No plugin support this resource_type"))
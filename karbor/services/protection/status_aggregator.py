@@ -0,0 +1,166 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+from eventlet import event
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from karbor.common import constants
+
+status_aggregator_opts = [
+    cfg.IntOpt('checkpoint_status_reconcile_interval',
+               default=300,
+               min=1,
+               help='The number of seconds after which the status of every '
+                    'resource of a checkpoint is read again from the bank '
+                    'when no status transition was published meanwhile'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(status_aggregator_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class CheckpointStatusTracker(object):
+    """Count the statuses of the resources of a single checkpoint.
+
+    The aggregate status is computed by aggregate_func from the set of
+    resource statuses, and waiters are only woken up when it changes.
+    """
+    def __init__(self, checkpoint_id, resource_ids, aggregate_func):
+        self.checkpoint_id = checkpoint_id
+        self._aggregate_func = aggregate_func
+        self._statuses = dict.fromkeys(resource_ids,
+                                       constants.RESOURCE_STATUS_UNDEFINED)
+        self._counts = collections.Counter(self._statuses.values())
+        self._published = collections.Counter()
+        self._aggregate = self._compute_aggregate()
+        self._changed = event.Event()
+
+    def _compute_aggregate(self):
+        return self._aggregate_func(
+            {status for status, count in self._counts.items() if count})
+
+    @property
+    def aggregate(self):
+        return self._aggregate
+
+    def get_status(self, resource_id):
+        return self._statuses.get(resource_id)
+
+    def _set_status(self, resource_id, status):
+        old_status = self._statuses.get(resource_id)
+        if old_status is None or old_status == status:
+            return
+        self._counts[old_status] -= 1
+        self._counts[status] += 1
+        self._statuses[resource_id] = status
+
+        aggregate = self._compute_aggregate()
+        if aggregate != self._aggregate:
+            self._aggregate = aggregate
+            if not self._changed.ready():
+                self._changed.send()
+
+    def publish(self, resource_id, status):
+        self._published[resource_id] += 1
+        self._set_status(resource_id, status)
+
+    def reconcile(self, checkpoint, status_getters):
+        """Read the status of every resource from the bank."""
+        for status_getter in status_getters:
+            resource_id = status_getter["resource_id"]
+            published = self._published[resource_id]
+            status = status_getter["get_resource_stats"](checkpoint,
+                                                         resource_id)
+            # a transition published while reading is newer than the bank
+            if self._published[resource_id] == published:
+                self._set_status(resource_id, status)
+
+    def wait(self, timeout):
+        """Wait until the aggregate status changes.
+
+        :return: False if the timeout expired first
+        """
+        changed = False
+        with eventlet.Timeout(timeout, False):
+            self._changed.wait()
+            changed = True
+        if self._changed.ready():
+            self._changed = event.Event()
+        return changed
+
+
+class ResourceStatusAggregator(object):
+    """Dispatch resource status transitions to the checkpoint trackers."""
+    def __init__(self):
+        self._trackers = {}
+
+    def track(self, checkpoint_id, resource_ids, aggregate_func):
+        tracker = CheckpointStatusTracker(checkpoint_id, resource_ids,
+                                          aggregate_func)
+        self._trackers[checkpoint_id] = tracker
+        return tracker
+
+    def untrack(self, checkpoint_id):
+        self._trackers.pop(checkpoint_id, None)
+
+    def publish(self, checkpoint_id, resource_id, status):
+        tracker = self._trackers.get(checkpoint_id)
+        if tracker is not None:
+            tracker.publish(resource_id, status)
+
+
+_aggregator = ResourceStatusAggregator()
+
+
+def get_aggregator():
+    return _aggregator
+
+
+def publish(checkpoint_id, resource_id, status):
+    """Publish the new status of a resource of a checkpoint."""
+    LOG.debug("Resource %(resource_id)s of checkpoint %(checkpoint_id)s is "
+              "%(status)s", {"resource_id": resource_id,
+                             "checkpoint_id": checkpoint_id,
+                             "status": status})
+    _aggregator.publish(checkpoint_id, resource_id, status)
+
+
+def sync_checkpoint_status(checkpoint, status_getters, aggregate_func,
+                           on_change):
+    """Track the aggregate status of checkpoint until it is final.
+
+    The resource statuses are read from the bank once, then updated from the
+    transitions published by the protection plugins. The bank is only read
+    again when nothing was published for a reconcile interval, to catch
+    transitions of other processes. on_change is called with every new
+    aggregate status and returns True once it is final.
+    """
+    resource_ids = [s["resource_id"] for s in status_getters]
+    tracker = _aggregator.track(checkpoint.id, resource_ids, aggregate_func)
+    try:
+        tracker.reconcile(checkpoint, status_getters)
+        status = None
+        while True:
+            if tracker.aggregate != status:
+                status = tracker.aggregate
+                if on_change(status):
+                    return
+            if not tracker.wait(CONF.checkpoint_status_reconcile_interval):
+                tracker.reconcile(checkpoint, status_getters)
+    finally:
+        _aggregator.untrack(checkpoint.id)
@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import heapq
+import itertools
+
+import eventlet
+from eventlet import event
+from oslo_log import log as logging
+
+from karbor.i18n import _LE
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_OWNER_CONCURRENCY = 4
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class WorkStats(object):
+    """Counters of the work items of a scheduler or of one of its owners."""
+    __slots__ = ("queued", "running", "completed", "failed",
+                 "bytes_in_flight")
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_in_flight = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class WorkItem(object):
+    """A unit of background work, waitable for its result."""
+    def __init__(self, owner, func, args, kwargs, priority, size):
+        self.owner = owner
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.size = size
+        self._event = event.Event()
+
+    def done(self):
+        return self._event.ready()
+
+    def wait(self):
+        """Return the result of the work, or raise its exception."""
+        return self._event.wait()
+
+
+class WorkScheduler(object):
+    """Run background work with global and per owner concurrency limits.
+
+    Work submitted beyond the limits waits in a queue per owner, ordered by
+    priority then submission order. Whenever a slot frees up, the most
+    urgent queued item of an owner below its own limit is started.
+    """
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY,
+                 owner_concurrency=DEFAULT_OWNER_CONCURRENCY):
+        self._concurrency = concurrency
+        self._owner_concurrency = owner_concurrency
+        # owner -> heap of (priority, sequence, item)
+        self._queues = {}
+        self._sequence = itertools.count()
+        self._stats = WorkStats()
+        self._owner_stats = {}
+
+    def _get_owner_stats(self, owner):
+        stats = self._owner_stats.get(owner)
+        if stats is None:
+            stats = self._owner_stats[owner] = WorkStats()
+        return stats
+
+    def submit(self, owner, func, args=(), kwargs=None,
+               priority=PRIORITY_NORMAL, size=0):
+        """Queue func(*args, **kwargs) on behalf of owner.
+
+        :param priority: lower values are started first
+        :param size: the number of bytes the work transfers, accounted in
+                     bytes_in_flight while it runs
+        :return: the WorkItem
+        """
+        item = WorkItem(owner, func, args, kwargs or {}, priority, size)
+        heapq.heappush(self._queues.setdefault(owner, []),
+                       (priority, next(self._sequence), item))
+        for stats in (self._stats, self._get_owner_stats(owner)):
+            stats.queued += 1
+        self._dispatch()
+        return item
+
+    def _next_item(self):
+        best = None
+        for owner, queue in self._queues.items():
+            if not queue or (self._owner_stats[owner].running >=
+                             self._owner_concurrency):
+                continue
+            if best is None or queue[0] < self._queues[best][0]:
+                best = owner
+        if best is None:
+            return None
+        return heapq.heappop(self._queues[best])[2]
+
+    def _dispatch(self):
+        while self._stats.running < self._concurrency:
+            item = self._next_item()
+            if item is None:
+                return
+            for stats in (self._stats, self._owner_stats[item.owner]):
+                stats.queued -= 1
+                stats.running += 1
+                stats.bytes_in_flight += item.size
+            eventlet.spawn_n(self._run, item)
+
+    def _run(self, item):
+        result = error = None
+        try:
+            result = item.func(*item.args, **item.kwargs)
+        except Exception as exc:
+            error = exc
+            LOG.exception(_LE("Background work %(func)s of %(owner)s "
+                              "failed"),
+                          {"func": getattr(item.func, "__name__", item.func),
+                           "owner": item.owner})
+        for stats in (self._stats, self._owner_stats[item.owner]):
+            stats.running -= 1
+            stats.bytes_in_flight -= item.size
+            if error is not None:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+        if error is not None:
+            item._event.send_exception(error)
+        else:
+            item._event.send(result)
+        self._dispatch()
+
+    def get_stats(self, owner=None):
+        """Return the counters of the scheduler, or of one owner."""
+        if owner is None:
+            stats = self._stats.to_dict()
+            stats["owners"] = {name: owner_stats.to_dict()
+                               for name, owner_stats
+                               in self._owner_stats.items()}
+            return stats
+        return self._get_owner_stats(owner).to_dict()
@@ -15,6 +15,7 @@ from glanceclient.v2 import images
 from karbor.common import constants
 from karbor.context import RequestContext
 from karbor import resource
+from karbor.services.protection.protectable_plugin import InventoryCache
 from karbor.services.protection.protectable_plugins.image import \
     ImageProtectablePlugin
 from karbor.tests import base
@@ -124,6 +125,28 @@ class ImageProtectablePluginTest(base.TestCase):
                          [resource.Resource(type=constants.IMAGE_RESOURCE_TYPE,
                                             id='123', name='name123')])
 
+    @mock.patch.object(images.Controller, 'list')
+    @mock.patch.object(servers.ServerManager, 'list')
+    def test_get_server_dependent_resources_from_inventory(
+            self, mock_server_list, mock_image_list):
+        vms = [server_info(id='server%d' % i,
+                           type=constants.SERVER_RESOURCE_TYPE,
+                           name='nameserver%d' % i,
+                           image=dict(id='123', name='name123'))
+               for i in range(3)]
+        plugin = ImageProtectablePlugin(self._context)
+        plugin.set_inventory_cache(InventoryCache())
+        mock_server_list.return_value = vms
+        mock_image_list.return_value = [
+            image_info(id='123', name='name123', owner='abcd')]
+        for vm in vms:
+            self.assertEqual(
+                plugin.get_dependent_resources(self._context, vm),
+                [resource.Resource(type=constants.IMAGE_RESOURCE_TYPE,
+                                   id='123', name='name123')])
+        mock_server_list.assert_called_once_with(detailed=True)
+        mock_image_list.assert_called_once_with()
+
     @mock.patch.object(images.Controller, 'list')
     def test_get_project_dependent_resources(self, mock_image_list):
         project = project_info(id='abcd', type=constants.PROJECT_RESOURCE_TYPE,
@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
 import tempfile
 
@@ -29,6 +30,7 @@ class FakeSwiftConnection(object):
     def __init__(self, *args, **kwargs):
         self.swiftdir = tempfile.mkdtemp()
         self.object_headers = {}
+        self.text_objects = set()
 
     def put_container(self, container):
         container_dir = self.swiftdir + "/" + container
@@ -51,15 +53,29 @@ class FakeSwiftConnection(object):
                 body.append({"subdir": f})
         return None, body
 
-    def put_object(self, container, obj, contents, headers=None):
+    def put_object(self, container, obj, contents, headers=None,
+                   chunk_size=None):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
         obj_dir = obj_file[0:obj_file.rfind("/")]
         if os.path.exists(container_dir) is True:
             if os.path.exists(obj_dir) is False:
                 os.makedirs(obj_dir)
-            with open(obj_file, "w") as f:
-                f.write(contents)
+            if hasattr(contents, "read"):
+                contents = iter(lambda: contents.read(chunk_size or 65536),
+                                b"")
+            self.text_objects.discard(obj_file)
+            if isinstance(contents, str):
+                self.text_objects.add(obj_file)
+                with open(obj_file, "w") as f:
+                    f.write(contents)
+            elif isinstance(contents, bytes):
+                with open(obj_file, "wb") as f:
+                    f.write(contents)
+            else:
+                with open(obj_file, "wb") as f:
+                    for chunk in contents:
+                        f.write(chunk)
 
             self.object_headers[obj_file] = {}
             for key, value in headers.items():
@@ -68,18 +84,40 @@ class FakeSwiftConnection(object):
         else:
             raise ClientException("error_container")
 
-    def get_object(self, container, obj):
+    def get_object(self, container, obj, resp_chunk_size=None):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
         if os.path.exists(container_dir) is True:
             if os.path.exists(obj_file) is True:
-                with open(obj_file, "r") as f:
+                if resp_chunk_size:
+                    return (self.object_headers[obj_file],
+                            self._read_chunks(obj_file, resp_chunk_size))
+                mode = "r" if obj_file in self.text_objects else "rb"
+                with open(obj_file, mode) as f:
                     return self.object_headers[obj_file], f.read()
             else:
                 raise ClientException("error_obj")
         else:
             raise ClientException("error_container")
 
+    def head_object(self, container, obj):
+        container_dir = self.swiftdir + "/" + container
+        obj_file = container_dir + "/" + obj
+        if os.path.exists(obj_file) is True:
+            with open(obj_file, "rb") as f:
+                etag = hashlib.md5(f.read()).hexdigest()
+            headers = dict(self.object_headers[obj_file])
+            headers["etag"] = etag
+            return headers
+        else:
+            raise ClientException("error_obj")
+
+    @staticmethod
+    def _read_chunks(obj_file, chunk_size):
+        with open(obj_file, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
     def delete_object(self, container, obj):
         container_dir = self.swiftdir + "/" + container
         obj_file = container_dir + "/" + obj
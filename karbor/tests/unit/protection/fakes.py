@@ -86,7 +86,8 @@ class FakeBankPlugin(BankPlugin):
             raise Exception
         return value
 
-    def list_objects(self, prefix=None, limit=None, marker=None):
+    def list_objects(self, prefix=None, limit=None, marker=None,
+                     sort_dir=None, end_marker=None):
         objects_name = []
         if prefix is not None:
             for key, value in self._objects.items():
@@ -171,15 +172,19 @@ class FakeCheckpoint(object):
     def commit(self):
         pass
 
+    def flush(self):
+        pass
+
     def get_resource_bank_section(self, resource_id):
         bank = Bank(FakeBankPlugin())
         return BankSection(bank, resource_id)
 
-    def to_dict(self):
+    def to_dict(self, include_resource_graph=True):
         return {
             "id": self.id,
             "status": self.status,
-            "resource_graph": self.resource_graph,
+            "resource_graph": self.resource_graph
+            if include_resource_graph else None,
             "protection_plan": None,
             "project_id": None
         }
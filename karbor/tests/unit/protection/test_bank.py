@@ -12,49 +12,76 @@
 
 from collections import OrderedDict
 from copy import deepcopy
+import eventlet
+import functools
+import itertools
+import mock
 from oslo_utils import uuidutils
 import six
 
 from karbor import exception
+from karbor.services.protection import bank_codec
 from karbor.services.protection.bank_plugin import Bank
 from karbor.services.protection.bank_plugin import BankPlugin
 from karbor.services.protection.bank_plugin import BankSection
+from karbor.services.protection.bank_plugin import BankSegmentReader
+from karbor.services.protection.bank_plugin import BankSegmentWriter
+from karbor.services.protection.bank_plugin import BankStreamReader
 from karbor.services.protection.bank_plugin import LeasePlugin
 from karbor.tests import base
 
 
 class _InMemoryBankPlugin(BankPlugin):
+    object_metadata_supported = True
+
     def __init__(self, config=None):
         super(_InMemoryBankPlugin, self).__init__(config)
         self._data = OrderedDict()
+        self._metadata = {}
 
     def create_object(self, key, value):
         self._data[key] = value
+        self._metadata.pop(key, None)
 
     def update_object(self, key, value):
         self._data[key] = value
+        self._metadata.pop(key, None)
+
+    def create_object_stream(self, key, contents, metadata=None):
+        self.create_object(key, b''.join(contents))
+        if metadata:
+            self._metadata[key] = dict(metadata)
 
     def get_object(self, key):
-        return deepcopy(self._data[key])
+        try:
+            return deepcopy(self._data[key])
+        except KeyError:
+            raise exception.BankObjectNotFound(key=key)
+
+    def get_object_with_metadata(self, key):
+        return self.get_object(key), dict(self._metadata.get(key, {}))
 
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
-        marker_found = marker is None
-        for key in six.iterkeys(self._data):
-            if marker is not True and key != marker:
-                if marker_found:
-                    if prefix is None or key.startswith(prefix):
-                        if limit is not None:
-                            limit -= 1
-                            if limit < 0:
-                                return
-                        yield key
-            else:
-                marker_found = True
+                     sort_dir=None, end_marker=None):
+        if sort_dir == "desc":
+            marker, end_marker = end_marker, marker
+        keys = sorted(key for key in six.iterkeys(self._data)
+                      if (prefix is None or key.startswith(prefix)) and
+                      (marker is None or key > marker) and
+                      (end_marker is None or key < end_marker))
+        if limit is None:
+            return keys
+        return keys[-limit:] if sort_dir == "desc" else keys[:limit]
 
     def delete_object(self, key):
         del self._data[key]
 
+    def get_object_info(self, key):
+        try:
+            return len(self._data[key]), dict(self._metadata.get(key, {}))
+        except KeyError:
+            raise exception.BankObjectNotFound(key=key)
+
     def get_owner_id(self):
         return uuidutils.generate_uuid()
 
@@ -101,6 +128,16 @@ class BankSectionTest(base.TestCase):
         section.delete_object("/b")
         section.delete_object("//c")
 
+    def test_delete_objects(self):
+        bank = self._create_test_bank()
+        section = BankSection(bank, "/prefix", is_writable=True)
+        for key in ("a", "b", "c"):
+            section.create_object(key, "value")
+        section.delete_objects(["a", "/b"])
+        self.assertEqual(["c"], list(section.list_objects()))
+        self.assertRaises(KeyError, section.delete_objects, ["a", "c"])
+        self.assertEqual([], list(section.list_objects()))
+
     def test_list_objects(self):
         bank = self._create_test_bank()
         section = BankSection(bank, "/prefix", is_writable=True)
@@ -179,3 +216,246 @@ class BankSectionTest(base.TestCase):
             "/mid",
             is_writable=True,
         )
+
+    def test_object_stream(self):
+        bank = self._create_test_bank()
+        section = BankSection(bank, "/prefix")
+        section.create_object_stream("data", iter([b"ab", b"cd", b"e"]))
+        self.assertEqual(bank.get_object("/prefix/data"), b"abcde")
+        self.assertEqual(
+            list(section.get_object_stream("data", chunk_size=2)),
+            [b"ab", b"cd", b"e"],
+        )
+
+    def test_object_stream_read_only(self):
+        bank = self._create_test_bank()
+        section = BankSection(bank, "/prefix", is_writable=False)
+        self.assertRaises(
+            exception.BankReadonlyViolation,
+            section.create_object_stream,
+            "data",
+            iter([b"value"]),
+        )
+
+    def test_object_stream_codec(self):
+        plugin = _InMemoryBankPlugin()
+        bank = Bank(plugin, codec=bank_codec.CODEC_ZLIB)
+        section = BankSection(bank, "/prefix")
+        value = b"value" * 1000
+        section.create_object_stream("data", iter([value[:7], value[7:]]))
+        self.assertEqual({"codec": bank_codec.CODEC_ZLIB},
+                         plugin.get_object_info("/prefix/data")[1])
+        self.assertLess(len(plugin.get_object("/prefix/data")), len(value))
+        self.assertEqual(value, section.get_object("data"))
+        self.assertEqual(value, b"".join(section.get_object_stream("data")))
+        self.assertIsNone(section.get_object_size("data"))
+        # the recorded codec is used whatever the configured one
+        section = BankSection(Bank(plugin), "/prefix")
+        self.assertEqual(value, section.get_object("data"))
+
+    def test_object_stream_codec_without_metadata_support(self):
+        plugin = _InMemoryBankPlugin()
+        plugin.object_metadata_supported = False
+        bank = Bank(plugin, codec=bank_codec.CODEC_ZLIB)
+        bank.create_object_stream("/data", iter([b"value"]))
+        self.assertEqual(b"value", plugin.get_object("/data"))
+
+
+class BankStreamReaderTest(base.TestCase):
+    def test_read(self):
+        reader = BankStreamReader(iter([b"abc", b"de", b"fghi"]))
+        self.assertEqual(reader.read(4), b"abcd")
+        self.assertEqual(reader.read(1), b"e")
+        self.assertEqual(reader.read(), b"fghi")
+        self.assertEqual(reader.read(1), b"")
+
+    def test_iter(self):
+        reader = BankStreamReader(iter([b"abc", b"de"]))
+        self.assertEqual(reader.read(1), b"a")
+        self.assertEqual(list(reader), [b"bc", b"de"])
+
+    def test_small_reads(self):
+        data = bytes(bytearray(range(256))) * 40
+        chunks = [memoryview(data)[offset:offset + 1000]
+                  for offset in range(0, len(data), 1000)]
+        reader = BankStreamReader(iter([b""] + chunks))
+        parts = []
+        for size in itertools.cycle((1, 7, 300, 2500)):
+            part = reader.read(size)
+            if not part:
+                break
+            self.assertLessEqual(len(part), size)
+            parts.append(part)
+        self.assertEqual(data, b"".join(parts))
+
+
+class BankSegmentWriterTest(base.TestCase):
+    def test_write(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 4, max_in_flight=2)
+        count = writer.write(iter([b"abc", b"defghi", b"", b"jk"]))
+        self.assertEqual(3, count)
+        self.assertEqual(b"abcd", bank.get_object("/prefix/data_0"))
+        self.assertEqual(b"efgh", bank.get_object("/prefix/data_1"))
+        self.assertEqual(b"ijk", bank.get_object("/prefix/data_2"))
+        manifest = writer.manifest
+        self.assertEqual(3, manifest["count"])
+        self.assertEqual([4, 4, 3], manifest["sizes"])
+
+    @mock.patch.object(six, 'PY2', True)
+    def test_write_default_create_object_stream(self):
+        plugin = _InMemoryBankPlugin()
+        # the buffering implementation of plugins which do not stream
+        plugin.create_object_stream = functools.partial(
+            BankPlugin.create_object_stream, plugin)
+        section = BankSection(Bank(plugin), "/prefix")
+        writer = BankSegmentWriter(section, "data_", 4)
+        self.assertEqual(2, writer.write(iter([b"abc", b"def"])))
+        self.assertEqual(b"abcd", plugin.get_object("/prefix/data_0"))
+        self.assertIsInstance(plugin.get_object("/prefix/data_1"), bytes)
+        self.assertEqual(b"ef", plugin.get_object("/prefix/data_1"))
+
+    def test_write_empty(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 4)
+        self.assertEqual(0, writer.write(iter([])))
+        self.assertEqual([], list(section.list_objects()))
+
+
+class BankSegmentReaderTest(base.TestCase):
+    def test_read_in_order(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        keys = []
+        for i in range(10):
+            section.create_object("data_%d" % i, b"%d" % i)
+            keys.append("data_%d" % i)
+        reader = BankSegmentReader(section, keys, max_in_flight=3)
+        self.assertEqual(b"0123456789", b"".join(reader))
+
+    def test_read_from_manifest(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 2)
+        writer.write(iter([b"abcde"]))
+        reader = BankSegmentReader.from_manifest(section, writer.manifest,
+                                                 max_in_flight=2)
+        self.assertEqual(b"abcde", b"".join(reader))
+
+    def test_read_from_manifest_corrupted(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 2)
+        writer.write(iter([b"abcde"]))
+        section.update_object("data_1", b"xx")
+        reader = BankSegmentReader.from_manifest(section, writer.manifest)
+        self.assertRaises(exception.BankObjectCorrupted, b"".join, reader)
+
+    def test_read_from_manifest_missing_segment(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 2)
+        writer.write(iter([b"abcde"]))
+        section.delete_object("data_1")
+        with mock.patch.object(section, 'list_objects') as list_objects:
+            self.assertRaises(exception.BankObjectCorrupted,
+                              BankSegmentReader.from_manifest,
+                              section, writer.manifest)
+        list_objects.assert_not_called()
+
+    def test_read_from_manifest_truncated_segment(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        writer = BankSegmentWriter(section, "data_", 2)
+        writer.write(iter([b"abcde"]))
+        section.update_object("data_1", b"x")
+        self.assertRaises(exception.BankObjectCorrupted,
+                          BankSegmentReader.from_manifest,
+                          section, writer.manifest)
+
+    def test_read_from_incomplete_manifest(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        manifest = {"prefix": "data_", "count": 2, "sizes": [2],
+                    "checksums": [None]}
+        self.assertRaises(exception.BankObjectCorrupted,
+                          BankSegmentReader.from_manifest,
+                          section, manifest)
+
+    def test_read_from_listing(self):
+        bank = Bank(_InMemoryBankPlugin())
+        section = BankSection(bank, "/prefix")
+        for i in range(12):
+            section.create_object("data_%d" % i, b"%d," % i)
+        section.create_object("metadata", {})
+        reader = BankSegmentReader.from_listing(section, "data_")
+        self.assertEqual(b"0,1,2,3,4,5,6,7,8,9,10,11,", b"".join(reader))
+
+
+class _CountingBankPlugin(_InMemoryBankPlugin):
+    def __init__(self, config=None):
+        super(_CountingBankPlugin, self).__init__(config)
+        self.writes = []
+
+    def create_object(self, key, value):
+        self.writes.append(("create_object", key, value))
+        super(_CountingBankPlugin, self).create_object(key, value)
+
+    def update_object(self, key, value):
+        if value == "fail":
+            raise exception.BankUpdateObjectFailed(reason="fail", key=key)
+        self.writes.append(("update_object", key, value))
+        super(_CountingBankPlugin, self).update_object(key, value)
+
+
+class BankWriteBehindTest(base.TestCase):
+    def setUp(self):
+        super(BankWriteBehindTest, self).setUp()
+        self.plugin = _CountingBankPlugin()
+        self.bank = Bank(self.plugin, write_behind_window=60)
+        self.section = BankSection(self.bank, "/prefix")
+
+    def test_writes_coalesced(self):
+        self.section.create_object("status", "protecting")
+        self.section.update_object("status", "available")
+        self.section.update_object("metadata", {"a": 1})
+        self.assertEqual([], self.plugin.writes)
+        self.assertEqual("available", self.section.get_object("status"))
+
+        self.section.flush()
+        self.assertEqual(
+            [("create_object", "/prefix/status", "available"),
+             ("update_object", "/prefix/metadata", {"a": 1})],
+            self.plugin.writes)
+        self.assertEqual({"a": 1}, self.plugin.get_object("/prefix/metadata"))
+
+    def test_background_flush(self):
+        bank = Bank(self.plugin, write_behind_window=0.01)
+        bank.update_object("/status", "available")
+        eventlet.sleep(0.05)
+        self.assertEqual([("update_object", "/status", "available")],
+                         self.plugin.writes)
+
+    def test_listing_and_delete_see_queued_writes(self):
+        self.section.update_object("a", "value")
+        self.section.update_object("b", "value")
+        self.assertEqual(["a", "b"], self.section.list_objects())
+        self.section.update_object("a", "new value")
+        self.section.delete_object("a")
+        self.assertEqual(["b"], self.section.list_objects())
+        self.section.flush()
+
+    def test_flush_raises_write_error(self):
+        self.section.update_object("status", "fail")
+        self.assertRaises(exception.BankUpdateObjectFailed,
+                          self.section.flush)
+        self.section.flush()
+
+    def test_synchronous_without_window(self):
+        bank = Bank(self.plugin)
+        bank.update_object("/status", "available")
+        self.assertEqual([("update_object", "/status", "available")],
+                         self.plugin.writes)
+        bank.flush()
@@ -22,7 +22,6 @@ from karbor.tests.unit.protection.fakes import fake_protection_plan
 from karbor.tests.unit.protection.fakes import fake_restore
 from karbor.tests.unit.protection.fakes import FakeCheckpoint
 from karbor.tests.unit.protection.fakes import FakeProtectionPlugin
-from karbor.tests.unit.protection.fakes import plan_resources
 from karbor.tests.unit.protection.fakes import resource_map
 
 
@@ -40,10 +39,14 @@ class FakeWorkflowEngine(object):
 
 
 class FakeProtectableRegistry(object):
+    def __init__(self):
+        self.build_count = 0
+
     def fetch_dependent_resources(self, resource):
         return resource_map.__getitem__(resource)
 
     def build_graph(self, context, resources):
+        self.build_count += 1
         return build_graph(
             start_nodes=resources,
             get_child_nodes_func=self.fetch_dependent_resources,
@@ -54,8 +57,7 @@ class PluggableProtectionProviderTest(base.TestCase):
     def setUp(self):
         super(PluggableProtectionProviderTest, self).setUp()
 
-    @mock.patch.object(ProtectableRegistry, 'build_graph')
-    def test_build_protect_task_flow(self, mock_build_graph):
+    def test_build_protect_task_flow(self):
         pr = ProviderRegistry()
         self.assertEqual(len(pr.providers), 1)
 
@@ -82,10 +84,6 @@ class PluggableProtectionProviderTest(base.TestCase):
             ("on_resource_end", 'A'),
             ("on_resource_start", 'B', True),
             ("on_resource_start", 'C', False),
-            ("on_resource_start", 'D', False),
-            ("on_resource_end", 'D'),
-            ("on_resource_start", 'E', False),
-            ("on_resource_end", 'E'),
             ("on_resource_end", 'C'),
             ("on_resource_end", 'B'),
         ]
@@ -93,18 +91,16 @@ class PluggableProtectionProviderTest(base.TestCase):
         fake_registry = FakeProtectableRegistry()
         plugable_provider.protectable_registry = fake_registry
 
-        fake_registry.build_graph = mock.MagicMock()
-        resource_graph = build_graph(plan_resources, resource_map.__getitem__)
-        mock_build_graph.return_value = resource_graph
-
         fake_protection_plugin = FakeProtectionPlugin(expected_calls)
-        plugable_provider._plugin_map = {
-            "fake_plugin": fake_protection_plugin
-        }
+        plugable_provider._plugin_map = {}
+        plugable_provider._plugin_type_map = {}
+        plugable_provider._register_plugin("fake_plugin",
+                                           fake_protection_plugin)
 
         result = plugable_provider.build_task_flow(ctx)
         self.assertEqual(len(result["status_getters"]), 5)
         self.assertEqual(len(result["task_flow"]), 5)
+        self.assertEqual(1, fake_registry.build_count)
 
     def test_build_restore_task_flow(self):
         pr = ProviderRegistry()
@@ -136,21 +132,34 @@ class PluggableProtectionProviderTest(base.TestCase):
             ("on_resource_end", 'A'),
             ("on_resource_start", 'B', True),
             ("on_resource_start", 'C', False),
-            ("on_resource_start", 'D', False),
-            ("on_resource_end", 'D'),
-            ("on_resource_start", 'E', False),
-            ("on_resource_end", 'E'),
             ("on_resource_end", 'C'),
             ("on_resource_end", 'B'),
         ]
 
         fake_protection_plugin = FakeProtectionPlugin(expected_calls)
-        plugable_provider._plugin_map = {
-            "fake_plugin": fake_protection_plugin
-        }
+        plugable_provider._plugin_map = {}
+        plugable_provider._plugin_type_map = {}
+        plugable_provider._register_plugin("fake_plugin",
+                                           fake_protection_plugin)
 
         result = plugable_provider.build_task_flow(ctx)
         self.assertEqual(len(result["task_flow"]), 5)
 
+    @mock.patch.object(ProtectableRegistry, 'load_plugins')
+    def test_shared_protectable_registry(self, mock_load_plugins):
+        registry = ProtectableRegistry()
+        pr = ProviderRegistry(protectable_registry=registry)
+        plugable_provider = pr.providers["fake_id1"]
+        self.assertIs(registry, plugable_provider.protectable_registry)
+        self.assertEqual(0, mock_load_plugins.call_count)
+
+    @mock.patch.object(ProtectableRegistry, 'load_plugins')
+    def test_protectable_registry_loaded_once(self, mock_load_plugins):
+        pr = ProviderRegistry()
+        plugable_provider = pr.providers["fake_id1"]
+        registry = plugable_provider.protectable_registry
+        self.assertIs(registry, plugable_provider.protectable_registry)
+        self.assertEqual(1, mock_load_plugins.call_count)
+
     def tearDown(self):
         super(PluggableProtectionProviderTest, self).tearDown()
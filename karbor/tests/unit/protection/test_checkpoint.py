@@ -10,6 +10,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
+from karbor import exception
 from karbor.resource import Resource
 from karbor.services.protection import bank_plugin
 from karbor.services.protection import checkpoint
@@ -92,3 +95,210 @@ class CheckpointTest(base.TestCase):
         self.assertEqual(len(resource_graph), len(cp.resource_graph))
         for start_node in resource_graph:
             self.assertIn(start_node, cp.resource_graph)
+
+    def test_resource_graph_loaded_lazily(self):
+        bank_plugin_instance = _InMemoryBankPlugin()
+        bank = bank_plugin.Bank(bank_plugin_instance)
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        cp.resource_graph = graph.build_graph([A, B, C, D],
+                                              resource_map.__getitem__)
+        cp.commit()
+        self.assertNotIn("resource_graph", cp._md_cache)
+
+        cp = checkpoint.Checkpoint.get_by_section(
+            checkpoints_section, indices_section, _InMemoryLeasePlugin(),
+            cp.id)
+        with mock.patch.object(bank_plugin_instance, 'get_object',
+                               wraps=bank_plugin_instance.get_object) as get:
+            self.assertIsNone(
+                cp.to_dict(include_resource_graph=False)["resource_graph"])
+            self.assertEqual(0, get.call_count)
+            self.assertIsNotNone(cp.to_dict()["resource_graph"])
+            self.assertEqual(1, get.call_count)
+            self.assertEqual(2, len(cp.resource_graph))
+            self.assertEqual(1, get.call_count)
+
+    def test_resource_graph_read_failure_retried(self):
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        cp.resource_graph = graph.build_graph([A, B, C, D],
+                                              resource_map.__getitem__)
+        cp.commit()
+
+        cp = checkpoint.Checkpoint.get_by_section(
+            checkpoints_section, indices_section, _InMemoryLeasePlugin(),
+            cp.id)
+        section = cp._checkpoint_section
+        stream = section.get_object_stream(
+            checkpoint._RESOURCE_GRAPH_FILE_NAME)
+        with mock.patch.object(section, 'get_object_stream', side_effect=[
+                exception.BankGetObjectFailed(key="graph", reason="timeout"),
+                stream]):
+            self.assertRaises(exception.BankGetObjectFailed,
+                              lambda: cp.resource_graph)
+            self.assertEqual(2, len(cp.resource_graph))
+
+    def test_missing_resource_graph(self):
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        self.assertIsNone(cp.resource_graph)
+
+    def test_resource_graph_stored_compact(self):
+        bank_plugin_instance = _InMemoryBankPlugin()
+        bank = bank_plugin.Bank(bank_plugin_instance)
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        resource_graph = graph.build_graph([A, B, C, D],
+                                           resource_map.__getitem__)
+        cp.resource_graph = resource_graph
+        cp.commit()
+        stored = bank_plugin_instance.get_object(
+            "/checkpoints/%s/%s" % (cp.id,
+                                    checkpoint._RESOURCE_GRAPH_FILE_NAME))
+        self.assertTrue(stored.startswith(graph.COMPACT_GRAPH_MAGIC))
+
+        cp = checkpoint.Checkpoint.get_by_section(
+            checkpoints_section, indices_section, _InMemoryLeasePlugin(),
+            cp.id)
+        with mock.patch.object(graph, 'decode_resource_graph',
+                               wraps=graph.decode_resource_graph) as decode:
+            self.assertEqual(resource_graph, cp.resource_graph)
+            self.assertEqual(resource_graph, cp.resource_graph)
+            self.assertEqual(1, decode.call_count)
+        self.assertEqual(resource_graph, graph.deserialize_resource_graph(
+            cp.to_dict()["resource_graph"]))
+
+        cp.purge()
+        self.assertEqual([], checkpoints_section.list_objects(
+            prefix="/%s/" % cp.id))
+
+    def test_legacy_resource_graph_in_index(self):
+        bank = bank_plugin.Bank(_InMemoryBankPlugin())
+        checkpoints_section = bank_plugin.BankSection(bank, "/checkpoints")
+        indices_section = bank_plugin.BankSection(bank, "/indices")
+        cp = checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=checkpoints_section,
+            indices_section=indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=bank.get_owner_id(),
+            plan=fake_protection_plan())
+        md = cp._md_cache
+        md["resource_graph"] = graph.serialize_resource_graph(
+            graph.build_graph([A, B, C, D], resource_map.__getitem__))
+        checkpoints_section.update_object(
+            "/%s/%s" % (cp.id, checkpoint._INDEX_FILE_NAME), md)
+
+        cp = checkpoint.Checkpoint.get_by_section(
+            checkpoints_section, indices_section, _InMemoryLeasePlugin(),
+            cp.id)
+        self.assertEqual(2, len(cp.resource_graph))
+
+
+class CheckpointIndexCacheTest(base.TestCase):
+    def setUp(self):
+        super(CheckpointIndexCacheTest, self).setUp()
+        self.bank_plugin = _InMemoryBankPlugin()
+        self.bank = bank_plugin.Bank(self.bank_plugin)
+        self.checkpoints_section = bank_plugin.BankSection(self.bank,
+                                                           "/checkpoints")
+        self.indices_section = bank_plugin.BankSection(self.bank, "/indices")
+
+    def _create_checkpoint(self, index_cache):
+        return checkpoint.Checkpoint.create_in_section(
+            checkpoints_section=self.checkpoints_section,
+            indices_section=self.indices_section,
+            bank_lease=_InMemoryLeasePlugin(),
+            owner_id=self.bank.get_owner_id(),
+            plan=fake_protection_plan(),
+            index_cache=index_cache)
+
+    def _get_checkpoint(self, checkpoint_id, index_cache):
+        return checkpoint.Checkpoint.get_by_section(
+            self.checkpoints_section, self.indices_section,
+            _InMemoryLeasePlugin(), checkpoint_id, index_cache)
+
+    def test_get_served_from_cache(self):
+        index_cache = checkpoint.CheckpointIndexCache(size=10, ttl=600)
+        cp = self._create_checkpoint(index_cache)
+        with mock.patch.object(self.bank_plugin, 'get_object') as get_object:
+            cached = self._get_checkpoint(cp.id, index_cache)
+            self.assertEqual(0, get_object.call_count)
+        self.assertEqual(cp.to_dict(), cached.to_dict())
+
+    def test_commit_writes_through(self):
+        index_cache = checkpoint.CheckpointIndexCache(size=10, ttl=600)
+        cp = self._create_checkpoint(index_cache)
+        cp.status = "available"
+        cp.commit()
+        self.assertEqual("available",
+                         self._get_checkpoint(cp.id, index_cache).status)
+
+    def test_cached_metadata_is_not_shared(self):
+        index_cache = checkpoint.CheckpointIndexCache(size=10, ttl=600)
+        cp = self._create_checkpoint(index_cache)
+        cp.status = "error"
+        self.assertEqual("protecting",
+                         self._get_checkpoint(cp.id, index_cache).status)
+
+    def test_revalidate_with_etag(self):
+        index_cache = checkpoint.CheckpointIndexCache(size=10, ttl=0)
+        cp = self._create_checkpoint(index_cache)
+        with mock.patch.object(self.bank_plugin, 'get_object_etag',
+                               return_value="etag-1"):
+            self._get_checkpoint(cp.id, index_cache)
+            with mock.patch.object(self.bank_plugin,
+                                   'get_object') as get_object:
+                self._get_checkpoint(cp.id, index_cache)
+                self.assertEqual(0, get_object.call_count)
+
+            # another service updated the checkpoint
+            md = self.checkpoints_section.get_object(
+                "/%s/%s" % (cp.id, checkpoint._INDEX_FILE_NAME))
+            md["status"] = "available"
+            self.bank_plugin.update_object(
+                "/checkpoints/%s/%s" % (cp.id, checkpoint._INDEX_FILE_NAME),
+                md)
+            self.assertEqual("protecting",
+                             self._get_checkpoint(cp.id, index_cache).status)
+        with mock.patch.object(self.bank_plugin, 'get_object_etag',
+                               return_value="etag-2"):
+            self.assertEqual("available",
+                             self._get_checkpoint(cp.id, index_cache).status)
+
+    def test_lru_eviction(self):
+        index_cache = checkpoint.CheckpointIndexCache(size=1, ttl=600)
+        cp1 = self._create_checkpoint(index_cache)
+        cp2 = self._create_checkpoint(index_cache)
+        with mock.patch.object(self.bank_plugin, 'get_object',
+                               wraps=self.bank_plugin.get_object) as get:
+            self._get_checkpoint(cp2.id, index_cache)
+            self.assertEqual(0, get.call_count)
+            self._get_checkpoint(cp1.id, index_cache)
+            self.assertEqual(1, get.call_count)
@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import calendar
 from datetime import datetime
 import mock
 
@@ -95,3 +96,103 @@ class CheckpointCollectionTest(base.TestCase):
             checkpoint.status,
             collection.get(checkpoint_id=checkpoint.id).status,
         )
+
+    def _create_checkpoints_by_day(self, collection, days, count):
+        checkpoints = {}
+        ts = 0
+        for day in days:
+            date = datetime.strptime(day, "%Y-%m-%d")
+            checkpoints[day] = []
+            for i in range(count):
+                ts += 1
+                with mock.patch.object(timeutils, 'utcnow',
+                                       return_value=date), \
+                        mock.patch.object(timeutils, 'utcnow_ts',
+                                          return_value=ts):
+                    checkpoints[day].append(
+                        collection.create(fake_protection_plan()).id)
+        return checkpoints
+
+    def test_list_checkpoints_by_date_range(self):
+        collection = self._create_test_collection()
+        days = ["2016-06-10", "2016-06-11", "2016-06-12", "2016-06-13",
+                "2016-06-14"]
+        checkpoints = self._create_checkpoints_by_day(collection, days, 2)
+        expected = (checkpoints["2016-06-11"] + checkpoints["2016-06-12"] +
+                    checkpoints["2016-06-13"])
+        indices_section = collection._indices_section
+        list_objects = indices_section.list_objects
+        listed = []
+
+        def record_list_objects(*args, **kwargs):
+            keys = list_objects(*args, **kwargs)
+            listed.extend(keys)
+            return keys
+
+        with mock.patch.object(indices_section, 'list_objects',
+                               side_effect=record_list_objects):
+            result = collection.list_ids(
+                start_date=datetime.strptime("2016-06-11", "%Y-%m-%d"),
+                end_date=datetime.strptime("2016-06-13", "%Y-%m-%d"))
+        self.assertEqual(expected, result)
+        self.assertEqual(len(expected), len(listed))
+
+    def test_list_checkpoints_by_date_range_paged(self):
+        self.override_config('checkpoint_list_page_size', 2)
+        collection = self._create_test_collection()
+        days = ["2016-06-10", "2016-06-11", "2016-06-12"]
+        checkpoints = self._create_checkpoints_by_day(collection, days, 3)
+        start_date = datetime.strptime("2016-06-11", "%Y-%m-%d")
+        end_date = datetime.strptime("2016-06-12", "%Y-%m-%d")
+        expected = checkpoints["2016-06-11"] + checkpoints["2016-06-12"]
+
+        self.assertEqual(expected, collection.list_ids(start_date=start_date,
+                                                       end_date=end_date))
+        self.assertEqual(expected[:5],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date, limit=5))
+        self.assertEqual(expected[3:],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date,
+                                             marker=expected[2]))
+        self.assertEqual(expected[1:4],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date,
+                                             marker=expected[4], limit=3,
+                                             sort_dir="desc"))
+
+    def test_list_checkpoints_by_date_range_start_mid_day(self):
+        self.override_config('checkpoint_list_page_size', 2)
+        collection = self._create_test_collection()
+        checkpoints = []
+        for created in ["2016-06-11 08:00", "2016-06-11 09:00",
+                        "2016-06-11 12:00", "2016-06-11 18:00",
+                        "2016-06-12 06:00"]:
+            date = datetime.strptime(created, "%Y-%m-%d %H:%M")
+            with mock.patch.object(timeutils, 'utcnow', return_value=date), \
+                    mock.patch.object(timeutils, 'utcnow_ts',
+                                      return_value=calendar.timegm(
+                                          date.timetuple())):
+                checkpoints.append(
+                    collection.create(fake_protection_plan()).id)
+        start_date = datetime.strptime("2016-06-11 12:00", "%Y-%m-%d %H:%M")
+        end_date = datetime.strptime("2016-06-12", "%Y-%m-%d")
+
+        self.assertEqual(checkpoints[2:],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date))
+        self.assertEqual(checkpoints[2:4],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date, limit=2))
+        self.assertEqual(checkpoints[2:4],
+                         collection.list_ids(start_date=start_date,
+                                             end_date=end_date,
+                                             marker=checkpoints[4],
+                                             sort_dir="desc"))
+
+    def test_list_checkpoints_with_marker(self):
+        collection = self._create_test_collection()
+        checkpoints = self._create_checkpoints_by_day(
+            collection, ["2016-06-10"], 5)["2016-06-10"]
+        self.assertEqual(checkpoints[2:],
+                         collection.list_ids(marker=checkpoints[1]))
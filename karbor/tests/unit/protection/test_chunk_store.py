@@ -0,0 +1,172 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+
+import eventlet
+import mock
+
+from karbor import exception
+from karbor.services.protection.bank_plugin import Bank
+from karbor.services.protection.chunk_store import ChunkStore
+from karbor.services.protection.chunk_store import ContentDefinedChunker
+from karbor.tests import base
+from karbor.tests.unit.protection.test_bank import _InMemoryBankPlugin
+
+
+class ContentDefinedChunkerTest(base.TestCase):
+    def test_split(self):
+        data = os.urandom(100000)
+        chunker = ContentDefinedChunker(256, 1024, 4096)
+        chunks = list(chunker.split(data[i:i + 999]
+                                    for i in range(0, len(data), 999)))
+        self.assertEqual(data, b"".join(chunks))
+        for chunk in chunks[:-1]:
+            self.assertTrue(256 <= len(chunk) <= 4096)
+
+    def test_boundaries_resynchronize(self):
+        data = os.urandom(100000)
+        chunker = ContentDefinedChunker(256, 1024, 4096)
+        chunks = list(chunker.split(iter([data])))
+        shifted_chunks = list(chunker.split(iter([b"x" + data])))
+        self.assertTrue(len(set(chunks) & set(shifted_chunks)) >
+                        len(chunks) // 2)
+
+    def test_invalid_sizes(self):
+        self.assertRaises(exception.InvalidInput,
+                          ContentDefinedChunker, 1024, 256, 4096)
+
+
+class _EtagBankPlugin(_InMemoryBankPlugin):
+    def get_object_etag(self, key):
+        if key not in self._data:
+            raise exception.BankObjectNotFound(key=key)
+        return hashlib.md5(repr(self._data[key]).encode("utf-8")).hexdigest()
+
+    def delete_object(self, key):
+        if key not in self._data:
+            raise exception.BankDeleteObjectFailed(key=key, reason="404")
+        del self._data[key]
+
+
+class ChunkStoreTest(base.TestCase):
+    def setUp(self):
+        super(ChunkStoreTest, self).setUp()
+        self.bank_plugin = _EtagBankPlugin()
+        self.chunk_store = ChunkStore(Bank(self.bank_plugin), 256, 1024, 4096)
+        self.chunk_store.deleting_poll_interval = 0.01
+
+    def _chunk_keys(self):
+        return [key for key in self.bank_plugin._data
+                if ".refs/" not in key and ".deleting/" not in key]
+
+    def test_write_read(self):
+        data = os.urandom(20000)
+        chunk_list = self.chunk_store.write(iter([data]), "holder1",
+                                            max_in_flight=2)
+        self.assertEqual(len(data), sum(chunk_list["sizes"]))
+        self.assertEqual("holder1", chunk_list["holder"])
+        self.assertEqual(
+            data, b"".join(self.chunk_store.read(chunk_list, max_in_flight=2)))
+
+    def test_write_deduplicates(self):
+        data = os.urandom(20000)
+        first = self.chunk_store.write(iter([data]), "holder1")
+        stored = len(self._chunk_keys())
+        with mock.patch.object(self.bank_plugin, 'create_object_stream') \
+                as create_object_stream:
+            second = self.chunk_store.write(iter([data]), "holder2")
+        self.assertEqual(first["chunks"], second["chunks"])
+        self.assertEqual(stored, len(self._chunk_keys()))
+        self.assertFalse(create_object_stream.called)
+
+    def test_write_deduplicates_without_etags(self):
+        self.bank_plugin = _InMemoryBankPlugin()
+        self.chunk_store = ChunkStore(Bank(self.bank_plugin), 256, 1024, 4096)
+        data = os.urandom(20000)
+        first = self.chunk_store.write(iter([data]), "holder1")
+        stored = len(self._chunk_keys())
+        self.assertEqual(len(first["chunks"]), stored)
+        with mock.patch.object(self.bank_plugin, 'create_object_stream') \
+                as create_object_stream:
+            second = self.chunk_store.write(iter([data]), "holder2")
+        self.assertEqual(first["chunks"], second["chunks"])
+        self.assertFalse(create_object_stream.called)
+        self.assertEqual(data, b"".join(self.chunk_store.read(second)))
+
+    def test_invalid_holder(self):
+        self.assertRaises(exception.InvalidInput, self.chunk_store.write,
+                          iter([b"data"]), "holder/1")
+
+    def test_release(self):
+        data = os.urandom(20000)
+        first = self.chunk_store.write(iter([data]), "holder1")
+        second = self.chunk_store.write(iter([data]), "holder2")
+        self.chunk_store.release(first)
+        self.assertEqual(data, b"".join(self.chunk_store.read(second)))
+        self.chunk_store.release(second)
+        self.assertEqual({}, dict(self.bank_plugin._data))
+
+    def test_release_is_idempotent(self):
+        data = os.urandom(20000)
+        first = self.chunk_store.write(iter([data]), "holder1")
+        second = self.chunk_store.write(iter([data]), "holder2")
+        self.chunk_store.release(first)
+        # a retried deletion does not drop the references of other holders
+        self.chunk_store.release(first)
+        self.assertEqual(data, b"".join(self.chunk_store.read(second)))
+        self.chunk_store.release(second)
+        self.assertEqual({}, dict(self.bank_plugin._data))
+
+    def test_release_read_failure(self):
+        data = os.urandom(20000)
+        chunk_list = self.chunk_store.write(iter([data]), "holder1")
+        stored = dict(self.bank_plugin._data)
+        with mock.patch.object(
+                self.bank_plugin, 'list_objects',
+                side_effect=exception.BankListObjectsFailed(
+                    reason="timeout")):
+            self.assertRaises(exception.BankListObjectsFailed,
+                              self.chunk_store.release, chunk_list)
+        for key in self._chunk_keys():
+            self.assertEqual(stored[key], self.bank_plugin._data[key])
+
+    def test_write_existence_check_failure(self):
+        data = os.urandom(20000)
+        with mock.patch.object(
+                self.bank_plugin, 'get_object_etag',
+                side_effect=exception.BankGetObjectFailed(
+                    key="key", reason="timeout")):
+            self.assertRaises(exception.BankGetObjectFailed,
+                              self.chunk_store.write, iter([data]),
+                              "holder1")
+
+    def test_write_waits_for_concurrent_release(self):
+        data = os.urandom(2000)
+        chunk_list = self.chunk_store.write(iter([data]), "holder1")
+        digest = chunk_list["chunks"][0]
+        deleting_key = "/chunks/%s/%s.deleting/holder0" % (digest[:2], digest)
+        # a release which did not see the reference of the writer
+        self.bank_plugin._data[deleting_key] = "holder0"
+        chunk_keys = self._chunk_keys()
+        for key in chunk_keys:
+            del self.bank_plugin._data[key]
+
+        writer = eventlet.spawn(self.chunk_store.write, iter([data]),
+                                "holder2")
+        eventlet.sleep(0.05)
+        self.assertEqual([], self._chunk_keys())
+        del self.bank_plugin._data[deleting_key]
+        second = writer.wait()
+        self.assertEqual(sorted(chunk_keys), sorted(self._chunk_keys()))
+        self.assertEqual(data, b"".join(self.chunk_store.read(second)))
@@ -12,6 +12,8 @@
 
 import collections
 import datetime
+
+from cinderclient.exceptions import NotFound
 from karbor.common import constants
 from karbor.context import RequestContext
 from karbor.resource import Resource
@@ -19,6 +21,8 @@ from karbor.services.protection.bank_plugin import Bank
 from karbor.services.protection.bank_plugin import BankPlugin
 from karbor.services.protection.bank_plugin import BankSection
 from karbor.services.protection.client_factory import ClientFactory
+from karbor.services.protection.protection_plugins.volume import \
+    backup_poller
 from karbor.services.protection.protection_plugins.volume. \
     cinder_protection_plugin import CinderProtectionPlugin
 from karbor.services.protection.protection_plugins.volume \
@@ -73,11 +77,14 @@ class FakeCheckpoint(object):
     def get_resource_bank_section(self, resource_id):
         return self.bank_section
 
+FakeBackup = collections.namedtuple("FakeBackup", ["id", "status"])
+
 
 class CinderProtectionPluginTest(base.TestCase):
     def setUp(self):
         super(CinderProtectionPluginTest, self).setUp()
         self.plugin = CinderProtectionPlugin()
+        self.plugin._backup_poller = mock.MagicMock()
         cfg.CONF.set_default('cinder_endpoint',
                              'http://127.0.0.1:8776/v2',
                              'cinder_client')
@@ -85,6 +92,8 @@ class CinderProtectionPluginTest(base.TestCase):
         self.cntxt = RequestContext(user_id='admin',
                                     project_id='abcd',
                                     auth_token='efgh')
+        # the tests mock methods of the shared client
+        self.addCleanup(ClientFactory.clear_cache)
         self.cinder_client = ClientFactory.create_client("cinder", self.cntxt)
         self.checkpoint = FakeCheckpoint()
 
@@ -133,6 +142,9 @@ class CinderProtectionPluginTest(base.TestCase):
 
         self.plugin.create_backup(self.cntxt, self.checkpoint,
                                   node=resource_node)
+        self.plugin._backup_poller.watch.assert_called_once_with(
+            'abcd', self.cinder_client,
+            self.cinder_client.backups.create.return_value.id, mock.ANY)
 
     def test_delete_backup(self):
         resource = Resource(id="123",
@@ -156,6 +168,22 @@ class CinderProtectionPluginTest(base.TestCase):
 
         self.plugin.delete_backup(self.cntxt, self.checkpoint,
                                   node=resource_node)
+        self.plugin._backup_poller.watch.assert_called_once_with(
+            'abcd', self.cinder_client, "456", mock.ANY)
+
+    def test_backup_status_published(self):
+        self.plugin._set_resource_status = mock.MagicMock()
+        self.plugin._on_backup_status("checkpoint_id", "123",
+                                      fake_bank_section, "create",
+                                      FakeBackup("456", "available"))
+        self.plugin._on_backup_status("checkpoint_id", "123",
+                                      fake_bank_section, "delete", None)
+        self.assertEqual(
+            [mock.call(fake_bank_section, "checkpoint_id", "123",
+                       constants.RESOURCE_STATUS_AVAILABLE),
+             mock.call(fake_bank_section, "checkpoint_id", "123",
+                       constants.RESOURCE_STATUS_DELETED)],
+            self.plugin._set_resource_status.mock_calls)
 
     def test_restore_backup(self):
         heat_template = HeatTemplate()
@@ -201,3 +229,50 @@ class CinderProtectionPluginTest(base.TestCase):
 
     def tearDown(self):
         super(CinderProtectionPluginTest, self).tearDown()
+
+
+class BackupStatusPollerTest(base.TestCase):
+    def setUp(self):
+        super(BackupStatusPollerTest, self).setUp()
+        self.poller = backup_poller.BackupStatusPoller(5, 60)
+        self.poller._running = True
+        self.client = mock.MagicMock()
+
+    def test_poll_batches_backups(self):
+        callback = mock.MagicMock()
+        events = [self.poller.watch("project", self.client, str(i), callback)
+                  for i in range(100)]
+        self.client.backups.list.return_value = [
+            FakeBackup(str(i), "available" if i % 2 else "creating")
+            for i in range(100)]
+        self.poller.poll(now=float("inf"))
+        self.assertEqual(1, self.client.backups.list.call_count)
+        self.assertFalse(self.client.backups.get.called)
+        self.assertEqual(50, callback.call_count)
+        self.assertEqual([i % 2 == 1 for i in range(100)],
+                         [e.ready() for e in events])
+        self.assertEqual(FakeBackup("1", "available"), events[1].wait())
+
+    def test_poll_backoff(self):
+        self.poller.watch("project", self.client, "456")
+        watched = self.poller._groups["project"]["456"]
+        self.client.backups.list.return_value = [
+            FakeBackup("456", "creating")]
+        intervals = []
+        for i in range(6):
+            self.poller.poll(now=watched.next_poll)
+            intervals.append(watched.interval)
+        self.assertEqual([10, 20, 40, 60, 60, 60], intervals)
+        # backups which are not due are not listed
+        self.poller.poll(now=watched.next_poll - 1)
+        self.assertEqual(6, self.client.backups.list.call_count)
+
+    def test_poll_backup_not_listed(self):
+        event = self.poller.watch("project", self.client, "456")
+        self.client.backups.list.return_value = []
+        self.client.backups.get.side_effect = NotFound(404)
+        self.poller.poll(now=float("inf"))
+        self.client.backups.get.assert_called_once_with("456")
+        self.assertTrue(event.ready())
+        self.assertIsNone(event.wait())
+        self.assertEqual({}, self.poller._groups)
@@ -0,0 +1,137 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import mock
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from karbor.services.protection.client_factory import ClientFactory
+from karbor.services.protection.clients import nova
+from karbor.services.protection import utils
+from karbor.tests import base
+
+
+class FakeContext(object):
+    def __init__(self, project_id='abcd', auth_token='efgh',
+                 auth_token_info=None):
+        self.project_id = project_id
+        self.auth_token = auth_token
+        self.auth_token_info = auth_token_info
+        self.service_catalog = []
+
+
+class ClientFactoryCacheTest(base.TestCase):
+    def setUp(self):
+        super(ClientFactoryCacheTest, self).setUp()
+        ClientFactory.clear_cache()
+        self.addCleanup(ClientFactory.clear_cache)
+        self.override_config('nova_endpoint', 'http://127.0.0.1:8774/v2.1',
+                             'nova_client')
+        self.create = mock.Mock(side_effect=lambda *args, **kwargs:
+                                mock.Mock())
+        patcher = mock.patch.object(ClientFactory, '_factory',
+                                    {'nova': mock.Mock(create=self.create)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuse_client_of_token(self):
+        client = ClientFactory.create_client('nova', FakeContext())
+        self.assertIs(client,
+                      ClientFactory.create_client('nova', FakeContext()))
+        self.assertIsNot(client, ClientFactory.create_client(
+            'nova', FakeContext(auth_token='other')))
+        self.assertIsNot(client, ClientFactory.create_client(
+            'nova', FakeContext(project_id='other')))
+        self.assertEqual(3, self.create.call_count)
+
+    def test_endpoint_change(self):
+        client = ClientFactory.create_client('nova', FakeContext())
+        self.override_config('nova_endpoint', 'http://10.0.0.1:8774/v2.1',
+                             'nova_client')
+        self.assertIsNot(client,
+                         ClientFactory.create_client('nova', FakeContext()))
+
+    def _provider_conf(self, endpoint):
+        conf = cfg.ConfigOpts()
+        conf([])
+        conf.register_opts(nova.nova_client_opts, group='nova_client')
+        conf.set_override('nova_endpoint', endpoint, 'nova_client')
+        return conf
+
+    def test_keyed_by_conf_values(self):
+        conf = self._provider_conf('http://10.0.0.1:8774/v2.1')
+        client = ClientFactory.create_client('nova', FakeContext(), conf)
+        self.assertIsNot(client, ClientFactory.create_client(
+            'nova', FakeContext(),
+            self._provider_conf('http://10.0.0.2:8774/v2.1')))
+        self.assertIs(client, ClientFactory.create_client(
+            'nova', FakeContext(),
+            self._provider_conf('http://10.0.0.1:8774/v2.1')))
+        self.assertEqual(2, self.create.call_count)
+
+    def test_unregistered_conf_cached_after_create(self):
+        conf = cfg.ConfigOpts()
+        conf([])
+
+        def create(context, conf):
+            conf.register_opts(nova.nova_client_opts, group='nova_client')
+            return mock.Mock()
+        self.create.side_effect = create
+        client = ClientFactory.create_client('nova', FakeContext(), conf)
+        self.assertIs(client,
+                      ClientFactory.create_client('nova', FakeContext(), conf))
+        self.assertEqual(1, self.create.call_count)
+
+    @mock.patch.object(utils, 'get_url')
+    def test_endpoint_not_resolved_on_hit(self, get_url):
+        ClientFactory.create_client('nova', FakeContext())
+        ClientFactory.create_client('nova', FakeContext())
+        get_url.assert_not_called()
+
+    def test_explicit_credentials_not_cached(self):
+        ClientFactory.create_client('nova', FakeContext(), password='pwd')
+        ClientFactory.create_client('nova', FakeContext(), password='pwd')
+        self.assertEqual(2, self.create.call_count)
+        self.assertEqual({}, ClientFactory._clients)
+
+    def test_ttl_expiry(self):
+        self.override_config('client_cache_ttl', 0)
+        client = ClientFactory.create_client('nova', FakeContext())
+        self.assertIsNot(client,
+                         ClientFactory.create_client('nova', FakeContext()))
+
+    def test_token_expiry(self):
+        def token_info(expires_in):
+            expires = timeutils.utcnow() + datetime.timedelta(
+                seconds=expires_in)
+            return {'token': {'expires_at': expires.isoformat() + 'Z'}}
+
+        context = FakeContext(auth_token_info=token_info(30))
+        client = ClientFactory.create_client('nova', context)
+        self.assertIsNot(client, ClientFactory.create_client('nova', context))
+
+        context = FakeContext(auth_token_info=token_info(3600))
+        client = ClientFactory.create_client('nova', context)
+        self.assertIs(client, ClientFactory.create_client('nova', context))
+
+    def test_lru_eviction(self):
+        self.override_config('client_cache_size', 2)
+        first = ClientFactory.create_client('nova', FakeContext('p1'))
+        ClientFactory.create_client('nova', FakeContext('p2'))
+        ClientFactory.create_client('nova', FakeContext('p1'))
+        ClientFactory.create_client('nova', FakeContext('p3'))
+        self.assertEqual(2, len(ClientFactory._clients))
+        self.assertIs(first,
+                      ClientFactory.create_client('nova', FakeContext('p1')))
+        self.assertEqual(3, self.create.call_count)
@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mmap
+import mock
+import os
+import shutil
+import tempfile
+
+from oslo_config import cfg
+from oslo_utils import importutils
+
+from karbor import exception
+from karbor.services.protection import bank_codec
+from karbor.services.protection import bank_plugin
+from karbor.services.protection.bank_plugins import file_system_bank_plugin
+from karbor.tests import base
+
+CONF = cfg.CONF
+
+
+class FileSystemBankPluginTest(base.TestCase):
+    def setUp(self):
+        super(FileSystemBankPluginTest, self).setUp()
+        self.bank_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.bank_path)
+        import_str = "karbor.services.protection.bank_plugins." \
+                     "file_system_bank_plugin.FileSystemBankPlugin"
+        plugin_cls = importutils.import_class(import_str=import_str)
+        self.conf = cfg.ConfigOpts()
+        self.conf.register_opts(
+            file_system_bank_plugin.file_system_bank_plugin_opts,
+            "file_system_bank_plugin")
+        self.conf.set_override("file_system_bank_path", self.bank_path,
+                               "file_system_bank_plugin")
+        self.conf.set_override("file_system_bank_mmap_threshold", 16,
+                               "file_system_bank_plugin")
+        self.plugin = plugin_cls(self.conf)
+
+    def test_create_get_object(self):
+        self.plugin.create_object("/key-1", "value-1")
+        self.plugin.create_object("/key-2", {"value": 2})
+        self.plugin.create_object("/key-3", b"value-3")
+        self.assertEqual("value-1", self.plugin.get_object("/key-1"))
+        self.assertEqual({"value": 2}, self.plugin.get_object("/key-2"))
+        self.assertEqual(b"value-3", self.plugin.get_object("/key-3"))
+        # the metadata is stored in the object file itself
+        with open(os.path.join(self.bank_path, "objects", "key-1")) as f:
+            self.assertEqual('{"serialized": false}\nvalue-1', f.read())
+        self.assertEqual(["objects", "tmp"],
+                         sorted(os.listdir(self.bank_path)))
+
+    def test_update_object(self):
+        self.plugin.create_object("/key", {"value": 1})
+        self.plugin.update_object("/key", b"raw")
+        self.assertEqual(b"raw", self.plugin.get_object("/key"))
+        self.assertEqual([], os.listdir(os.path.join(self.bank_path, "tmp")))
+
+    def test_get_large_object_mapped(self):
+        value = b"segment" * 10
+        self.plugin.create_object_stream("/data/0", iter([value]))
+        self.assertEqual(value, self.plugin.get_object("/data/0"))
+        with mock.patch.object(mmap, "mmap", wraps=mmap.mmap) as mock_mmap:
+            chunks = list(self.plugin.get_object_stream("/data/0", 16))
+            self.assertEqual(1, mock_mmap.call_count)
+        self.assertEqual(5, len(chunks))
+        self.assertEqual(value, b"".join(chunks))
+
+    def test_get_large_object_not_copied(self):
+        value = b"segment" * 10
+        self.plugin.create_object_stream("/data/0", iter([value]))
+        with mock.patch.object(mmap, "mmap", wraps=mmap.mmap) as mock_mmap:
+            body = self.plugin.get_object("/data/0")
+            self.assertEqual(1, mock_mmap.call_count)
+        self.assertNotIsInstance(body, bytes)
+        self.assertEqual(value, bytes(body))
+        self.plugin.create_object("/data/1", b"small")
+        self.assertEqual(b"small", self.plugin.get_object("/data/1"))
+        self.plugin.create_object("/data/2", {"value": "x" * 20})
+        self.assertEqual({"value": "x" * 20},
+                         self.plugin.get_object("/data/2"))
+
+    def test_get_object_info(self):
+        self.plugin.create_object_stream("/data/0", iter([b"small"]),
+                                         metadata={"codec": "none"})
+        self.assertEqual((5, {"codec": "none"}),
+                         self.plugin.get_object_info("/data/0"))
+        self.assertRaises(exception.BankObjectNotFound,
+                          self.plugin.get_object_info, "/data/1")
+
+    def test_object_stream_codec(self):
+        bank = bank_plugin.Bank(self.plugin, codec=bank_codec.CODEC_ZLIB)
+        value = b"segment" * 100
+        bank.create_object_stream("/data/0", iter([value]))
+        self.assertLess(self.plugin.get_object_info("/data/0")[0],
+                        len(value))
+        self.assertEqual(value, bank.get_object("/data/0"))
+        self.assertEqual(value,
+                         b"".join(bank.get_object_stream("/data/0", 16)))
+
+    def test_get_object_stream_from_file(self):
+        self.plugin.create_object_stream("/data/0", iter([b"small"]))
+        self.assertEqual(b"small", self.plugin.get_object("/data/0"))
+        self.assertEqual([b"small"],
+                         list(self.plugin.get_object_stream("/data/0")))
+
+    def test_delete_object(self):
+        self.plugin.create_object("/key", "value")
+        self.plugin.delete_object("/key")
+        self.assertRaises(exception.BankGetObjectFailed,
+                          self.plugin.get_object, "/key")
+        self.assertRaises(exception.BankDeleteObjectFailed,
+                          self.plugin.delete_object, "/key")
+
+    def test_invalid_key(self):
+        self.assertRaises(exception.InvalidInput,
+                          self.plugin.create_object, "/../key", "value")
+
+    def test_bank_path_with_symlink(self):
+        link = os.path.join(self.bank_path, "link")
+        os.symlink(self.bank_path, link)
+        self.conf.set_override("file_system_bank_path", link + "/",
+                               "file_system_bank_plugin")
+        plugin = file_system_bank_plugin.FileSystemBankPlugin(self.conf)
+        plugin.create_object("/key", "value")
+        self.assertEqual("value", self.plugin.get_object("/key"))
+        self.assertRaises(exception.InvalidInput,
+                          plugin.create_object, "/../key", "value")
+
+    def test_list_objects(self):
+        for key in ("/a/1", "/a/2", "/a/3", "/a/10", "/ab/1", "/b"):
+            self.plugin.create_object(key, "value")
+        self.assertEqual(["/a/1", "/a/10", "/a/2", "/a/3"],
+                         self.plugin.list_objects(prefix="/a/"))
+        self.assertEqual(["/a/1", "/a/10", "/a/2", "/a/3", "/ab/1"],
+                         self.plugin.list_objects(prefix="/a"))
+        self.assertEqual(["/a/2", "/a/3"],
+                         self.plugin.list_objects(prefix="/a/",
+                                                  marker="/a/10"))
+        self.assertEqual(["/a/1", "/a/10"],
+                         self.plugin.list_objects(prefix="/a/", limit=2))
+        self.assertEqual(["/a/10", "/a/2"],
+                         self.plugin.list_objects(prefix="/a/", limit=2,
+                                                  marker="/a/3",
+                                                  sort_dir="desc"))
+        self.assertEqual([],
+                         self.plugin.list_objects(prefix="/c/"))
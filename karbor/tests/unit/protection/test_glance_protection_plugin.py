@@ -67,6 +67,7 @@ Image = collections.namedtuple(
 
 class CheckpointCollection(object):
     def __init__(self):
+        self.id = "checkpoint_id"
         self.bank_section = fake_bank_section
 
     def get_resource_bank_section(self, resource_id):
@@ -84,6 +85,8 @@ class GlanceProtectionPluginTest(base.TestCase):
         self.cntxt = RequestContext(user_id='admin',
                                     project_id='abcd',
                                     auth_token='efgh')
+        # the tests mock methods of the shared client
+        self.addCleanup(ClientFactory.clear_cache)
         self.glance_client = ClientFactory.create_client("glance", self.cntxt)
         self.checkpoint = CheckpointCollection()
 
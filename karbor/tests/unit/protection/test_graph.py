@@ -10,10 +10,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 from collections import namedtuple
+import mock
 from oslo_serialization import jsonutils
 from oslo_serialization import msgpackutils
+import sys
 
 from karbor import exception
+from karbor.resource import Resource
 import karbor.services.protection.graph as graph
 from karbor.tests import base
 
@@ -179,6 +182,83 @@ class GraphBuilderTest(base.TestCase):
             self.assertIn(start_node, unpacked_graph)
 
 
+class CompactGraphFormatTest(base.TestCase):
+    def setUp(self):
+        super(CompactGraphFormatTest, self).setUp()
+        resources = {name: Resource(type="OS::Test::%s" % name[0],
+                                    id=name, name=None if name == "C2"
+                                    else u"n\xe4me-%s" % name)
+                     for name in ("A1", "B1", "B2", "C1", "C2", "C3")}
+        base_graph = {
+            "A1": ["B1", "B2"],
+            "B1": ["C1", "C2"],
+            "B2": ["C3", "C2"],
+            "C1": [],
+            "C2": [],
+            "C3": [],
+        }
+        self.resource_graph = graph.build_graph(
+            [resources[name] for name in sorted(base_graph)],
+            lambda resource: [resources[name]
+                              for name in base_graph[resource.id]])
+
+    def test_encode_decode(self):
+        encoded = graph.encode_resource_graph(self.resource_graph)
+        self.assertTrue(encoded.startswith(graph.COMPACT_GRAPH_MAGIC))
+        self.assertEqual(self.resource_graph,
+                         graph.deserialize_resource_graph(encoded))
+        # shared nodes are only written once
+        self.assertEqual(1, encoded.count(b"C2"))
+        self.assertLess(len(encoded),
+                        len(graph.serialize_resource_graph(
+                            self.resource_graph)) / 2)
+
+    def test_decode_stream(self):
+        encoded = graph.encode_resource_graph(self.resource_graph)
+        chunks = (encoded[i:i + 3] for i in range(0, len(encoded), 3))
+        result = graph.decode_resource_graph(chunks)
+        self.assertEqual(self.resource_graph, result)
+        a1 = result[0]
+        self.assertIs(a1.child_nodes[0].child_nodes[1],
+                      a1.child_nodes[1].child_nodes[1])
+
+    def test_decode_stream_exhausted(self):
+        encoded = graph.encode_resource_graph(self.resource_graph)
+        exhausted = []
+
+        def chunks():
+            yield encoded[:10]
+            yield encoded[10:]
+            exhausted.append(True)
+
+        self.assertEqual(self.resource_graph,
+                         graph.decode_resource_graph(chunks()))
+        self.assertEqual([True], exhausted)
+
+    def test_decode_legacy_json(self):
+        serialized = graph.serialize_resource_graph(self.resource_graph)
+        self.assertEqual(self.resource_graph,
+                         graph.deserialize_resource_graph(serialized))
+        chunks = iter((serialized[:5].encode("utf-8"),
+                       serialized[5:].encode("utf-8")))
+        self.assertEqual(self.resource_graph,
+                         graph.decode_resource_graph(chunks))
+
+    def test_decode_invalid(self):
+        encoded = graph.encode_resource_graph(self.resource_graph)
+        self.assertRaises(exception.InvalidInput,
+                          graph.deserialize_resource_graph,
+                          encoded[:-1])
+        self.assertRaises(exception.InvalidInput,
+                          graph.deserialize_resource_graph,
+                          encoded + b"\x00")
+        unknown_version = bytearray(encoded)
+        unknown_version[len(graph.COMPACT_GRAPH_MAGIC)] = 0xff
+        self.assertRaises(exception.InvalidInput,
+                          graph.deserialize_resource_graph,
+                          bytes(unknown_version))
+
+
 class _TestGraphWalkerListener(graph.GraphWalkerListener):
     def __init__(self, expected_event_stream, test):
         # Because the testing famework is badly designed
@@ -261,3 +341,48 @@ class GraphWalkerTest(base.TestCase):
             keys = list(g.keys())
             keys.sort()
             walker.walk_graph(graph.build_graph(keys, g.__getitem__))
+
+    def test_graph_walker_visit_once(self):
+        g = {
+            'A': ['C'],
+            'B': ['C'],
+            'C': ['D'],
+            'D': [],
+        }
+        expected_calls = (
+            ("on_node_enter", 'A', False),
+            ("on_node_enter", 'C', False),
+            ("on_node_enter", 'D', False),
+            ("on_node_exit", 'D'),
+            ("on_node_exit", 'C'),
+            ("on_node_exit", 'A'),
+            ("on_node_enter", 'B', False),
+            ("on_node_enter", 'C', True),
+            ("on_node_exit", 'C'),
+            ("on_node_exit", 'B'),
+        )
+        listener = _TestGraphWalkerListener(expected_calls, self)
+        walker = graph.GraphWalker()
+        walker.register_listener(listener)
+        walker.walk_graph(graph.build_graph(sorted(g), g.__getitem__),
+                          visit_once=True)
+
+    def test_deep_graph(self):
+        depth = sys.getrecursionlimit() * 2
+        g = {i: [i + 1] for i in range(depth)}
+        g[depth] = []
+        result_graph = graph.build_graph([0], g.__getitem__)
+        self.assertEqual(1, len(result_graph))
+
+        listener = mock.Mock()
+        walker = graph.GraphWalker()
+        walker.register_listener(listener)
+        walker.walk_graph(result_graph)
+        self.assertEqual(depth + 1, listener.on_node_enter.call_count)
+        self.assertEqual(depth + 1, listener.on_node_exit.call_count)
+
+        packed_graph = graph.pack_graph(result_graph)
+        self.assertEqual(depth + 1, len(packed_graph.nodes))
+        self.assertEqual(depth, len(packed_graph.adjacency))
+        unpacked_graph = graph.unpack_graph(packed_graph)
+        self.assertEqual(0, unpacked_graph[0].value)
@@ -0,0 +1,85 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+import mock
+
+from karbor import exception
+from karbor.services.protection.protection_plugins import image_waiter
+from karbor.tests import base
+
+Image = collections.namedtuple("Image", ["id", "status"])
+
+
+class FakeImages(object):
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.gets = collections.Counter()
+
+    def get(self, image_id):
+        self.gets[image_id] += 1
+        statuses = self.statuses[image_id]
+        status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        return Image(image_id, status)
+
+
+class ImageReadinessWaiterTest(base.TestCase):
+    def setUp(self):
+        super(ImageReadinessWaiterTest, self).setUp()
+        self.waiter = image_waiter.ImageReadinessWaiter(0.01, 0.04)
+        self.client = mock.MagicMock()
+
+    def test_wait_active(self):
+        self.client.images = FakeImages({
+            "image1": ["queued", "saving", "active"],
+            "image2": ["active"]})
+        threads = [eventlet.spawn(self.waiter.wait, self.client, image_id,
+                                  timeout=10)
+                   for image_id in ("image1", "image2")]
+        self.assertEqual([Image("image1", "active"),
+                          Image("image2", "active")],
+                         [thread.wait() for thread in threads])
+        self.assertEqual({"image1": 3, "image2": 1}, self.client.images.gets)
+
+    def test_wait_ready_predicate(self):
+        self.client.images = FakeImages({"image1": ["queued", "saving"]})
+        image = self.waiter.wait(
+            self.client, "image1", timeout=10,
+            is_ready=lambda image: image.status != "queued")
+        self.assertEqual("saving", image.status)
+
+    def test_wait_failed_image(self):
+        self.client.images = FakeImages({"image1": ["saving", "killed"]})
+        self.assertRaises(exception.ImageNotReady, self.waiter.wait,
+                          self.client, "image1", timeout=10)
+
+    def test_wait_deadline(self):
+        self.client.images = FakeImages({"image1": ["saving"]})
+        self.assertRaises(exception.ImageNotReady, self.waiter.wait,
+                          self.client, "image1", timeout=0.1)
+        # the backoff is capped at the maximal interval
+        self.assertLessEqual(self.client.images.gets["image1"], 6)
+
+    def test_poll_backoff(self):
+        self.client.images = FakeImages({"image1": ["saving"]})
+        self.waiter._running = True
+        eventlet.spawn_n(self.waiter.wait, self.client, "image1",
+                         timeout=10)
+        eventlet.sleep(0)
+        pending, = self.waiter._pending
+        intervals = []
+        for i in range(4):
+            self.waiter.poll(now=pending.next_poll)
+            intervals.append(pending.interval)
+        self.assertEqual([0.02, 0.04, 0.04, 0.04], intervals)
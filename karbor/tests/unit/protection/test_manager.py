@@ -40,6 +40,12 @@ class ProtectionServiceTest(base.TestCase):
         self.pro_manager = manager.ProtectionManager()
         self.protection_plan = fakes.fake_protection_plan()
 
+    def test_providers_share_protectable_registry(self):
+        for provider_instance in \
+                self.pro_manager.provider_registry.providers.values():
+            self.assertIs(self.pro_manager.protectable_registry,
+                          provider_instance.protectable_registry)
+
     @mock.patch.object(protectable_registry.ProtectableRegistry,
                        'list_resource_types')
     def test_list_protectable_types(self, mocker):
@@ -140,6 +146,20 @@ class ProtectionServiceTest(base.TestCase):
                                               'fake_checkpoint')
         self.assertEqual(cp['id'], 'fake_checkpoint')
 
+    @mock.patch.object(provider.ProviderRegistry, 'show_provider')
+    def test_list_checkpoints(self, mock_provider):
+        fake_provider = fakes.FakeProvider()
+        fake_provider.list_checkpoints = mock.MagicMock(
+            return_value=['checkpoint1', 'checkpoint2'])
+        mock_provider.return_value = fake_provider
+        context = mock.MagicMock()
+        checkpoints = self.pro_manager.list_checkpoints(
+            context, 'provider1', filters={})
+        self.assertEqual(2, len(checkpoints))
+        for checkpoint in checkpoints:
+            self.assertEqual('fake_checkpoint', checkpoint['id'])
+            self.assertIsNone(checkpoint['resource_graph'])
+
     @mock.patch.object(provider.ProviderRegistry, 'show_provider')
     @mock.patch.object(fakes.FakeCheckpointCollection, 'get')
     def test_show_checkpoint_not_found(self, mock_provider,
@@ -44,6 +44,10 @@ class Volume(object):
         self.attachments = attachments
 
 
+VolumeAttachment = collections.namedtuple("VolumeAttachment",
+                                          ["volumeId", "device"])
+
+
 class Image(object):
     def __init__(self, id, status, disk_format, container_format):
         self.id = id
@@ -139,8 +143,17 @@ class FakeNovaClient(object):
         def __getattr__(self, item):
             return None
 
+    class Volumes(object):
+        def get_server_volumes(self, server_id):
+            return [VolumeAttachment(volumeId=attachment["volume_id"],
+                                     device=attachment["device"])
+                    for volume in FakeVolumes.values()
+                    for attachment in volume.attachments
+                    if attachment["server_id"] == server_id]
+
     def __init__(self):
         self.servers = self.Servers()
+        self.volumes = self.Volumes()
 
 
 class FakeGlanceClient(object):
@@ -162,23 +175,15 @@ class FakeGlanceClient(object):
         self.images = self.Images()
 
 
-class FakeCinderClient(object):
-    class Volumes(object):
-        def get(self, volume_id):
-            return FakeVolumes[volume_id]
-
-        def __getattr__(self, item):
-            return None
-
+class FakeNeutronClient(object):
     def __init__(self):
-        self.volumes = self.Volumes()
+        self.list_ports_calls = 0
 
-
-class FakeNeutronClient(object):
-    def list_ports(self, mac_address):
+    def list_ports(self, **filters):
+        self.list_ports_calls += 1
         result_ports = []
         for port in FakePorts["ports"]:
-            if port["mac_address"] == mac_address:
+            if all(port[key] == value for key, value in filters.items()):
                 result_ports.append(port)
         return {"ports": result_ports}
 
@@ -201,7 +206,7 @@ class FakeBankPlugin(BankPlugin):
         return value
 
     def list_objects(self, prefix=None, limit=None, marker=None,
-                     sort_dir=None):
+                     sort_dir=None, end_marker=None):
         objects_name = []
         if prefix is not None:
             for key, value in self._objects.items():
@@ -247,7 +252,6 @@ class NovaProtectionPluginTest(base.TestCase):
         self.plugin = NovaProtectionPlugin()
         self.glance_client = FakeGlanceClient()
         self.nova_client = FakeNovaClient()
-        self.cinder_client = FakeCinderClient()
         self.neutron_client = FakeNeutronClient()
         self.checkpoint = Checkpoint()
 
@@ -275,9 +279,6 @@ class NovaProtectionPluginTest(base.TestCase):
                                      child_nodes=[])
         backup_name = "fake_backup"
 
-        self.plugin._cinder_client = mock.MagicMock()
-        self.plugin._cinder_client.return_value = self.cinder_client
-
         self.plugin._nova_client = mock.MagicMock()
         self.plugin._nova_client.return_value = self.nova_client
 
@@ -327,9 +328,6 @@ class NovaProtectionPluginTest(base.TestCase):
                                child_nodes=[vol_node])
         backup_name = "fake_backup"
 
-        self.plugin._cinder_client = mock.MagicMock()
-        self.plugin._cinder_client.return_value = self.cinder_client
-
         self.plugin._nova_client = mock.MagicMock()
         self.plugin._nova_client.return_value = self.nova_client
 
@@ -366,6 +364,72 @@ class NovaProtectionPluginTest(base.TestCase):
             resource_definition
         )
 
+    def test_create_backup_resolves_ports_once(self):
+        server = Server(id="vm_id_3",
+                        addresses={'fake_net': [
+                            {'OS-EXT-IPS-MAC:mac_addr': 'mac_address_3',
+                             'OS-EXT-IPS:type': 'fixed',
+                             'addr': '10.0.0.23',
+                             'version': 4},
+                            {'OS-EXT-IPS-MAC:mac_addr': 'mac_address_3',
+                             'OS-EXT-IPS:type': 'floating',
+                             'addr': '172.24.4.3',
+                             'version': 4},
+                            {'OS-EXT-IPS-MAC:mac_addr': 'mac_address_4',
+                             'OS-EXT-IPS:type': 'fixed',
+                             'addr': '10.0.1.24',
+                             'version': 4},
+                            {'OS-EXT-IPS-MAC:mac_addr': 'mac_address_1',
+                             'OS-EXT-IPS:type': 'fixed',
+                             'addr': '10.0.0.21',
+                             'version': 4}
+                        ]},
+                        availability_zone="nova",
+                        flavor={'id': 'flavor_id'},
+                        key_name=None,
+                        security_groups="default")
+        ports = FakePorts["ports"] + [
+            {'id': 'port-3',
+             'mac_address': 'mac_address_3',
+             'device_id': 'vm_id_3',
+             'network_id': 'network_id_3'},
+            {'id': 'port-4',
+             'mac_address': 'mac_address_4',
+             'device_id': 'vm_id_3',
+             'network_id': 'network_id_4'}]
+        resource_node = ResourceNode(
+            value=Resource(id="vm_id_3",
+                           type=constants.SERVER_RESOURCE_TYPE,
+                           name="fake_vm"),
+            child_nodes=[])
+
+        self.plugin._nova_client = mock.MagicMock()
+        self.plugin._nova_client.return_value = self.nova_client
+        self.plugin._glance_client = mock.MagicMock()
+        self.plugin._glance_client.return_value = self.glance_client
+        self.plugin._neutron_client = mock.MagicMock()
+        self.plugin._neutron_client.return_value = self.neutron_client
+        self.nova_client.volumes = mock.MagicMock()
+
+        with mock.patch.dict(FakeServers, {"vm_id_3": server}), \
+                mock.patch.dict(FakePorts, {"ports": ports}):
+            self.plugin.create_backup(self.cntxt, self.checkpoint,
+                                      node=resource_node,
+                                      backup_name="fake_backup")
+
+        server_metadata = fake_bank._plugin._objects[
+            "/resource_data/checkpoint_id/vm_id_3/metadata"][
+            "server_metadata"]
+        self.assertEqual(["network_id_3", "network_id_4", "network_id_1"],
+                         server_metadata["networks"])
+        self.assertEqual(["172.24.4.3"], server_metadata["floating_ips"])
+        # one listing for the ports of the server, one lookup for the port
+        # bound to another device
+        self.assertEqual(2, self.neutron_client.list_ports_calls)
+        # no volume is attached, the attachments are not listed
+        self.assertFalse(
+            self.nova_client.volumes.get_server_volumes.called)
+
     def test_delete_backup(self):
         resource = Resource(id="vm_id_1",
                             type=constants.SERVER_RESOURCE_TYPE,
@@ -10,7 +10,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import eventlet
+
 from karbor.resource import Resource
+from karbor.services.protection.protectable_plugin import InventoryCache
 from karbor.services.protection.protectable_plugin import ProtectablePlugin
 from karbor.services.protection.protectable_registry import ProtectableRegistry
 
@@ -49,6 +52,26 @@ class _FakeProtectablePlugin(ProtectablePlugin):
         return self.graph[parent_resource]
 
 
+class _FakeInventoryProtectablePlugin(_FakeProtectablePlugin):
+    def __init__(self, cntx):
+        super(_FakeInventoryProtectablePlugin, self).__init__(cntx)
+        self.fetches = []
+
+    def instance(self, cntx):
+        new = super(_FakeInventoryProtectablePlugin, self).instance(cntx)
+        new.fetches = self.fetches
+        return new
+
+    def _list_graph(self):
+        self.fetches.append(None)
+        eventlet.sleep(0)
+        return dict(self.graph)
+
+    def get_dependent_resources(self, context, parent_resource):
+        graph = self._get_inventory(context, 'graph', self._list_graph)
+        return graph[parent_resource]
+
+
 class ProtectableRegistryTest(base.TestCase):
     def setUp(self):
         super(ProtectableRegistryTest, self).setUp()
@@ -82,6 +105,37 @@ class ProtectableRegistryTest(base.TestCase):
             self.assert_graph(result_graph, g)
             self.protectable_registry._protectable_map = {}
 
+    def test_graph_building_shares_inventory(self):
+        plugin = _FakeInventoryProtectablePlugin(None)
+        self.protectable_registry.register_plugin(plugin)
+        resources = [Resource(_FAKE_TYPE, str(i), 'name%d' % i)
+                     for i in range(20)]
+        plugin.graph = {resource: resources[i + 1:i + 3]
+                        for i, resource in enumerate(resources)}
+
+        result_graph = self.protectable_registry.build_graph(None,
+                                                             resources[:2])
+        self.assert_graph(result_graph, plugin.graph)
+        self.assertEqual(1, len(plugin.fetches))
+
+        self.protectable_registry.build_graph(None, resources[:2])
+        self.assertEqual(2, len(plugin.fetches))
+
+    def test_inventory_cache_fetches_once(self):
+        cache = InventoryCache()
+        fetches = []
+
+        def fetch():
+            fetches.append(None)
+            eventlet.sleep(0)
+            return len(fetches)
+
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda i: cache.get(None, 'name', fetch),
+                                 range(4)))
+        self.assertEqual([1, 1, 1, 1], results)
+        self.assertEqual(1, len(fetches))
+
     def assert_graph(self, g, g_dict):
         for item in g:
             expected = set(g_dict[item.value])
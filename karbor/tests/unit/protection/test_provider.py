@@ -63,3 +63,30 @@ class ProviderRegistryTest(base.TestCase):
         pr = provider.ProviderRegistry()
         self.assertRaises(exception.ProviderNotFound, pr.show_provider,
                           'garbage')
+
+    def test_plugin_type_map(self):
+        pr = provider.ProviderRegistry()
+        provider1 = pr.show_provider('fake_id1')
+        plugin_name = 'karbor.tests.unit.fake_protection.FakeProtectionPlugin'
+        self.assertIs(provider1.plugins[plugin_name],
+                      provider1._plugin_type_map['Test::Resource'])
+
+    def test_plugin_type_conflict(self):
+        pr = provider.ProviderRegistry()
+        provider1 = pr.show_provider('fake_id1')
+        plugin = mock.Mock()
+        plugin.get_supported_resources_types.return_value = [
+            'Test::Other', 'Test::Resource']
+        self.assertRaises(exception.ProtectionPluginConflict,
+                          provider1._register_plugin, 'conflicting', plugin)
+        self.assertNotIn('conflicting', provider1.plugins)
+        self.assertNotIn('Test::Other', provider1._plugin_type_map)
+
+    def test_plugin_work_scheduler(self):
+        pr = provider.ProviderRegistry()
+        provider1 = pr.show_provider('fake_id1')
+        plugin = mock.Mock()
+        plugin.get_supported_resources_types.return_value = ['Test::Other']
+        provider1._register_plugin('other', plugin)
+        plugin.set_work_scheduler.assert_called_once_with(
+            provider1.work_scheduler, 'other')
@@ -56,6 +56,18 @@ class ResourceGraphWalkerListenerTest(base.TestCase):
                                             resource_map.__getitem__))
         self.assertEqual(len(listener.context.status_getters), 5)
 
+    def test_node_context(self):
+        fake_context = ResourceGraphContext(
+            "fake_cntxt", operation="restore",
+            plugin_map={"fake_plugin": FakeProtectionPlugin([])})
+        node = graph.GraphNode(value=plan_resources[0], child_nodes=())
+        node_context = fake_context.get_node_context(node, True)
+        self.assertIs(node, node_context.node)
+        self.assertTrue(node_context.is_first_visited)
+        self.assertEqual("restore", node_context.operation)
+        self.assertIs(fake_context.task_stack, node_context.task_stack)
+        self.assertIsNone(fake_context.node)
+
     def tearDown(self):
         super(ResourceGraphWalkerListenerTest, self).tearDown()
 
@@ -0,0 +1,131 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from karbor.common import constants
+from karbor.services.protection import status_aggregator
+from karbor.tests import base
+
+
+def _aggregate(statuses):
+    if constants.RESOURCE_STATUS_ERROR in statuses:
+        return "error"
+    elif statuses == {constants.RESOURCE_STATUS_AVAILABLE, }:
+        return "available"
+    return "protecting"
+
+
+class FakeCheckpoint(object):
+    def __init__(self, statuses):
+        self.id = "checkpoint_id"
+        self.statuses = statuses
+        self.reads = 0
+
+    def get_resource_stats(self, checkpoint, resource_id):
+        self.reads += 1
+        return self.statuses.get(resource_id,
+                                 constants.RESOURCE_STATUS_UNDEFINED)
+
+    def status_getters(self, resource_ids):
+        return [{"resource_id": resource_id,
+                 "get_resource_stats": self.get_resource_stats}
+                for resource_id in resource_ids]
+
+
+class CheckpointStatusTrackerTest(base.TestCase):
+    def setUp(self):
+        super(CheckpointStatusTrackerTest, self).setUp()
+        self.tracker = status_aggregator.CheckpointStatusTracker(
+            "checkpoint_id", ["res1", "res2"], _aggregate)
+
+    def test_publish(self):
+        self.assertEqual("protecting", self.tracker.aggregate)
+        self.tracker.publish("res1", constants.RESOURCE_STATUS_AVAILABLE)
+        self.assertEqual("protecting", self.tracker.aggregate)
+        self.tracker.publish("res2", constants.RESOURCE_STATUS_AVAILABLE)
+        self.assertEqual("available", self.tracker.aggregate)
+        self.tracker.publish("unknown", constants.RESOURCE_STATUS_ERROR)
+        self.assertEqual("available", self.tracker.aggregate)
+        self.assertIsNone(self.tracker.get_status("unknown"))
+
+    def test_wait(self):
+        self.assertFalse(self.tracker.wait(0))
+        # transitions which do not change the aggregate do not wake waiters
+        self.tracker.publish("res1", constants.RESOURCE_STATUS_PROTECTING)
+        self.assertFalse(self.tracker.wait(0))
+        self.tracker.publish("res1", constants.RESOURCE_STATUS_ERROR)
+        self.assertTrue(self.tracker.wait(0))
+        self.assertFalse(self.tracker.wait(0))
+
+    def test_reconcile_keeps_published_status(self):
+        checkpoint = FakeCheckpoint(
+            {"res1": constants.RESOURCE_STATUS_PROTECTING,
+             "res2": constants.RESOURCE_STATUS_PROTECTING})
+
+        def get_resource_stats(cntxt, resource_id):
+            status = checkpoint.get_resource_stats(cntxt, resource_id)
+            self.tracker.publish(resource_id,
+                                 constants.RESOURCE_STATUS_AVAILABLE)
+            return status
+
+        self.tracker.reconcile(checkpoint, [
+            {"resource_id": "res1",
+             "get_resource_stats": get_resource_stats},
+            {"resource_id": "res2",
+             "get_resource_stats": checkpoint.get_resource_stats}])
+        self.assertEqual(constants.RESOURCE_STATUS_AVAILABLE,
+                         self.tracker.get_status("res1"))
+        self.assertEqual(constants.RESOURCE_STATUS_PROTECTING,
+                         self.tracker.get_status("res2"))
+
+
+class SyncCheckpointStatusTest(base.TestCase):
+    def test_sync_from_published_transitions(self):
+        checkpoint = FakeCheckpoint({})
+        on_change = mock.Mock(side_effect=lambda status:
+                              status == "available")
+        syncer = eventlet.spawn(
+            status_aggregator.sync_checkpoint_status, checkpoint,
+            checkpoint.status_getters(["res1", "res2"]), _aggregate,
+            on_change)
+        eventlet.sleep(0)
+        for resource_id in ("res1", "res2"):
+            status_aggregator.publish(checkpoint.id, resource_id,
+                                      constants.RESOURCE_STATUS_PROTECTING)
+            status_aggregator.publish(checkpoint.id, resource_id,
+                                      constants.RESOURCE_STATUS_AVAILABLE)
+        syncer.wait()
+        self.assertEqual([mock.call("protecting"), mock.call("available")],
+                         on_change.mock_calls)
+        # the bank was only read once per resource
+        self.assertEqual(2, checkpoint.reads)
+        # the tracker is dropped once the status is final
+        status_aggregator.publish(checkpoint.id, "res1",
+                                  constants.RESOURCE_STATUS_ERROR)
+        self.assertEqual(2, on_change.call_count)
+
+    @mock.patch.object(status_aggregator, 'CONF')
+    def test_reconcile_without_published_transitions(self, mock_conf):
+        mock_conf.checkpoint_status_reconcile_interval = 0.01
+        checkpoint = FakeCheckpoint({})
+        on_change = mock.Mock(side_effect=lambda status:
+                              status == "available")
+        syncer = eventlet.spawn(
+            status_aggregator.sync_checkpoint_status, checkpoint,
+            checkpoint.status_getters(["res1"]), _aggregate, on_change)
+        eventlet.sleep(0)
+        checkpoint.statuses["res1"] = constants.RESOURCE_STATUS_AVAILABLE
+        syncer.wait()
+        self.assertEqual([mock.call("protecting"), mock.call("available")],
+                         on_change.mock_calls)
@@ -10,6 +10,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from karbor import exception
+from karbor.services.protection import bank_codec
+from karbor.services.protection import bank_plugin
+from karbor.services.protection.bank_plugins import swift_bank_plugin
 from karbor.services.protection.clients import swift
 from karbor.tests import base
 from karbor.tests.unit.protection.fake_swift_client import FakeSwiftClient
@@ -108,3 +112,90 @@ class SwiftBankPluginTest(base.TestCase):
         self.swift_bank_plugin.create_object("dict_object", {"key": "value"})
         value = self.swift_bank_plugin.get_object("dict_object")
         self.assertEqual(value, {"key": "value"})
+
+    def test_create_get_object_stream(self):
+        self.swift_bank_plugin.create_object_stream(
+            "stream", iter([b"value-1", b"value-2"]))
+        chunks = self.swift_bank_plugin.get_object_stream("stream",
+                                                           chunk_size=7)
+        self.assertEqual(list(chunks), [b"value-1", b"value-2"])
+
+    def test_create_get_object_stream_with_codec(self):
+        bank = bank_plugin.Bank(self.swift_bank_plugin,
+                                codec=bank_codec.CODEC_ZLIB)
+        value = b"value" * 1000
+        bank.create_object_stream("stream", iter([value]))
+        object_file = os.path.join(self.fake_connection.swiftdir,
+                                   "karbor") + "//stream"
+        self.assertTrue(os.path.getsize(object_file) < len(value))
+        self.assertEqual(
+            {"codec": bank_codec.CODEC_ZLIB},
+            self.swift_bank_plugin.get_object_with_metadata("/stream")[1])
+        self.assertEqual(value, bank.get_object("stream"))
+        self.assertEqual(value, b"".join(bank.get_object_stream("stream")))
+
+    def test_connection_pool_evicts_broken_connections(self):
+        pool = swift_bank_plugin.SwiftConnectionPool(mock.MagicMock, 2)
+        connection = pool.get()
+        pool.release(connection, healthy=False)
+        connection.close.assert_called_once_with()
+        self.assertIsNot(connection, pool.get())
+
+    def test_connection_pool_reuses_token(self):
+        first = mock.MagicMock(url="http://swift", token="token")
+        second = mock.MagicMock(token=None)
+        pool = swift_bank_plugin.SwiftConnectionPool(
+            mock.MagicMock(side_effect=[first, second]), 2)
+        connection = pool.get()
+        connection.head_object()
+        other = pool.get()
+        pool.release(connection)
+        pool.release(other)
+        self.assertIs(second, other)
+        self.assertIsNone(other.token)
+        self.assertEqual("token", pool.get().token)
+
+    def test_get_object_stream_releases_connection(self):
+        self.swift_bank_plugin.create_object_stream("stream",
+                                                    iter([b"value"]))
+        pool = self.swift_bank_plugin._connection_pool
+        free = pool.free()
+        # the connection is only checked out once the stream is iterated
+        self.swift_bank_plugin.get_object_stream("stream")
+        self.assertEqual(free, pool.free())
+        chunks = self.swift_bank_plugin.get_object_stream("stream")
+        self.assertEqual(b"value", next(chunks))
+        self.assertEqual(free - 1, pool.free())
+        self.assertEqual(b"", b"".join(chunks))
+        self.assertEqual(free, pool.free())
+
+    def test_get_object_stream_not_found(self):
+        chunks = self.swift_bank_plugin.get_object_stream("missing")
+        self.assertRaises(exception.BankGetObjectFailed, list, chunks)
+
+    def test_delete_objects_without_bulk_delete(self):
+        for key in ("key-1", "key-2", "key-3"):
+            self.swift_bank_plugin.create_object(key, "value")
+        self.swift_bank_plugin.delete_objects(["key-1", "key-2"])
+        self.assertEqual(["key-3"],
+                         self.swift_bank_plugin.list_objects(prefix=None))
+
+    def test_delete_objects_with_bulk_delete(self):
+        connection = mock.MagicMock()
+        connection.get_capabilities.return_value = {
+            "bulk_delete": {"max_deletes_per_request": 2}}
+        connection.post_account.return_value = (
+            {}, '{"Response Status": "200 OK", "Errors": []}')
+        self.swift_bank_plugin._connection_pool = \
+            swift_bank_plugin.SwiftConnectionPool(lambda: connection, 1)
+        self.swift_bank_plugin.delete_objects(["/a", "/b", "/c d"])
+        self.assertEqual(2, connection.post_account.call_count)
+        data = [call[1]["data"]
+                for call in connection.post_account.call_args_list]
+        self.assertEqual(["/karbor//a\n/karbor//b", "/karbor//c%20d"], data)
+
+        connection.post_account.return_value = (
+            {}, '{"Response Status": "400 Bad Request", '
+                '"Errors": [["/karbor//a", "409 Conflict"]]}')
+        self.assertRaises(exception.BankDeleteObjectFailed,
+                          self.swift_bank_plugin.delete_objects, ["/a"])
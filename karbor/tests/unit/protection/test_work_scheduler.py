@@ -0,0 +1,80 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import event
+
+from karbor.services.protection import work_scheduler
+from karbor.tests import base
+
+
+class WorkSchedulerTest(base.TestCase):
+    def setUp(self):
+        super(WorkSchedulerTest, self).setUp()
+        self.scheduler = work_scheduler.WorkScheduler(concurrency=3,
+                                                      owner_concurrency=2)
+        self.started = []
+        self.release = event.Event()
+
+    def _work(self, name):
+        self.started.append(name)
+        self.release.wait()
+        return name
+
+    def test_concurrency_limits(self):
+        items = [self.scheduler.submit(owner, self._work, (owner + str(i), ))
+                 for owner in ("a", "b") for i in range(3)]
+        stats = self.scheduler.get_stats()
+        self.assertEqual(3, stats["running"])
+        self.assertEqual(3, stats["queued"])
+        self.assertEqual(2, stats["owners"]["a"]["running"])
+        self.assertEqual(1, stats["owners"]["b"]["running"])
+
+        self.release.send()
+        self.assertEqual(["a0", "a1", "a2", "b0", "b1", "b2"],
+                         [item.wait() for item in items])
+        stats = self.scheduler.get_stats("b")
+        self.assertEqual({"queued": 0, "running": 0, "completed": 3,
+                          "failed": 0, "bytes_in_flight": 0}, stats)
+
+    def test_priority(self):
+        blocker = self.scheduler.submit("a", self._work, ("blocker", ))
+        self.scheduler.submit("a", self._work, ("blocker", ))
+        low = self.scheduler.submit("a", self._work, ("low", ),
+                                    priority=work_scheduler.PRIORITY_LOW)
+        high = self.scheduler.submit("a", self._work, ("high", ),
+                                     priority=work_scheduler.PRIORITY_HIGH)
+        self.release.send()
+        blocker.wait()
+        low.wait()
+        high.wait()
+        self.assertEqual(["blocker", "blocker", "high", "low"], self.started)
+
+    def test_bytes_in_flight(self):
+        self.scheduler.submit("a", self._work, ("big", ), size=1000)
+        self.scheduler.submit("b", self._work, ("small", ), size=10)
+        self.scheduler.submit("b", self._work, ("queued", ), size=1)
+        queued = self.scheduler.submit("b", self._work, ("queued", ),
+                                       size=1)
+        self.assertEqual(1011, self.scheduler.get_stats()["bytes_in_flight"])
+        self.release.send()
+        queued.wait()
+        self.assertEqual(0, self.scheduler.get_stats()["bytes_in_flight"])
+
+    def test_failure(self):
+        def fail():
+            raise ValueError("failed")
+
+        item = self.scheduler.submit("a", fail)
+        self.assertRaises(ValueError, item.wait)
+        stats = self.scheduler.get_stats()
+        self.assertEqual(1, stats["failed"])
+        self.assertEqual(0, stats["running"])
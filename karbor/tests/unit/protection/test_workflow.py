@@ -10,6 +10,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
 from karbor.services.protection.flows import workflow
 from karbor.tests import base
 
@@ -40,3 +42,23 @@ class WorkFlowTest(base.TestCase):
         self.workflow_engine.add_tasks(flow, task1, task2)
         result = self.workflow_engine.search_task(flow, 'fake_func2')
         self.assertEqual('fake_func2', getattr(result, 'name'))
+
+    def test_search_task_indexed(self):
+        flow = self.workflow_engine.build_flow('test')
+        tasks = [self.workflow_engine.create_task(fake_func, name='task%d' % i)
+                 for i in range(10)]
+        self.workflow_engine.add_tasks(flow, *tasks)
+        with mock.patch.object(flow, 'iter_nodes') as mock_iter_nodes:
+            self.assertIs(tasks[7],
+                          self.workflow_engine.search_task(flow, 'task7'))
+            self.assertIsNone(self.workflow_engine.search_task(flow, 'none'))
+            self.assertFalse(mock_iter_nodes.called)
+
+    def test_search_task_added_to_flow_directly(self):
+        flow = self.workflow_engine.build_flow('test')
+        task1 = self.workflow_engine.create_task(fake_func, name='fake_func')
+        task2 = self.workflow_engine.create_task(fake_func, name='fake_func2')
+        self.workflow_engine.add_tasks(flow, task1)
+        flow.add(task2)
+        result = self.workflow_engine.search_task(flow, 'fake_func2')
+        self.assertIs(task2, result)
@@ -0,0 +1,76 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the content defined chunker of the deduplicating chunk store.
+
+Usage: python tools/chunker_benchmark.py [MEGABYTES ...]
+
+Random data is split with the default chunk sizes, fed in blocks of the
+size glance streams images with. The throughput of hashing the chunks with
+sha256, which every deduplicated backup does as well, is printed for
+comparison.
+"""
+
+from __future__ import print_function
+
+import hashlib
+import os
+import sys
+import time
+
+from karbor.services.protection import chunk_store
+
+_BLOCK_SIZE = 65536
+_MIN_SIZE = 262144
+_AVG_SIZE = 1048576
+_MAX_SIZE = 4194304
+
+
+def _blocks(data):
+    for offset in range(0, len(data), _BLOCK_SIZE):
+        yield data[offset:offset + _BLOCK_SIZE]
+
+
+def _timed(name, size, func, *args):
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    print("  %-12s %8.3fs %8.1f MB/s" % (name, elapsed,
+                                          size / elapsed / 1048576))
+    return result
+
+
+def _split(data):
+    chunker = chunk_store.ContentDefinedChunker(_MIN_SIZE, _AVG_SIZE,
+                                                _MAX_SIZE)
+    return list(chunker.split(_blocks(data)))
+
+
+def _hash(chunks):
+    return [hashlib.sha256(chunk).hexdigest() for chunk in chunks]
+
+
+def run(megabytes):
+    print("%d MB of random data" % megabytes)
+    data = os.urandom(megabytes * 1048576)
+    chunks = _timed("split", len(data), _split, data)
+    _timed("sha256", len(data), _hash, chunks)
+    print("  %-12s %8d" % ("chunks", len(chunks)))
+
+
+def main(argv):
+    for megabytes in [int(arg) for arg in argv] or [32, 256]:
+        run(megabytes)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
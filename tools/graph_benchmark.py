@@ -0,0 +1,114 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the resource graph algorithms on synthetic graphs.
+
+Usage: python tools/graph_benchmark.py [NODES ...]
+
+Three kinds of graphs are generated for every size:
+  tree   a binary tree, every node has a single parent
+  chain  a single path, far deeper than the recursion limit
+  dag    layers of 100 nodes, every node shared by two parents
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from karbor.resource import Resource
+from karbor.services.protection import graph
+
+_TYPE = "Karbor::Benchmark::Node"
+_DAG_WIDTH = 100
+
+
+class _CountingListener(graph.GraphWalkerListener):
+    def __init__(self):
+        self.entered = 0
+
+    def on_node_enter(self, node, already_visited):
+        self.entered += 1
+
+    def on_node_exit(self, node):
+        pass
+
+
+def _resources(count):
+    return [Resource(type=_TYPE, id=str(i), name="node-%d" % i)
+            for i in range(count)]
+
+
+def tree_graph(count):
+    nodes = _resources(count)
+    return [nodes[0]], {node: nodes[2 * i + 1:2 * i + 3]
+                        for i, node in enumerate(nodes)}
+
+
+def chain_graph(count):
+    nodes = _resources(count)
+    return [nodes[0]], {node: nodes[i + 1:i + 2]
+                        for i, node in enumerate(nodes)}
+
+
+def dag_graph(count):
+    nodes = _resources(count)
+    children = {}
+    for i, node in enumerate(nodes):
+        layer_start = (i // _DAG_WIDTH + 1) * _DAG_WIDTH
+        offset = i % _DAG_WIDTH
+        children[node] = [
+            nodes[layer_start + (offset + j) % _DAG_WIDTH]
+            for j in (0, 1) if layer_start + _DAG_WIDTH <= count]
+    return nodes[:_DAG_WIDTH], children
+
+
+def _timed(name, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print("  %-12s %8.3fs" % (name, time.time() - start))
+    return result
+
+
+def run(kind, make_graph, count, full_walk):
+    print("%s, %d nodes" % (kind, count))
+    start_nodes, children = make_graph(count)
+    resource_graph = _timed("build", graph.build_graph, start_nodes,
+                            children.__getitem__)
+
+    walker = graph.GraphWalker()
+    listener = _CountingListener()
+    walker.register_listener(listener)
+    _timed("walk once", walker.walk_graph, resource_graph, visit_once=True)
+    encoded = _timed("encode", graph.encode_resource_graph, resource_graph)
+    _timed("decode", graph.decode_resource_graph, iter((encoded, )))
+    print("  %-12s %8d bytes" % ("compact", len(encoded)))
+    if full_walk:
+        _timed("walk", walker.walk_graph, resource_graph)
+        serialized = _timed("serialize", graph.serialize_resource_graph,
+                            resource_graph)
+        _timed("deserialize", graph.deserialize_resource_graph, serialized)
+        print("  %-12s %8d bytes" % ("json", len(serialized)))
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [10000, 100000]
+    for count in sizes:
+        run("tree", tree_graph, count, full_walk=True)
+        run("chain", chain_graph, count, full_walk=True)
+        # walking every path of the dag is exponential in its depth, only
+        # the walk visiting each shared subtree once is measured
+        run("dag", dag_graph, count, full_walk=False)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
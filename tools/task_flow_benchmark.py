@@ -0,0 +1,131 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the construction of task flows for large plans.
+
+Usage: python tools/task_flow_benchmark.py [SERVERS ...]
+
+Every server of the generated plan has its own volume and is attached to
+the same five shared volumes, so the walk reaches the shared volumes again
+from every server. The flow is built once with the indexed task lookup of
+the workflow engine and once with a lookup scanning the whole flow.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from karbor.common import constants
+from karbor.resource import Resource
+from karbor.services.protection.flows import workflow
+from karbor.services.protection import graph
+from karbor.services.protection.protection_plugins import \
+    base_protection_plugin
+from karbor.services.protection import resource_graph
+
+_SERVER_TYPE = constants.SERVER_RESOURCE_TYPE
+_VOLUME_TYPE = constants.VOLUME_RESOURCE_TYPE
+_SHARED_VOLUMES = 5
+
+
+class _BenchmarkPlugin(base_protection_plugin.BaseProtectionPlugin):
+    def create_backup(self, cntxt, checkpoint, **kwargs):
+        pass
+
+    def restore_backup(self, cntxt, checkpoint, **kwargs):
+        pass
+
+    def delete_backup(self, cntxt, checkpoint, **kwargs):
+        pass
+
+    def get_supported_resources_types(self):
+        return [_SERVER_TYPE, _VOLUME_TYPE]
+
+    def get_options_schema(self, resources_type):
+        return {}
+
+    def get_saved_info_schema(self, resources_type):
+        return {}
+
+    def get_restore_schema(self, resources_type):
+        return {}
+
+    def get_saved_info(self, metadata_store, resource):
+        return None
+
+
+class _ScanningEngine(workflow.TaskFlowEngine):
+    """The lookup used before the engine indexed its flows."""
+    def search_task(self, flow, task_id):
+        for node, meta in flow.iter_nodes():
+            if getattr(node, 'name', None) == task_id:
+                return node
+
+
+def plan_graph(servers):
+    shared = [Resource(type=_VOLUME_TYPE, id="shared-%d" % i,
+                       name="shared-%d" % i)
+              for i in range(_SHARED_VOLUMES)]
+    start_nodes = []
+    children = {volume: [] for volume in shared}
+    for i in range(servers):
+        server = Resource(type=_SERVER_TYPE, id="server-%d" % i,
+                          name="server-%d" % i)
+        volume = Resource(type=_VOLUME_TYPE, id="volume-%d" % i,
+                          name="volume-%d" % i)
+        start_nodes.append(server)
+        children[server] = [volume] + shared
+        children[volume] = []
+    return graph.build_graph(start_nodes, children.__getitem__)
+
+
+def build_task_flow(workflow_engine, resource_graph_nodes):
+    plugin = _BenchmarkPlugin()
+    context = resource_graph.ResourceGraphContext(
+        cntxt=None,
+        operation=constants.OPERATION_RESTORE,
+        parameters={},
+        plugin_map={"benchmark": plugin},
+        workflow_engine=workflow_engine,
+        task_flow=workflow_engine.build_flow("benchmark"))
+    walker = graph.GraphWalker()
+    walker.register_listener(
+        resource_graph.ResourceGraphWalkerListener(context))
+    walker.walk_graph(resource_graph_nodes, visit_once=True)
+    return context.task_flow
+
+
+def _timed(name, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print("  %-12s %8.3fs" % (name, time.time() - start))
+    return result
+
+
+def run(servers):
+    print("%d servers, %d shared volumes" % (servers, _SHARED_VOLUMES))
+    resource_graph_nodes = plan_graph(servers)
+    flow = _timed("indexed", build_task_flow, workflow.TaskFlowEngine(),
+                  resource_graph_nodes)
+    _timed("scan", build_task_flow, _ScanningEngine(), resource_graph_nodes)
+    print("  %-12s %8d" % ("tasks", len(flow)))
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [1000, 5000]
+    for servers in sizes:
+        run(servers)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])